@@ -0,0 +1,131 @@
+import math
+import time
+import heapq
+import itertools
+import threading
+from contextlib import contextmanager
+from render_plan import RenderPlan
+from metrics import admissionActive, admissionQueued, admissionMemoryBytes, admissionRejectedTotal, admissionWaitSeconds
+
+#   Admission control in front of PCSForm.generate. Every render is priced
+#   from its plan (see render_plan) before it starts and admitted against a
+#   concurrency limit and a memory budget. Waiting renders are served by
+#   arrival time plus their estimated seconds times priorityWeight, small
+#   documents overtake large ones but a large one is not held back forever.
+#   Requests that cannot start within maxWait, or find the queue full, are
+#   turned away with a retry estimate instead of slowing everyone down
+
+#   peak bytes per engine: (fixed, per page, per item), traced with 40 page
+#   documents of 4, 8 and 17 items per page, the xml engine writes finished
+#   pages out so its pages cost little. Seconds come from the render plan
+renderBytesModel = {
+    'openpyxl': (2 * 1024 * 1024, 390 * 1024, 15 * 1024),
+    'xml': (4 * 1024 * 1024, 2 * 1024, 0)
+}
+
+priorityWeight = 10
+
+class RenderCost:
+    def __init__(self, renderPlan: RenderPlan):
+        self.plan = renderPlan
+        self.seconds = renderPlan.seconds
+        bytesModel = renderBytesModel[renderPlan.engine]
+        self.bytes = int(bytesModel[0] + bytesModel[1] * renderPlan.pageCount + bytesModel[2] * renderPlan.itemCount)
+
+class AdmissionRejectedError(Exception):
+    def __init__(self, reason: str, retryAfter: int):
+        super().__init__('Render not admitted, {}'.format(reason))
+        self.reason = reason
+        self.retryAfter = retryAfter
+
+class AdmissionController:
+    def __init__(self, maxConcurrent: int, memoryBudget: int, maxQueued: int, maxWait: float):
+        #   maxConcurrent 0 admits everything
+        self.maxConcurrent = maxConcurrent
+        self.memoryBudget = memoryBudget
+        self.maxQueued = maxQueued
+        self.maxWait = maxWait
+        self._condition = threading.Condition()
+        self._sequence = itertools.count()
+        self._waitHeap = list()
+        #   ticket -> (start time, cost) of admitted renders
+        self._activeDict = dict()
+        self._memoryInUse = 0
+
+    def _canAdmit(self, cost: RenderCost):
+        if len(self._activeDict) >= self.maxConcurrent:
+            return False
+        #   a document over the whole budget runs alone
+        return len(self._activeDict) == 0 or self._memoryInUse + cost.bytes <= self.memoryBudget
+
+    def _getRetryAfter(self):
+        #   seconds until the work ahead is done, roughly
+        now = time.monotonic()
+        pendingSeconds = sum(max(cost.seconds - (now - start), 0) for start, cost in self._activeDict.values())
+        pendingSeconds += sum(ticket[2].seconds for ticket in self._waitHeap)
+        return max(int(math.ceil(pendingSeconds / max(self.maxConcurrent, 1))), 1)
+
+    def _reject(self, reason: str):
+        admissionRejectedTotal.inc(reason=reason)
+        return AdmissionRejectedError(reason, self._getRetryAfter())
+
+    def _start(self, ticket: tuple):
+        self._activeDict[ticket] = (time.monotonic(), ticket[2])
+        self._memoryInUse += ticket[2].bytes
+        admissionActive.set(len(self._activeDict))
+        admissionMemoryBytes.set(self._memoryInUse)
+
+    def _acquire(self, cost: RenderCost, isWaiting: bool):
+        #   isWaiting waits as long as it takes, for renders that already
+        #   sit in a bounded queue of their own (jobs, batch documents)
+        start = time.monotonic()
+        ticket = (start + cost.seconds * priorityWeight, next(self._sequence), cost)
+        with self._condition:
+            if len(self._waitHeap) == 0 and self._canAdmit(cost):
+                self._start(ticket)
+                admissionWaitSeconds.observe(0)
+                return ticket
+            if not isWaiting and len(self._waitHeap) >= self.maxQueued:
+                raise self._reject('queue_full')
+
+            heapq.heappush(self._waitHeap, ticket)
+            admissionQueued.set(len(self._waitHeap))
+            try:
+                while self._waitHeap[0] is not ticket or not self._canAdmit(cost):
+                    remaining = None if isWaiting else start + self.maxWait - time.monotonic()
+                    if remaining is not None and remaining <= 0:
+                        raise self._reject('timeout')
+                    self._condition.wait(remaining)
+            except BaseException:
+                self._waitHeap.remove(ticket)
+                heapq.heapify(self._waitHeap)
+                admissionQueued.set(len(self._waitHeap))
+                #   the next waiter may be able to go now
+                self._condition.notify_all()
+                raise
+            heapq.heappop(self._waitHeap)
+            admissionQueued.set(len(self._waitHeap))
+            self._start(ticket)
+            self._condition.notify_all()
+        admissionWaitSeconds.observe(time.monotonic() - start)
+        return ticket
+
+    def _release(self, ticket: tuple):
+        with self._condition:
+            del self._activeDict[ticket]
+            self._memoryInUse -= ticket[2].bytes
+            admissionActive.set(len(self._activeDict))
+            admissionMemoryBytes.set(self._memoryInUse)
+            self._condition.notify_all()
+
+    @contextmanager
+    def admit(self, cost: RenderCost, isWaiting: bool = False):
+        #   raises AdmissionRejectedError when the render cannot start
+        if self.maxConcurrent <= 0:
+            yield
+            return
+        ticket = self._acquire(cost, isWaiting)
+        try:
+            yield
+        finally:
+            self._release(ticket)
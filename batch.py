@@ -0,0 +1,64 @@
+import io
+import json
+import zipfile
+from concurrent.futures import as_completed
+
+class _ZipStreamSink(io.RawIOBase):
+    #   write-only sink for zipfile, the archive is written without seeking
+    #   (data descriptors) and the bytes are drained after every entry
+    def __init__(self):
+        self._chunkList = list()
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunkList.append(bytes(data))
+        return len(data)
+
+    def drain(self):
+        data = b''.join(self._chunkList)
+        self._chunkList = list()
+        return data
+
+def getBatchFileName(index: int):
+    return 'e-pcs-{:03d}.xlsx'.format(index + 1)
+
+def iterBatchZip(dataList: list, submitFunc):
+    #   submitFunc(dataDict) returns a future resolving to the xlsx bytes,
+    #   documents are added to the zip in completion order and a failing
+    #   document only shows up as an error in manifest.json
+    futureDict = {submitFunc(dataDict): i for i, dataDict in enumerate(dataList)}
+    manifestList = [None] * len(dataList)
+    sink = _ZipStreamSink()
+    try:
+        with zipfile.ZipFile(sink, 'w', zipfile.ZIP_DEFLATED) as archive:
+            for future in as_completed(futureDict):
+                index = futureDict[future]
+                try:
+                    content = future.result()
+                except Exception as e:
+                    manifestList[index] = {
+                        'index': index,
+                        'file': None,
+                        'status': 'failed',
+                        'error': '{}: {}'.format(type(e).__name__, e)
+                    }
+                    continue
+
+                fileName = getBatchFileName(index)
+                #   xlsx is already deflated, store it as is
+                archive.writestr(fileName, content, compress_type=zipfile.ZIP_STORED)
+                manifestList[index] = {
+                    'index': index,
+                    'file': fileName,
+                    'status': 'done',
+                    'error': None
+                }
+                yield sink.drain()
+
+            archive.writestr('manifest.json', json.dumps(manifestList, indent=2))
+        yield sink.drain()
+    finally:
+        for future in futureDict:
+            future.cancel()
@@ -0,0 +1,134 @@
+import os
+import json
+import time
+import random
+import argparse
+import platform
+import statistics
+from benchmarks.run import templatePath, resultDir, getCommit, isRenderable
+
+#   Fits render_plan.renderSecondsModel, the render time of a document from
+#   its plan (pages, items, image and connector anchors). Documents of mixed
+#   sizes, sc symbol densities and connector modes are rendered in this
+#   process after a warm-up, the fit is least squares on the median wall
+#   time. Usage, from the repository root:
+#
+#       python -m benchmarks.costfit --cases 24 --engine openpyxl,xml
+#
+#   The fitted tuples are printed ready to paste into render_plan
+
+featureNameList = ['fixed', 'page', 'item', 'image_anchor', 'connector_anchor']
+
+def getFeatureList(renderPlan):
+    return [1, renderPlan.pageCount, renderPlan.itemCount, renderPlan.imageCount, renderPlan.connectorCount]
+
+def solveLeastSquares(featureRowList: list, valueList: list):
+    #   normal equations, Gauss-Jordan with partial pivoting, features that
+    #   never vary (connectors of an image-only run) get 0
+    size = len(featureRowList[0])
+    matrix = [
+        [sum(row[i] * row[j] for row in featureRowList) for j in range(size)] + [sum(row[i] * value for row, value in zip(featureRowList, valueList))]
+        for i in range(size)
+    ]
+    for col in range(size):
+        pivot = max(range(col, size), key=lambda row: abs(matrix[row][col]))
+        if abs(matrix[pivot][col]) < 1e-12:
+            continue
+        matrix[col], matrix[pivot] = matrix[pivot], matrix[col]
+        for row in range(size):
+            if row != col and matrix[row][col] != 0:
+                factor = matrix[row][col] / matrix[col][col]
+                matrix[row] = [a - factor * b for a, b in zip(matrix[row], matrix[col])]
+    return [matrix[i][size] / matrix[i][i] if abs(matrix[i][i]) >= 1e-12 else 0.0 for i in range(size)]
+
+def _getCaseList(caseCount: int, seed: int):
+    #   processes, items per process, sc symbols per item, connector mode
+    rand = random.Random(seed)
+    return [
+        (rand.randint(1, 30), rand.randint(1, 40), round(rand.uniform(0, 2), 2), rand.choice(['image', 'vector']))
+        for _ in range(caseCount)
+    ]
+
+def main():
+    parser = argparse.ArgumentParser(description='Fit the render time model of render_plan')
+    parser.add_argument('--engine', default='openpyxl,xml', help='comma separated render engines')
+    parser.add_argument('--cases', type=int, default=24)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default=None, help='result file, defaults to benchmarks/results/costfit-<commit>.json')
+    args = parser.parse_args()
+
+    from template_cache import getTemplateCache
+    from image_registry import imageRegistry
+    from e_pcs_form import PCSForm
+    from render_plan import planRender
+    from benchmarks.payload import generatePayload
+
+    getTemplateCache(templatePath).preload()
+    imageRegistry.preload()
+
+    caseList = _getCaseList(args.cases, args.seed)
+    payloadList = [
+        generatePayload(processCount, itemCount, scSymbolDensity=scSymbolDensity, seed=args.seed + i, isRenderable=isRenderable)
+        for i, (processCount, itemCount, scSymbolDensity, _) in enumerate(caseList)
+    ]
+
+    commit = getCommit()
+    modelDict = dict()
+    resultList = list()
+    for engine in args.engine.split(','):
+        #   warm-up, caches of dashed lines and styles fill on the first render
+        PCSForm(templatePath, payloadList[0], engine=engine).generate().close()
+
+        featureRowList = list()
+        valueList = list()
+        for (processCount, itemCount, scSymbolDensity, connectorMode), dataDict in zip(caseList, payloadList):
+            wallList = list()
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                PCSForm(templatePath, dataDict, engine=engine, connectorMode=connectorMode).generate().close()
+                wallList.append(time.perf_counter() - start)
+            renderPlan = planRender(dataDict, engine, connectorMode)
+            featureRowList.append(getFeatureList(renderPlan))
+            valueList.append(statistics.median(wallList))
+            resultList.append({
+                'engine': engine,
+                'connector_mode': connectorMode,
+                'processes': processCount,
+                'items_per_process': itemCount,
+                'sc_density': scSymbolDensity,
+                'features': dict(zip(featureNameList, featureRowList[-1])),
+                'wall_seconds': valueList[-1]
+            })
+
+        coefficientList = solveLeastSquares(featureRowList, valueList)
+        modelDict[engine] = coefficientList
+        print('{:9} fit over {} documents'.format(engine, len(valueList)))
+        for featureRow, value in zip(featureRowList, valueList):
+            predicted = sum(a * b for a, b in zip(coefficientList, featureRow))
+            print('    {:4d} pages {:8.3f}s predicted {:8.3f}s {:+6.1f}%'.format(
+                featureRow[1], value, predicted, (predicted - value) / value * 100
+            ))
+
+    print('renderSecondsModel = {')
+    print(',\n'.join("    '{}': ({})".format(engine, ', '.join('{:.3g}'.format(value) for value in coefficientList)) for engine, coefficientList in modelDict.items()))
+    print('}')
+
+    outputPath = args.output or os.path.join(resultDir, 'costfit-{}.json'.format(commit))
+    if os.path.dirname(outputPath) != '':
+        os.makedirs(os.path.dirname(outputPath), exist_ok=True)
+    with open(outputPath, 'w') as f:
+        json.dump({
+            'commit': commit,
+            'created_at': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'features': featureNameList,
+            'model': modelDict,
+            'results': resultList
+        }, f, indent=2)
+    print('written to {}'.format(outputPath))
+
+if __name__ == '__main__':
+    main()
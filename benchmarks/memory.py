@@ -0,0 +1,147 @@
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import tracemalloc
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from benchmarks.run import templatePath, resultDir, getPeakRss, getCommit, isRenderable
+
+#   Peak memory against document size. Every case renders in a fresh
+#   process into a file under output/, so the numbers cover the render and
+#   not the response buffer (which spills to disk past utils.spoolMaxSize).
+#   Usage, from the repository root:
+#
+#       python -m benchmarks.memory --pages 25,100,400 --engine openpyxl,xml
+#
+#   Engines listed in --check fail the run (exit code 1) when their traced
+#   peak grows by more than --max-page-bytes per extra page between the two
+#   largest documents. Bounded caches (dashed lines, sheet styles) are still
+#   filling up in small documents, the smallest size is left out for that
+
+baseProcessCount = 10
+itemsPerProcess = 17
+
+def _getPayload(pageCount: int):
+    #   one page per process, a few generated processes are repeated so a
+    #   large document does not need a renderability check per process
+    from benchmarks.payload import generatePayload
+
+    dataDict = generatePayload(baseProcessCount, itemsPerProcess, isRenderable=isRenderable)
+    baseProcessList = dataDict['processes']
+    dataDict['processes'] = [
+        dict(baseProcessList[i % len(baseProcessList)], name='{:03d} / Process-{}'.format(i + 1, i + 1))
+        for i in range(pageCount)
+    ]
+    return dataDict
+
+def _runCase(pageCount: int, engine: str):
+    from template_cache import getTemplateCache
+    from image_registry import imageRegistry
+    from e_pcs_form import PCSForm, getTotalPage
+    from utils import getOutputFilePath
+
+    getTemplateCache(templatePath).preload()
+    imageRegistry.preload()
+    dataDict = _getPayload(pageCount)
+    fileName = 'benchmark-memory-{}'.format(os.getpid())
+    #   warm up caches shared by every render (item block, images, ...)
+    warmDict = dict(dataDict, processes=dataDict['processes'][:1])
+    PCSForm(templatePath, warmDict, engine=engine).generate(fileName)
+    baselineRss = getPeakRss()
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    try:
+        PCSForm(templatePath, dataDict, engine=engine).generate(fileName)
+        seconds = time.perf_counter() - start
+        _, tracedPeak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+        outputPath = getOutputFilePath(fileName)
+        outputSize = os.path.getsize(outputPath) if os.path.exists(outputPath) else None
+        if os.path.exists(outputPath):
+            os.remove(outputPath)
+
+    return {
+        'engine': engine,
+        'pages': getTotalPage(dataDict['processes']),
+        'seconds': seconds,
+        'traced_peak_bytes': tracedPeak,
+        'baseline_rss_bytes': baselineRss,
+        'peak_rss_bytes': getPeakRss(),
+        'output_bytes': outputSize
+    }
+
+def _getPageBytes(resultList: list):
+    resultList = sorted((result for result in resultList if 'error' not in result), key=lambda result: result['pages'])
+    if len(resultList) < 2 or resultList[-1]['pages'] == resultList[-2]['pages']:
+        return None
+    return (resultList[-1]['traced_peak_bytes'] - resultList[-2]['traced_peak_bytes']) / (resultList[-1]['pages'] - resultList[-2]['pages'])
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark PCSForm peak memory against page count')
+    parser.add_argument('--pages', default='25,100,400', help='comma separated page counts')
+    parser.add_argument('--engine', default='openpyxl,xml', help='comma separated render engines')
+    parser.add_argument('--check', default='xml', help='comma separated engines whose growth is checked, empty to skip')
+    parser.add_argument('--max-page-bytes', type=int, default=4 * 1024, help='allowed traced peak growth per extra page')
+    parser.add_argument('--output', default=None, help='result file, defaults to benchmarks/results/memory-<commit>.json')
+    args = parser.parse_args()
+
+    commit = getCommit()
+    pageCountList = [int(pageCount) for pageCount in args.pages.split(',')]
+    engineList = args.engine.split(',')
+    checkList = [engine for engine in args.check.split(',') if engine != '']
+
+    resultList = list()
+    for engine in engineList:
+        for pageCount in pageCountList:
+            executor = ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn'))
+            try:
+                result = executor.submit(_runCase, pageCount, engine).result()
+            except Exception as e:
+                result = {'engine': engine, 'pages': pageCount, 'error': '{}: {}'.format(type(e).__name__, e)}
+            finally:
+                executor.shutdown(wait=True)
+            resultList.append(result)
+            if 'error' in result:
+                print('{:9} {:5d} pages error {}'.format(engine, pageCount, result['error']))
+            else:
+                print('{:9} {:5d} pages {:8.3f}s traced peak {:7.1f}MB peak rss {:7.1f}MB'.format(
+                    engine, result['pages'], result['seconds'],
+                    result['traced_peak_bytes'] / (1024 * 1024), result['peak_rss_bytes'] / (1024 * 1024)
+                ))
+
+    failedList = list()
+    growthDict = dict()
+    for engine in engineList:
+        pageBytes = _getPageBytes([result for result in resultList if result['engine'] == engine])
+        growthDict[engine] = pageBytes
+        if pageBytes is None:
+            continue
+        isFailed = engine in checkList and pageBytes > args.max_page_bytes
+        print('{:9} {:8.0f} bytes per extra page{}'.format(engine, pageBytes, ' over the limit' if isFailed else ''))
+        if isFailed:
+            failedList.append(engine)
+
+    outputPath = args.output or os.path.join(resultDir, 'memory-{}.json'.format(commit))
+    if os.path.dirname(outputPath) != '':
+        os.makedirs(os.path.dirname(outputPath), exist_ok=True)
+    with open(outputPath, 'w') as f:
+        json.dump({
+            'commit': commit,
+            'created_at': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'max_page_bytes': args.max_page_bytes,
+            'page_bytes': growthDict,
+            'failed': failedList,
+            'results': resultList
+        }, f, indent=2)
+    print('written to {}'.format(outputPath))
+    return 1 if failedList else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
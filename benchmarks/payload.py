@@ -0,0 +1,121 @@
+import random
+from form_spec import itemSlotCount, checkTimingList, scSymbolPathMap, counterPathMap, checkTimingSymbolPathMap
+
+#   Synthetic PCS payloads shaped like pcs_controlitem.json. Items of a
+#   process are laid out Before -> During -> After like the real data,
+#   the form draws the timing flow from that order
+
+defaultCheckTimingMix = {'Before': 0.1, 'During': 0.25, 'After': 0.65}
+limitTypeList = ['None', 'Both', 'Upper only', 'Lower only']
+methodList = ['', 'None', 'Auto check', 'Check']
+maxSymbolPerItem = 2
+maxProcessAttempt = 20
+
+def _getSCSymbolList(rand: random.Random, scSymbolDensity: float, pageCountDict: dict):
+    #   scSymbolDensity is the expected number of symbols per item, a symbol
+    #   can show up at most len(counterPathMap) times on a page
+    symbolList = list()
+    for _ in range(maxSymbolPerItem):
+        if rand.random() >= scSymbolDensity / maxSymbolPerItem:
+            continue
+        symbolHash = rand.choice(list(scSymbolPathMap))
+        if pageCountDict.get(symbolHash, 0) >= len(counterPathMap):
+            continue
+        if symbolHash in [s['character'] + '-' + s['shape'] for s in symbolList]:
+            continue
+        pageCountDict[symbolHash] = pageCountDict.get(symbolHash, 0) + 1
+        character, shape = symbolHash.split('-')
+        symbolList.append({'character': character, 'shape': shape})
+    return symbolList
+
+def _getItem(rand: random.Random, itemNo: int, checkTiming: str, scSymbolList: list):
+    limitType = rand.choice(limitTypeList)
+    sampleNo = rand.choice([1, 1, 1, 3, 5])
+    return {
+        'control_item_no': itemNo,
+        'control_item_type': rand.choice(list(checkTimingSymbolPathMap)),
+        'parameter': {
+            'parameter': 'Parameter {}'.format(itemNo),
+            'master_value': 0,
+            'limit_type': limitType,
+            'prefix': '' if limitType == 'None' else 'Ø',
+            'main': '' if limitType == 'None' else '{:.2f}'.format(rand.uniform(1, 100)),
+            'suffix': '',
+            'tolerance_up': '' if limitType in ['None', 'Lower only'] else '+0.05',
+            'tolerance_down': '' if limitType in ['None', 'Upper only'] else '-0.05',
+            'upper_limit': '',
+            'lower_limit': '',
+            'unit': '' if limitType == 'None' else 'mm'
+        },
+        'sc_symbols': scSymbolList,
+        'check_timing': checkTiming,
+        'control_method': {
+            'sample_no': sampleNo,
+            'interval': rand.choice(['At start', '1 time / shift', '1 time / lot', 'Every change']),
+            '100_method': rand.choice(methodList),
+            'in_charge': rand.choice(['LL', 'OP', 'QA']),
+            'calibration_interval': rand.choice(['', '', '1 year'])
+        },
+        'initial_p_capability': {
+            'x_bar': rand.choice(['', '{:.3f}'.format(rand.uniform(1, 100))]),
+            'cpk': rand.choice(['', '{:.2f}'.format(rand.uniform(1.33, 3))])
+        },
+        'remark': {
+            'remark': rand.choice(['', 'Refer to work standard']),
+            'ws_no': rand.choice(['', 'WS-{:04d}'.format(itemNo)]),
+            'related_std': ''
+        },
+        'measurement': rand.choice(['Visual', 'Vernier caliper', 'Micrometer', 'Gauge']),
+        'readability': rand.choice(['', '0.01']),
+        'start_effective': '10-Oct-2022'
+    }
+
+def _getCheckTimingList(rand: random.Random, itemCount: int, checkTimingMix: dict):
+    #   the timing flow of _writeProcessItem does not cope with every mix
+    #   (e.g. Before and After without During), every timing with a weight
+    #   is present at least once so that the payload renders
+    weightList = [checkTimingMix.get(checkTiming, 0) for checkTiming in checkTimingList]
+    timingList = [checkTiming for checkTiming, weight in zip(checkTimingList, weightList) if weight > 0][:itemCount]
+    timingList += rand.choices(checkTimingList, weights=weightList, k=itemCount - len(timingList))
+    return sorted(timingList, key=checkTimingList.index)
+
+def _getProcess(rand: random.Random, processIndex: int, itemCount: int, scSymbolDensity: float, checkTimingMix: dict):
+    itemList = list()
+    pageCountDict = dict()
+    for j, checkTiming in enumerate(_getCheckTimingList(rand, itemCount, checkTimingMix)):
+        if j % itemSlotCount == 0:
+            pageCountDict = dict()
+        scSymbolList = _getSCSymbolList(rand, scSymbolDensity, pageCountDict)
+        itemList.append(_getItem(rand, j + 1, checkTiming, scSymbolList))
+    return {
+        'name': '{:02d} / Process-{}'.format(processIndex + 1, processIndex + 1),
+        'items': itemList
+    }
+
+def generatePayload(processCount: int, itemCount: int, scSymbolDensity: float = 0.5, checkTimingMix: dict = None, seed: int = 0, isRenderable = None):
+    #   isRenderable(processDict) can reject processes the form cannot draw,
+    #   they are drawn again from the same random stream
+    rand = random.Random(seed)
+    checkTimingMix = checkTimingMix if checkTimingMix is not None else defaultCheckTimingMix
+
+    processList = list()
+    for i in range(processCount):
+        processDict = _getProcess(rand, i, itemCount, scSymbolDensity, checkTimingMix)
+        attempt = 1
+        while isRenderable is not None and not isRenderable(processDict):
+            if attempt >= maxProcessAttempt:
+                raise ValueError('No renderable process with {} items after {} attempts'.format(itemCount, attempt))
+            processDict = _getProcess(rand, i, itemCount, scSymbolDensity, checkTimingMix)
+            attempt += 1
+        processList.append(processDict)
+
+    return {
+        'pcs_no': 'S231-BENCH',
+        'date': '11 Nov 2022',
+        'status': 'Production',
+        'line': 'Benchmark Line / B001',
+        'assy_name': 'Benchmark Assy / As assy list',
+        'part_name': 'Benchmark Part / BM000000-0000',
+        'customer': 'ABC / ABC123 / ZXC',
+        'processes': processList
+    }
@@ -0,0 +1,156 @@
+import os
+import sys
+import json
+import time
+import resource
+import argparse
+import platform
+import subprocess
+import statistics
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+#   Render benchmark, every case runs in a fresh process so that peak RSS
+#   belongs to that case only. Usage, from the repository root:
+#
+#       python -m benchmarks.run --size small,medium --engine openpyxl,xml
+#
+#   Results are written as JSON (see --output), one file per commit so that
+#   runs can be diffed across commits
+
+templatePath = './templates/e-pcs-control-item-form-template.xlsx'
+resultDir = os.path.join('benchmarks', 'results')
+
+#   processes, items per process
+sizeClassDict = {
+    'small': (4, 8),
+    'medium': (20, 12),
+    'large': (50, 17),
+    'xlarge': (100, 34)
+}
+
+def getPeakRss():
+    #   ru_maxrss is in kilobytes on linux and bytes on macos
+    peakRss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peakRss if sys.platform == 'darwin' else peakRss * 1024
+
+def isRenderable(processDict: dict):
+    from e_pcs_form import PCSForm
+    from benchmarks.payload import generatePayload
+
+    dataDict = generatePayload(0, 0)
+    dataDict['processes'] = [processDict]
+    try:
+        PCSForm(templatePath, dataDict, engine='xml').generate().close()
+    except Exception:
+        return False
+    return True
+
+def _runCase(sizeClass: str, engine: str, repeat: int, scSymbolDensity: float, seed: int, connectorMode: str = 'image'):
+    from template_cache import getTemplateCache
+    from image_registry import imageRegistry
+    from stage_timer import StageTimer
+    from e_pcs_form import PCSForm, getTotalPage
+    from benchmarks.payload import generatePayload
+
+    start = time.perf_counter()
+    getTemplateCache(templatePath).preload()
+    imageRegistry.preload()
+    templateParse = time.perf_counter() - start
+
+    #   the payload is generated (and checked) before the renders are measured
+    processCount, itemCount = sizeClassDict[sizeClass]
+    dataDict = generatePayload(processCount, itemCount, scSymbolDensity=scSymbolDensity, seed=seed, isRenderable=isRenderable)
+    baselineRss = getPeakRss()
+
+    wallList = list()
+    stageList = list()
+    outputSize = None
+    for _ in range(repeat):
+        stageTimer = StageTimer()
+        start = time.perf_counter()
+        with PCSForm(templatePath, dataDict, engine=engine, stageTimer=stageTimer, connectorMode=connectorMode).generate() as buffer:
+            wallList.append(time.perf_counter() - start)
+            buffer.seek(0, os.SEEK_END)
+            outputSize = buffer.tell()
+        stageList.append(stageTimer.toDict())
+
+    stageDict = dict()
+    for stage in stageList[0]:
+        stageDict[stage] = {
+            'seconds': statistics.median(stageTiming[stage]['seconds'] for stageTiming in stageList),
+            'count': stageList[0][stage]['count']
+        }
+
+    return {
+        'size': sizeClass,
+        'engine': engine,
+        'connector_mode': connectorMode,
+        'processes': processCount,
+        'items_per_process': itemCount,
+        'pages': getTotalPage(dataDict['processes']),
+        'repeat': repeat,
+        'template_parse_seconds': templateParse,
+        'wall_seconds': statistics.median(wallList),
+        'wall_seconds_min': min(wallList),
+        'stages': stageDict,
+        'baseline_rss_bytes': baselineRss,
+        'peak_rss_bytes': getPeakRss(),
+        'output_bytes': outputSize
+    }
+
+def getCommit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark PCSForm rendering')
+    parser.add_argument('--size', default='small,medium,large', help='comma separated size classes, {}'.format(','.join(sizeClassDict)))
+    parser.add_argument('--engine', default='openpyxl,xml', help='comma separated render engines')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--sc-density', type=float, default=0.5, help='expected sc symbols per item')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--connector-mode', default='image', help='image or vector dashed timing lines')
+    parser.add_argument('--output', default=None, help='result file, defaults to benchmarks/results/<commit>.json')
+    args = parser.parse_args()
+
+    commit = getCommit()
+    resultList = list()
+    for sizeClass in args.size.split(','):
+        for engine in args.engine.split(','):
+            executor = ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn'))
+            try:
+                result = executor.submit(_runCase, sizeClass, engine, args.repeat, args.sc_density, args.seed, args.connector_mode).result()
+            except Exception as e:
+                result = {'size': sizeClass, 'engine': engine, 'error': '{}: {}'.format(type(e).__name__, e)}
+            finally:
+                executor.shutdown(wait=True)
+            resultList.append(result)
+            if 'error' in result:
+                print('{:8} {:9} error {}'.format(sizeClass, engine, result['error']))
+            else:
+                print('{:8} {:9} {:4d} pages {:8.3f}s peak {:6.1f}MB {:8d} bytes'.format(
+                    sizeClass, engine, result['pages'], result['wall_seconds'],
+                    result['peak_rss_bytes'] / (1024 * 1024), result['output_bytes']
+                ))
+
+    outputPath = args.output or os.path.join(resultDir, '{}.json'.format(commit))
+    if os.path.dirname(outputPath) != '':
+        os.makedirs(os.path.dirname(outputPath), exist_ok=True)
+    with open(outputPath, 'w') as f:
+        json.dump({
+            'commit': commit,
+            'created_at': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'sc_density': args.sc_density,
+            'seed': args.seed,
+            'results': resultList
+        }, f, indent=2)
+    print('written to {}'.format(outputPath))
+
+if __name__ == '__main__':
+    main()
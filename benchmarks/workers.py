@@ -0,0 +1,171 @@
+import os
+import ast
+import sys
+import json
+import time
+import signal
+import socket
+import argparse
+import platform
+import threading
+import subprocess
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import dotenv_values
+from benchmarks.run import resultDir, getCommit
+
+#   Startup time and memory per worker of serve.py, which preloads once and
+#   forks, against uvicorn --workers, which starts every worker from scratch.
+#   Memory is read from /proc (linux only) after startup and again after
+#   --requests conversions of pcs_controlitem.json spread over the workers.
+#   USS is what a worker holds on its own, PSS splits shared pages between
+#   the processes sharing them, total PSS covers the workers and the parent.
+#   Usage, from the repository root:
+#
+#       python -m benchmarks.workers --workers 4 --requests 32
+
+modeList = ['prefork', 'uvicorn']
+startupTimeout = 120
+payloadPath = 'pcs_controlitem.json'
+
+def getFreePort():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+def getCommand(mode: str, workerCount: int, port: int):
+    if mode == 'prefork':
+        return [sys.executable, 'serve.py', '--host', '127.0.0.1', '--port', str(port), '--workers', str(workerCount)]
+    return [sys.executable, '-m', 'uvicorn', 'main:app', '--host', '127.0.0.1', '--port', str(port), '--workers', str(workerCount)]
+
+def getChildPidList(pid: int):
+    with open('/proc/{}/task/{}/children'.format(pid, pid)) as f:
+        return [int(value) for value in f.read().split()]
+
+def getCommandLine(pid: int):
+    with open('/proc/{}/cmdline'.format(pid), 'rb') as f:
+        return f.read().replace(b'\0', b' ').decode()
+
+def getMemory(pid: int):
+    #   bytes, from the kB values of smaps_rollup
+    valueDict = dict()
+    with open('/proc/{}/smaps_rollup'.format(pid)) as f:
+        for line in f:
+            partList = line.split()
+            if len(partList) == 3 and partList[2] == 'kB':
+                valueDict[partList[0].rstrip(':')] = int(partList[1]) * 1024
+    return {
+        'rss': valueDict['Rss'],
+        'pss': valueDict['Pss'],
+        'uss': valueDict['Private_Clean'] + valueDict['Private_Dirty']
+    }
+
+def getMemorySample(rootPid: int, workerPidList: list):
+    workerList = [getMemory(pid) for pid in workerPidList]
+    return {
+        'workers': workerList,
+        'parent': getMemory(rootPid),
+        'total_pss': getMemory(rootPid)['pss'] + sum(memory['pss'] for memory in workerList)
+    }
+
+def sendRequests(port: int, apiKey: str, requestCount: int, concurrency: int):
+    with open(payloadPath, 'rb') as f:
+        body = f.read()
+
+    def convert(_):
+        request = urllib.request.Request(
+            'http://127.0.0.1:{}/convert_json_to_xlsx'.format(port),
+            data=body,
+            headers={'Content-Type': 'application/json', 'X-API-Key': apiKey}
+        )
+        with urllib.request.urlopen(request) as response:
+            response.read()
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(convert, range(requestCount)))
+
+def _runMode(mode: str, workerCount: int, requestCount: int, apiKey: str):
+    port = getFreePort()
+    start = time.perf_counter()
+    process = subprocess.Popen(getCommand(mode, workerCount, port), stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+    readyEvent = threading.Event()
+    readyCount = 0
+
+    def readOutput():
+        nonlocal readyCount
+        for line in process.stdout:
+            if b'Application startup complete' in line:
+                readyCount += 1
+                if readyCount >= workerCount:
+                    readyEvent.set()
+
+    threading.Thread(target=readOutput, daemon=True).start()
+    try:
+        if not readyEvent.wait(startupTimeout):
+            raise RuntimeError('{} workers not ready after {}s'.format(mode, startupTimeout))
+        startupSeconds = time.perf_counter() - start
+
+        #   uvicorn --workers also runs a multiprocessing resource tracker
+        workerPidList = [pid for pid in getChildPidList(process.pid) if 'resource_tracker' not in getCommandLine(pid)]
+        idleSample = getMemorySample(process.pid, workerPidList)
+        sendRequests(port, apiKey, requestCount, workerCount * 2)
+        loadedSample = getMemorySample(process.pid, workerPidList)
+    finally:
+        process.send_signal(signal.SIGTERM)
+        try:
+            process.wait(30)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+
+    return {
+        'mode': mode,
+        'workers': workerCount,
+        'requests': requestCount,
+        'startup_seconds': startupSeconds,
+        'idle': idleSample,
+        'loaded': loadedSample
+    }
+
+def getMean(sample: dict, key: str):
+    return sum(memory[key] for memory in sample['workers']) / len(sample['workers']) / (1024 * 1024)
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark preforked workers against uvicorn --workers')
+    parser.add_argument('--mode', default=','.join(modeList), help='comma separated, {}'.format(','.join(modeList)))
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--requests', type=int, default=32, help='conversions sent before the second memory sample')
+    parser.add_argument('--api-key', default=None, help='defaults to the first X_API_KEY of .env')
+    parser.add_argument('--output', default=None, help='result file, defaults to benchmarks/results/workers-<commit>.json')
+    args = parser.parse_args()
+    apiKey = args.api_key or ast.literal_eval(dotenv_values('.env')['X_API_KEY'])[0]
+
+    commit = getCommit()
+    resultList = list()
+    for mode in args.mode.split(','):
+        result = _runMode(mode, args.workers, args.requests, apiKey)
+        resultList.append(result)
+        print('{:8} {} workers started in {:6.2f}s'.format(mode, args.workers, result['startup_seconds']))
+        for sampleName in ['idle', 'loaded']:
+            sample = result[sampleName]
+            print('    {:6} per worker rss {:6.1f}MB pss {:6.1f}MB uss {:6.1f}MB, total pss {:6.1f}MB'.format(
+                sampleName, getMean(sample, 'rss'), getMean(sample, 'pss'), getMean(sample, 'uss'),
+                sample['total_pss'] / (1024 * 1024)
+            ))
+
+    outputPath = args.output or os.path.join(resultDir, 'workers-{}.json'.format(commit))
+    if os.path.dirname(outputPath) != '':
+        os.makedirs(os.path.dirname(outputPath), exist_ok=True)
+    with open(outputPath, 'w') as f:
+        json.dump({
+            'commit': commit,
+            'created_at': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'results': resultList
+        }, f, indent=2)
+    print('written to {}'.format(outputPath))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+import re
+from openpyxl.drawing.spreadsheet_drawing import OneCellAnchor
+from openpyxl.utils.units import pixels_to_EMU
+
+#   Dashed flow lines as DrawingML connector shapes. The raster dash images
+#   are placed as usual and swapped for connectors once a page is complete,
+#   every connector takes the place and the dash pattern of the image it
+#   replaces, so the vector layout matches the raster one. Excel draws them,
+#   the page loses a picture anchor per line segment and the vertical dash
+#   rasters (one media part per length) are not written at all
+
+connectorModeList = ['image', 'vector']
+
+#   1px lines, the dash pattern is in pixels
+lineWidth = pixels_to_EMU(1)
+
+spreadsheetDrawingNamespace = 'http://schemas.openxmlformats.org/drawingml/2006/spreadsheetDrawing'
+drawingNamespace = 'http://schemas.openxmlformats.org/drawingml/2006/main'
+
+#   start tag of the drawing root, with or without a prefix
+drawingRootPattern = re.compile(r'<(?:[\w.-]+:)?wsDr[\s>]')
+
+class DashConnector:
+    def __init__(self, row: int, col: int, rowOff: int, colOff: int, width: int, height: int, dashLength: int, spaceLength: int):
+        #   offsets and size in EMU, a line has either width or height 0
+        self.row = row
+        self.col = col
+        self.rowOff = rowOff
+        self.colOff = colOff
+        self.width = width
+        self.height = height
+        self.dashLength = dashLength
+        self.spaceLength = spaceLength
+
+def markDashImage(img, dashLength: int, spaceLength: int, startOffset: int = 0, endOffset: int = 0):
+    #   dash pattern of a 1px wide (or high) raster, startOffset and
+    #   endOffset are blank pixels before the first and after the last dash
+    img.dashPattern = (dashLength, spaceLength, startOffset, endOffset)
+    return img
+
+def getDashConnector(img):
+    dashPattern = getattr(img, 'dashPattern', None)
+    if dashPattern is None or not isinstance(img.anchor, OneCellAnchor):
+        return None
+    dashLength, spaceLength, startOffset, endOffset = dashPattern
+    marker = img.anchor._from
+    width, height = img.anchor.ext.width, img.anchor.ext.height
+    #   the line runs through the middle of the 1px raster
+    if width <= lineWidth:
+        return DashConnector(
+            marker.row, marker.col,
+            marker.rowOff + pixels_to_EMU(startOffset), marker.colOff + lineWidth // 2,
+            0, max(height - pixels_to_EMU(startOffset + endOffset), 0),
+            dashLength, spaceLength
+        )
+    return DashConnector(
+        marker.row, marker.col,
+        marker.rowOff + lineWidth // 2, marker.colOff + pixels_to_EMU(startOffset),
+        max(width - pixels_to_EMU(startOffset + endOffset), 0), 0,
+        dashLength, spaceLength
+    )
+
+def replaceDashImages(sheet):
+    imageList = list()
+    connectorList = list(getattr(sheet, '_connectors', ()))
+    for img in sheet._images:
+        connector = getDashConnector(img)
+        if connector is None:
+            imageList.append(img)
+        else:
+            connectorList.append(connector)
+    sheet._images = imageList
+    sheet._connectors = connectorList
+
+def renderConnectorAnchor(connector: DashConnector, shapeId: int):
+    #   the anchor declares its own namespaces, the serializer of the drawing
+    #   (ElementTree or lxml under openpyxl) decides what the root declares
+    return (
+        '<oneCellAnchor xmlns="{xdr}" xmlns:a="{a}"><from><col>{col}</col><colOff>{colOff}</colOff><row>{row}</row><rowOff>{rowOff}</rowOff></from>'
+        '<ext cx="{cx}" cy="{cy}" />'
+        '<cxnSp macro=""><nvCxnSpPr><cNvPr id="{id}" name="Connector {id}" /><cNvCxnSpPr /></nvCxnSpPr>'
+        '<spPr><a:xfrm><a:off x="0" y="0" /><a:ext cx="{cx}" cy="{cy}" /></a:xfrm><a:prstGeom prst="line"><a:avLst /></a:prstGeom>'
+        '<a:ln w="{w}" cap="flat"><a:solidFill><a:srgbClr val="000000" /></a:solidFill>'
+        '<a:custDash><a:ds d="{d}" sp="{sp}" /></a:custDash></a:ln></spPr></cxnSp><clientData /></oneCellAnchor>'
+    ).format(
+        xdr=spreadsheetDrawingNamespace, a=drawingNamespace,
+        col=connector.col, colOff=connector.colOff, row=connector.row, rowOff=connector.rowOff,
+        cx=connector.width, cy=connector.height, id=shapeId, w=lineWidth,
+        #   dash and space are in thousandths of a percent of the line width
+        d=connector.dashLength * 100000, sp=connector.spaceLength * 100000
+    )
+
+def insertConnectorAnchors(drawingXml: str, connectorList: list, firstShapeId: int):
+    #   connectors go first, under the pictures, like the rasters that were
+    #   placed before the symbols
+    if not connectorList:
+        return drawingXml
+    rootEnd = drawingXml.index('>', drawingRootPattern.search(drawingXml).start()) + 1
+    return ''.join([
+        drawingXml[:rootEnd],
+        ''.join(renderConnectorAnchor(connector, shapeId) for shapeId, connector in enumerate(connectorList, firstShapeId)),
+        drawingXml[rootEnd:]
+    ])
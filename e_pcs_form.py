@@ -1,90 +1,79 @@
-from openpyxl import load_workbook
+import json
+import time
+import pickle
+import hashlib
+from io import BytesIO
+from functools import lru_cache
+from tempfile import SpooledTemporaryFile
 from openpyxl.drawing.xdr import XDRPositiveSize2D, XDRPoint2D
 from openpyxl.drawing.spreadsheet_drawing import OneCellAnchor, AnchorMarker, AbsoluteAnchor
 from openpyxl.worksheet.worksheet import Worksheet
-from openpyxl.drawing.image import Image
 from openpyxl.drawing.text import TextField
 from openpyxl.utils.units import cm_to_EMU, pixels_to_EMU, EMU_to_pixels
 from utils import (
     getOutputFilePath,
+    spoolMaxSize,
     drawVerticalDashedLine,
     chunk,
     leftCenterAlignment,
     centerCenterAlignment,
-    topCenterAlignment,
-    topLeftAlignment,
-    headerNormalStyle,
-    textNormalStyle,
-    bottomBorder,
-    bottomRightBorder
+    headerNormalStyle
+)
+from template_cache import getTemplateCache
+from image_registry import getImage, ImageAsset, AssetImage
+from xlsx_writer import saveWorkbook
+from xml_engine import XmlWorkbookWriter
+from page_prototype import PagePrototype
+from stage_timer import StageTimer
+from metrics import recordRender, renderInFlight
+from item_block import getItemBlock
+from connector_shape import connectorModeList, markDashImage, replaceDashImages
+from timing_plan import planTimingFlow
+from form_spec import (
+    itemStartRow,
+    itemRowStep,
+    itemSlotCount,
+    scSymbolPerItemLimit,
+    checkTimingSymbolPathMap,
+    scSymbolPathMap,
+    defaultTemplateSheetName,
+    defaultAssetMap,
+    AssetMap
 )
 
-itemChunkSize = 17
+itemChunkSize = itemSlotCount
+dashLineCacheSize = 256
 
-timingConnectorPath = 'images/timing/check-process.png'
+#   openpyxl builds every page as a Worksheet and saves the whole workbook,
+#   xml writes each page straight into the archive (see xml_engine)
+engineList = ['openpyxl', 'xml']
 
-counterPathMap = {
-    1: 'images/counter/1.png',
-    2: 'images/counter/2.png',
-    3: 'images/counter/3.png',
-    4: 'images/counter/4.png',
-    5: 'images/counter/5.png',
-    6: 'images/counter/6.png',
-    7: 'images/counter/7.png',
-    8: 'images/counter/8.png',
-    9: 'images/counter/9.png',
-    10: 'images/counter/10.png',
-    11: 'images/counter/11.png',
-    12: 'images/counter/12.png',
-    13: 'images/counter/13.png',
-    14: 'images/counter/14.png',
-    15: 'images/counter/15.png',
-    16: 'images/counter/16.png',
-}
-
-checkTimingSymbolPathMap = {
-    'None': 'images/timing/check-no-record.png',
-    'Check sheet': 'images/timing/check-record.png',
-    'Record sheet': 'images/timing/check-record.png',
-    'x-R chart': 'images/timing/check-control-chart.png',
-    'xbar-R chart': 'images/timing/check-control-chart.png',
-    'x-Rs chart': 'images/timing/check-control-chart.png',
-}
-
-scSymbolPathMap = {
-    'C-none': 'images/symbols/C-none.png',
-    'S-circle': 'images/symbols/S-circle.png',
-    'S-diamond': 'images/symbols/S-diamond.png',
-    'F-circle': 'images/symbols/F-circle.png',
-    'F-triangle': 'images/symbols/F-triangle.png',
-    'RW-rectangle': 'images/symbols/RW-rectangle.png',
-    'SP-circle': 'images/symbols/SP-circle.png'
-}
+timingConnectorPath = 'images/timing/check-process.png'
 
 c2e = cm_to_EMU
 p2e = pixels_to_EMU
 cellh = lambda x: c2e(x * 0.48)
 cellw = lambda x: c2e(x * 1.1)
 
-def getSCSymbolList(scSymbolList: list, rowStart: int, maxRow: int):
+def getSCSymbolList(scSymbolList: list, rowStart: int, maxRow: int, symbolPathMap: dict = scSymbolPathMap):
     imgList = list()
     symbolTotal = len(scSymbolList)
 
     assert symbolTotal <= maxRow, 'SC Symbol out of bound'
 
     for i, scSymbol in enumerate(scSymbolList):
-        symbolPath = scSymbolPathMap.get('{}-{}'.format(scSymbol['character'], scSymbol['shape']), None)
+        symbolPath = symbolPathMap.get('{}-{}'.format(scSymbol['character'], scSymbol['shape']), None)
         if symbolPath is None:
             raise KeyError('Unregistered sc symbol, {}-{}'.format(scSymbol['character'], scSymbol['shape']))
 
         if symbolTotal == 1:
-            symbolImg = drawImage(Image(symbolPath), rowStart, 2, 0, 10)
+            symbolImg = drawImage(getImage(symbolPath), rowStart, 2, 0, 10)
         else:
-            symbolImg = drawImage(Image(symbolPath), rowStart + i -1, 2, 5*i, 10)
+            symbolImg = drawImage(getImage(symbolPath), rowStart + i -1, 2, 5*i, 10)
         imgList.append(symbolImg)
     return imgList
 
-def getTotalSCSymbolList(itemList: list):
+def getTotalSCSymbolList(itemList: list, assetMap: AssetMap = defaultAssetMap):
     def drawTotalScSymbol(img, rowOff, colOff):
         h, w = img.height, img.width
         size = XDRPositiveSize2D(p2e(w), p2e(h))
@@ -115,13 +104,13 @@ def getTotalSCSymbolList(itemList: list):
     imgList = list()
     for i, scSymbol in enumerate(totalSymbolList):
         symbolHash = '{}-{}'.format(scSymbol['character'], scSymbol['shape'])
-        symbolPath = scSymbolPathMap.get(symbolHash, None)
+        symbolPath = assetMap.scSymbolPathMap.get(symbolHash, None)
 
         if symbolPath is None:
             raise KeyError('Unregistered sc symbol, {}-{}'.format(scSymbol['character'], scSymbol['shape']))
 
-        symbolImg = drawTotalScSymbol(Image(symbolPath), 0, 33*i)
-        counterImg = drawTotalCountSymbol(Image(counterPathMap[scSymbolCountDict[symbolHash]]), 12, (33 * i) + 23)
+        symbolImg = drawTotalScSymbol(getImage(symbolPath), 0, 33*i)
+        counterImg = drawTotalCountSymbol(getImage(assetMap.counterPathMap[scSymbolCountDict[symbolHash]]), 12, (33 * i) + 23)
         imgList.append(symbolImg)
         imgList.append(counterImg)
     
@@ -205,76 +194,333 @@ def drawImage(img, row, col, rowOff, colOff):
     img.anchor = OneCellAnchor(marker, size)
     return img
 
+#   dash lines only come in a handful of heights, keep the rendered
+#   rasters in memory instead of redrawing them for every connector
+@lru_cache(maxsize=dashLineCacheSize)
+def getVerticalDashLineAsset(height: int):
+    return ImageAsset(drawVerticalDashedLine(height))
+
+#   dash patterns of the rasters, in pixels (see utils.drawVerticalDashedLine
+#   and images/timing/dash-main-to-branch.png), kept by vector connectors
 def getVerticalDashLine(height, row, col, rowOff, colOff):
-    img = Image(drawVerticalDashedLine(EMU_to_pixels(c2e(height) * 0.45)))
-    return drawImage(img, row, col, rowOff, colOff)
+    img = AssetImage(getVerticalDashLineAsset(EMU_to_pixels(c2e(height) * 0.45)))
+    return markDashImage(drawImage(img, row, col, rowOff, colOff), 5, 3)
 
 def getHorizontalDashLine(row, col, rowOff, colOff):
-    return drawImage(
-        Image('images/timing/dash-main-to-branch.png'),
+    img = drawImage(
+        getImage('images/timing/dash-main-to-branch.png'),
         row,
         col,
         rowOff,
         colOff)
+    return markDashImage(img, 3, 4, 2, 1)
 
 def getCheckProcess(row, col, rowOff, colOff):
     return drawImage(
-        Image('images/timing/check-process.png'),
+        getImage('images/timing/check-process.png'),
         row,
         col,
         rowOff,
         colOff)
 
-def getCheckTimingSymbol(checkTiming, row, col, rowOff, colOff):
-    symbolPath = checkTimingSymbolPathMap.get(checkTiming, None)
+def getTimingImage(placement):
+    if placement.kind == 'vertical_dash':
+        return getVerticalDashLine(placement.height, placement.row, placement.col, placement.rowOff, placement.colOff)
+    if placement.kind == 'horizontal_dash':
+        return getHorizontalDashLine(placement.row, placement.col, placement.rowOff, placement.colOff)
+    return getCheckProcess(placement.row, placement.col, placement.rowOff, placement.colOff)
+
+def getCheckTimingSymbol(checkTiming, row, col, rowOff, colOff, symbolPathMap: dict = checkTimingSymbolPathMap):
+    symbolPath = symbolPathMap.get(checkTiming, None)
     if symbolPath is None:
         raise KeyError('Unregistered check timing type, {}'.format(checkTiming))
-    img = Image(symbolPath)
+    img = getImage(symbolPath)
     return drawImage(img, row, col, rowOff, colOff)
 
+class _ProcessSheetPickler(pickle.Pickler):
+    def __init__(self, file, workbook, sheetList: list):
+        super().__init__(file, protocol=pickle.HIGHEST_PROTOCOL)
+        self.workbook = workbook
+        self.sheetIdSet = set(id(sheet) for sheet in sheetList)
+
+    def persistent_id(self, obj):
+        if obj is self.workbook:
+            return ('workbook', None)
+        if isinstance(obj, Worksheet) and id(obj) not in self.sheetIdSet:
+            return ('sheet', obj.title)
+        return None
+
+class _ProcessSheetUnpickler(pickle.Unpickler):
+    def __init__(self, file, workbook):
+        super().__init__(file)
+        self.workbook = workbook
+
+    def persistent_load(self, pid):
+        kind, title = pid
+        if kind == 'workbook':
+            return self.workbook
+        return self.workbook[title]
+
+def getTotalPage(processList: list):
+    return sum((len(processDict['items']) + itemChunkSize - 1) // itemChunkSize for processDict in processList)
+
 class PCSForm:
-    def __init__(self, templatePath: str, dataDict: dict):
+    def __init__(self, templatePath: str, dataDict: dict, progressCallback = None, sheetCache = None, engine: str = 'openpyxl', stageTimer: StageTimer = None, connectorMode: str = 'image', templateSheetName: str = defaultTemplateSheetName, assetMap: AssetMap = None):
+        if engine not in engineList:
+            raise ValueError('Unknown render engine, {}'.format(engine))
+        if connectorMode not in connectorModeList:
+            raise ValueError('Unknown connector mode, {}'.format(connectorMode))
         self.templatePath = templatePath
-        self.templateSheetName = 'empty'
+        self.templateSheetName = templateSheetName
+        #   images of the template revision, see template_registry
+        self.assetMap = assetMap if assetMap is not None else defaultAssetMap
+        self.engine = engine
+        #   image places the dashed flow lines as rasters, vector as
+        #   DrawingML connectors (see connector_shape)
+        self.connectorMode = connectorMode
 
         self.dataDict = dataDict
+        #   called with (renderedPage, totalPage) after every page
+        self.progressCallback = progressCallback
+        #   optional ResultCache holding pickled sheets of already rendered
+        #   processes, unchanged processes are reused instead of re-rendered
+        #   (openpyxl engine only)
+        self.sheetCache = sheetCache
+        #   time spent in every stage, pass a StageTimer to read it afterwards
+        self.stageTimer = stageTimer if stageTimer is not None else StageTimer()
+        #   stages and counts of the last generate(), see metrics.recordRender
+        self.renderSample = None
+        self._pageCount = 0
+        self._itemCount = 0
+        self._anchorCount = 0
+        #   item block styles registered in this workbook, see item_block
+        self._itemStyleList = None
         self._initializeTemplateWorkbook()
 
-    def _initializeTemplateWorkbook(self):
-        self.workbook = load_workbook(filename = self.templatePath)
+    def _measureStage(self, stage: str):
+        return self.stageTimer.measure(stage)
+
+    def _countPage(self, sheet, itemCount: int):
+        self._pageCount += 1
+        self._itemCount += itemCount
+        self._anchorCount += len(sheet._images) + len(getattr(sheet, '_connectors', ()))
 
-    def generate(self, fileName: str):
+    def _initializeTemplateWorkbook(self):
+        with self._measureStage('template_load'):
+            self.workbook = getTemplateCache(self.templatePath).getWorkbook()
+
+    def generate(self, fileName: str = None):
+        #   without a file name the workbook is written into a spooled buffer
+        #   and returned to the caller, who is responsible for closing it
+        renderInFlight.inc()
+        start = time.perf_counter()
+        error = None
+        try:
+            if self.engine == 'xml':
+                return self._generateXml(fileName)
+            return self._generateOpenpyxl(fileName)
+        except Exception as e:
+            error = '{}: {}'.format(type(e).__name__, e)
+            raise
+        finally:
+            renderInFlight.dec()
+            self.renderSample = {
+                'engine': self.engine,
+                'seconds': time.perf_counter() - start,
+                'stages': self.stageTimer.toDict(),
+                'pages': self._pageCount,
+                'items': self._itemCount,
+                'anchors': self._anchorCount,
+                'error': error
+            }
+            recordRender(self.renderSample)
+
+    def _bindItemBlock(self):
+        #   before anything else adds a style, the ids are then the same in
+        #   every workbook cloned from the template, also when every process
+        #   comes from the sheet cache
+        itemBlock = getItemBlock(self.templatePath, self.templateSheetName)
+        self._itemStyleList = itemBlock.bind(self.workbook)
+
+    def _generateOpenpyxl(self, fileName: str = None):
         headerDict = self.dataDict
         processList = self.dataDict['processes']
+        self._bindItemBlock()
 
+        #   the template sheet becomes the page prototype, it is dropped on save
         templateSheet = self.workbook[self.templateSheetName]
         self._writeFormHeader(headerDict, templateSheet)
+        with self._measureStage('copy_sheet'):
+            pagePrototype = PagePrototype(templateSheet, [self._getFormLogo()])
 
         totalProcess = len(processList)
+        totalPage = getTotalPage(processList)
         pageCount = 1
         for i, processDict in enumerate(processList):
             itemChunkList = chunk(processDict['items'], itemChunkSize)
             totalChunk = len(itemChunkList) if len(itemChunkList) > 1 else 1
+
+            sheetKey = None
+            if self.sheetCache is not None:
+                sheetKey = self._getProcessSheetKey(i, pageCount, totalProcess, processDict)
+                payload = self.sheetCache.get(sheetKey)
+                if payload is not None:
+                    with self._measureStage('sheet_cache'):
+                        processSheetList = self._loadProcessSheets(payload)
+                    for itemSheet, itemChunk in zip(processSheetList, itemChunkList):
+                        self._countPage(itemSheet, len(itemChunk))
+                        if self.progressCallback is not None:
+                            self.progressCallback(pageCount, totalPage)
+                        pageCount = pageCount + 1
+                    continue
+
+            with self._measureStage('plan_timing'):
+                timingPlan = planTimingFlow(processDict['items'])
+            processSheetList = list()
             for j, itemChunk in enumerate(itemChunkList):
-                itemSheet = self.workbook.copy_worksheet(templateSheet)
-                self._writeFormProcess(
-                    pageCount, totalProcess + totalChunk,
-                    j+1, totalChunk,
-                    processDict,
-                    itemSheet)
-                itemSheet.title = 'process-{}-{}'.format(
-                    i+1,
-                    j+1
-                )
-                self._writeProcessItem(
-                    itemChunkSize * (j),
-                    itemSheet,
-                    itemChunk,
-                    processDict['items']
-                )
+                with self._measureStage('copy_sheet'):
+                    itemSheet = pagePrototype.newPage(self.workbook, 'process-{}-{}'.format(
+                        i+1,
+                        j+1
+                    ))
+                with self._measureStage('write_process'):
+                    self._writeFormProcess(
+                        pageCount, totalProcess + totalChunk,
+                        j+1, totalChunk,
+                        processDict,
+                        itemSheet)
+                with self._measureStage('write_item'):
+                    self._writeProcessItem(
+                        itemChunkSize * (j),
+                        itemSheet,
+                        itemChunk,
+                        timingPlan.getPage(j)
+                    )
+                    if self.connectorMode == 'vector':
+                        replaceDashImages(itemSheet)
+                processSheetList.append(itemSheet)
+                self._countPage(itemSheet, len(itemChunk))
+                if self.progressCallback is not None:
+                    self.progressCallback(pageCount, totalPage)
                 pageCount = pageCount + 1
-        
-        self._saveWorkbook(fileName)
+
+            if sheetKey is not None:
+                with self._measureStage('sheet_cache'):
+                    self.sheetCache.put(sheetKey, self._dumpProcessSheets(processSheetList))
+
+        with self._measureStage('save'):
+            if fileName is None:
+                return self._saveWorkbookToBuffer()
+            self._saveWorkbook(fileName)
+
+    def _generateXml(self, fileName: str = None):
+        if fileName is None:
+            target = SpooledTemporaryFile(max_size=spoolMaxSize)
+        else:
+            target = getOutputFilePath(fileName)
+
+        self._bindItemBlock()
+        with self._measureStage('template_load'):
+            writer = XmlWorkbookWriter(self.templatePath, self.templateSheetName, self.workbook, target)
+        try:
+            prototypeSheet = writer.newPrototype()
+            self._writeFormHeader(self.dataDict, prototypeSheet)
+            with self._measureStage('copy_sheet'):
+                writer.setPrototype(prototypeSheet, [self._getFormLogo()])
+
+            processList = self.dataDict['processes']
+            totalProcess = len(processList)
+            totalPage = getTotalPage(processList)
+            pageCount = 1
+            for i, processDict in enumerate(processList):
+                itemChunkList = chunk(processDict['items'], itemChunkSize)
+                totalChunk = len(itemChunkList) if len(itemChunkList) > 1 else 1
+
+                with self._measureStage('plan_timing'):
+                    timingPlan = planTimingFlow(processDict['items'])
+                for j, itemChunk in enumerate(itemChunkList):
+                    with self._measureStage('copy_sheet'):
+                        itemSheet = writer.newPage('process-{}-{}'.format(
+                            i+1,
+                            j+1
+                        ))
+                    with self._measureStage('write_process'):
+                        self._writeFormProcess(
+                            pageCount, totalProcess + totalChunk,
+                            j+1, totalChunk,
+                            processDict,
+                            itemSheet)
+                    with self._measureStage('write_item'):
+                        self._writeProcessItem(
+                            itemChunkSize * (j),
+                            itemSheet,
+                            itemChunk,
+                            timingPlan.getPage(j)
+                        )
+                        if self.connectorMode == 'vector':
+                            replaceDashImages(itemSheet)
+                    with self._measureStage('save'):
+                        writer.writePage(itemSheet)
+                    self._countPage(itemSheet, len(itemChunk))
+                    if self.progressCallback is not None:
+                        self.progressCallback(pageCount, totalPage)
+                    pageCount = pageCount + 1
+
+            with self._measureStage('save'):
+                writer.close()
+        except Exception:
+            writer.abort()
+            if fileName is None:
+                target.close()
+            raise
+
+        if fileName is None:
+            target.seek(0)
+            return target
+
+    def _getProcessSheetKey(self, processIndex: int, pageStart: int, totalProcess: int, processDict: dict):
+        #   everything a process page depends on, its items, its position in
+        #   the page numbering and the header copied from the template sheet
+        headerDict = {k: v for k, v in self.dataDict.items() if k != 'processes'}
+        keyData = json.dumps(
+            [processIndex, pageStart, totalProcess, self.connectorMode, headerDict, processDict],
+            sort_keys=True,
+            separators=(',', ':'),
+            ensure_ascii=False
+        )
+        digest = hashlib.sha256()
+        digest.update(getTemplateCache(self.templatePath).getVersion().encode())
+        digest.update(b'\0')
+        digest.update('{}\0{}'.format(self.templateSheetName, self.assetMap.digest).encode())
+        digest.update(b'\0')
+        digest.update(keyData.encode())
+        return digest.hexdigest()
+
+    def _dumpProcessSheets(self, sheetList: list):
+        #   style ids are stable across workbooks cloned from the template
+        #   (see registerFormStyles), so the sheets can be pickled on their own
+        #   with the workbook and the template sheet kept as references
+        buffer = BytesIO()
+        _ProcessSheetPickler(buffer, self.workbook, sheetList).dump(sheetList)
+        return buffer.getvalue()
+
+    def _loadProcessSheets(self, payload: bytes):
+        sheetList = _ProcessSheetUnpickler(BytesIO(payload), self.workbook).load()
+        for sheet in sheetList:
+            self.workbook._add_sheet(sheet)
+        return sheetList
+
+    def _getFormLogo(self):
+        #   Add denso logo
+        densoIconImage = getImage(self.assetMap.logoPath)
+        h, w = densoIconImage.height, densoIconImage.width
+        size = XDRPositiveSize2D(p2e(w), p2e(h))
+        marker = AnchorMarker(
+            row=0,
+            col=0,
+        )
+        densoIconImage.anchor = OneCellAnchor(marker, size)
+        return densoIconImage
 
     def _writeFormHeader(self, headerDict: dict, sheet: Worksheet):
         #   Write check box
@@ -298,17 +544,6 @@ class PCSForm:
         sheet.cell(row=63, column=7).value = '                   Issue to ❑ Insp.    ❑ Prod.(___________)'
 
     def _writeFormProcess(self, idx: int, total: int, subIdx: int, subTotal: int, processDict: dict, sheet: Worksheet):
-        #   Add denso logo
-        densoIconImage = Image('images/denso-logo.png')
-        h, w = densoIconImage.height, densoIconImage.width
-        size = XDRPositiveSize2D(p2e(w), p2e(h))
-        marker = AnchorMarker(
-            row=0,
-            col=0,
-        )
-        densoIconImage.anchor = OneCellAnchor(marker, size)
-        sheet.add_image(densoIconImage)
-
         sheet.cell(row=2, column=15).value = 'Page  {} / {}'.format(
             idx,
             total
@@ -322,311 +557,48 @@ class PCSForm:
         sheet.cell(row=9, column=1).alignment = leftCenterAlignment
         sheet.cell(row=9, column=1).font = headerNormalStyle
 
-    def _writeProcessItem(self, startNumber:int, sheet: Worksheet, itemList: list, totalItemList: list):
-        startRow = 12
-        rowStep = 3
-        startSeparatorColumn = 3
-        endSeparatorColumn = 15
-        
-        isInheritGroup = False
-        groupDashValue = None
-        groupDashStart = None
-        groupDashLength = None
-
-        duringList = list()
-        beforeList = list()
-        afterList = list()
-
-        for i, itemDict in enumerate(totalItemList):
-            if itemDict['check_timing'] == 'During':
-                duringList.append(i)
-            elif itemDict['check_timing'] == 'Before':
-                beforeList.append(i)
-            elif itemDict['check_timing'] == 'After':
-                afterList.append(i)
-
-        #   Dash line
-        # vertDashImg = getVerticalDashLine(len(itemList) * 3, 11, 0, -3, 8)
-        # sheet.add_image(vertDashImg)
-
-        landProcessIndex = None
-        landProcessRow = None
-
-        if len(duringList) > 0:
-            if len(beforeList) == 0 and len(afterList) == 0:
-                landIndex = len(totalItemList) / 2
-                if landIndex < len(itemList) + startNumber - 1:
-                    horizontalControlItemImg = getHorizontalDashLine(
-                        startRow + (rowStep * (landIndex - startNumber)), 0, 7, 10
-                    )
-                    sheet.add_image(horizontalControlItemImg)
-                    landProcessRow = startRow + (rowStep * (landIndex - startNumber))
-                    landProcessIndex = int(landIndex)
-            
-            elif len(beforeList) == 0:
-                if startNumber == 0:
-                    horizontalControlItemImg = getHorizontalDashLine(
-                        startRow, 0, 7, 10
-                    )
-                    sheet.add_image(horizontalControlItemImg)
-                    landProcessRow = startRow
-                    landProcessIndex = 0
+    def _writeProcessItem(self, startNumber:int, sheet: Worksheet, itemList: list, placementList: list):
+        startRow = itemStartRow
+        rowStep = itemRowStep
 
+        #   Timing flow, planned once per process (see timing_plan), the
+        #   slot placements go in with their item
+        slotPlacementDict = dict()
+        for placement in placementList:
+            if placement.slot is None:
+                sheet.add_image(getTimingImage(placement))
             else:
-                landIndex = duringList[int(len(duringList) / 2)]
-                if landIndex < len(itemList) + startNumber - 1:
-                    horizontalControlItemImg = getHorizontalDashLine(
-                        startRow + (rowStep * (landIndex - startNumber)), 0, 7, 10
-                    )
-                    sheet.add_image(horizontalControlItemImg)
-                    landProcessRow = startRow + (rowStep * (landIndex - startNumber))
-                    landProcessIndex = int(landIndex)
-        else:
-            if len(beforeList) == 0:
-                if startNumber == 0:
-                    landProcessRow = startRow
-                    landProcessIndex = 0
-            elif len(afterList) == 0:
-                if startNumber > 0:
-                    landProcessRow = startRow + (rowStep * (len(itemList) - 1) + 1)
-                    landProcessIndex = len(itemList) - 1
-            else:
-                lastBefore = beforeList[-1]
-                firstAfterIndex = afterList[0]
-                landIndex = (lastBefore + firstAfterIndex) / 2
-
-                if landIndex < len(itemList) + startNumber - 1:
-                    landProcessRow = startRow + (rowStep * (landIndex - startNumber))
-                    landProcessIndex = int(landIndex)
-
-        def groupNodeList(nodeList: list):
-            groupDict = dict()
-            i = 0
-            for node in nodeList:
-                if groupDict.get(i, None) is None:
-                    groupDict[i] = [node]
-                else:
-                    if groupDict[i][-1] == node - 1:
-                        groupDict[i].append(node)
-                    else:
-                        i += 1
-                        groupDict[i] = [node]
-            return list(groupDict.values())
-
-        beforeGroup = groupNodeList(beforeList)
-        duringGroup = groupNodeList(duringList)
-        afterGroup = groupNodeList(afterList)
-
-        if  (len(duringGroup) > 0 and duringGroup[-1][-1] > (startNumber + 1) * itemChunkSize) or \
-            (len(beforeGroup) > 0 and beforeGroup[-1][-1] > (startNumber + 1) * itemChunkSize) or \
-            (len(afterGroup) > 0 and afterGroup[-1][-1] > (startNumber + 1) * itemChunkSize):
-            vertDashImg = getVerticalDashLine((itemChunkSize - landProcessIndex) * 2.88, startRow + (landProcessIndex * rowStep), 0, 8, 8)
-            sheet.add_image(vertDashImg)
-
-        for duringNodeList in duringGroup:
-            drawLineLength = None
-            drawLineRow = None
-            drawConnectorRow = None
-            vertRowOff = 8
-            vertColOff = 8
-
-            if len(duringNodeList) == 1:
-                if (duringNodeList[0] < len(itemList) + startNumber):
-                    drawConnectorRow = startRow + (rowStep * (duringNodeList[0] - startNumber))
-                
-                if landProcessIndex < startNumber:
-                    if duringNodeList[0] >= startNumber:
-                        adjustedValue = duringNodeList[0] - startNumber + 1
-                        drawLineLength = ((adjustedValue - 1) * 2.99 if adjustedValue > 0 else 0) + 1.5
-                        drawLineRow = startRow - 1
-                        vertRowOff = 0
-
-            if  drawLineLength is not None and \
-                drawLineRow is not None:
-                vertDashImg = getVerticalDashLine(drawLineLength, drawLineRow, 0, vertRowOff, vertColOff)
-                sheet.add_image(vertDashImg)
-            
-            if drawConnectorRow is not None:
-                horizontalControlItemImg = getHorizontalDashLine(
-                    drawConnectorRow, 0, 7, 10
-                )
-                sheet.add_image(horizontalControlItemImg)
-
-        for afterNodeList in afterGroup:
-            drawLineLength = None
-            drawLineRow = None
-            drawConnectorRow = None
-            vertRowOff = 8
-            vertColOff = 8
-
-            afterCenterValue = afterNodeList[0] if len(afterNodeList) == 1 else afterNodeList[int(len(afterNodeList) / 2)]
-            if landProcessIndex >= startNumber:
-                drawLineLength = (afterCenterValue - landProcessIndex) * 2.99
-                drawLineRow = startRow + (rowStep * landProcessIndex)
-                drawConnectorRow = startRow + (rowStep * afterCenterValue)
-            elif afterNodeList[-1] >= startNumber:
-                adjustedCenterValue = ((afterCenterValue if afterCenterValue >= startNumber else startNumber) - startNumber)
-                drawLineLength = ((adjustedCenterValue - 1) * 2.99 if adjustedCenterValue > 0 else 0) + 1.5
-                drawLineRow = startRow - 1
-                drawConnectorRow = startRow + (rowStep * adjustedCenterValue)
-                vertRowOff = 0
-
-            if  drawLineLength is not None and \
-                drawLineRow is not None:
-                vertDashImg = getVerticalDashLine(drawLineLength, drawLineRow, 0, vertRowOff, vertColOff)
-                sheet.add_image(vertDashImg)
-            
-            if drawConnectorRow is not None:
-                horizontalControlItemImg = getHorizontalDashLine(
-                    drawConnectorRow, 0, 7, 10
-                )
-                sheet.add_image(horizontalControlItemImg)
-
-        for beforeNodeList in beforeGroup:
-            drawLineLength = None
-            drawLineRow = None
-            drawConnectorRow = None
-
-            beforeCenterValue = beforeNodeList[0] if len(beforeNodeList) == 1 else beforeNodeList[int(len(beforeNodeList) / 2)]
-            if landProcessIndex >= startNumber:
-                drawLineLength = abs(beforeCenterValue - landProcessIndex) * 2.99
-                drawLineRow = startRow + (rowStep * beforeCenterValue)
-                drawConnectorRow = startRow + (rowStep * beforeCenterValue)
-            elif beforeNodeList[-1] >= startNumber:
-                adjustedCenterValue = ((beforeCenterValue if beforeCenterValue >= startNumber else startNumber) - startNumber)
-                drawLineLength = ((adjustedCenterValue - 1) * 2.99 if adjustedCenterValue > 0 else 0) + 1.5
-                drawLineRow = startRow
-                drawConnectorRow = startRow + (rowStep * beforeCenterValue)
-
-            if  drawLineLength is not None and \
-                drawLineRow is not None:
-                vertDashImg = getVerticalDashLine(drawLineLength, drawLineRow, 0, 8, 8)
-                sheet.add_image(vertDashImg)
-            if drawConnectorRow is not None:
-                horizontalControlItemImg = getHorizontalDashLine(
-                    drawConnectorRow, 0, 7, 10
-                )
-                sheet.add_image(horizontalControlItemImg)
-
-        checkProcessImage = getCheckProcess(
-            landProcessRow, 0, 0, 0
-        )
-        sheet.add_image(checkProcessImage)
+                slotPlacementDict.setdefault(placement.slot, []).append(placement)
 
-        for i, item in enumerate(itemList):
-            #   Cell merging
-            sheet.merge_cells('E{}:H{}'.format(startRow + (rowStep * i), startRow + (rowStep * i)+1))
-            sheet.merge_cells('E{}:H{}'.format(startRow + (rowStep * i) + 2, startRow + (rowStep * i) + 2))
-            sheet.merge_cells('I{}:I{}'.format(startRow + (rowStep * i), startRow + (rowStep * i)+1))
-            sheet.merge_cells('J{}:J{}'.format(startRow + (rowStep * i), startRow + (rowStep * i)+1))
-            sheet.merge_cells('K{}:K{}'.format(startRow + (rowStep * i), startRow + (rowStep * i)+1))
-            sheet.merge_cells('L{}:L{}'.format(startRow + (rowStep * i), startRow + (rowStep * i)+2))
-            sheet.merge_cells('M{}:N{}'.format(startRow + (rowStep * i), startRow + (rowStep * i) + 2))
-            sheet.merge_cells('O{}:O{}'.format(startRow + (rowStep * i), startRow + (rowStep * i) + 2))
+        #   page wide merges, done once and only on pages holding items
+        if len(itemList) > 0:
             sheet.merge_cells('M7:O7')
             sheet.merge_cells('A9:G9')
 
-            #   Cell bordering
-            sheet.cell(row=startRow + (rowStep * i) + 1, column=5).border = bottomBorder
-            sheet.cell(row=startRow + (rowStep * i) + 1, column=9).border = bottomBorder
-            sheet.cell(row=startRow + (rowStep * i) + 1, column=10).border = bottomBorder
-            sheet.cell(row=startRow + (rowStep * i) + 1, column=11).border = bottomBorder
-            for j in range(endSeparatorColumn - startSeparatorColumn):
-                sheet.cell(row=startRow + (rowStep * i) + 2, column=startSeparatorColumn + j + 1).border = bottomRightBorder
+        itemBlock = getItemBlock(self.templatePath, self.templateSheetName)
+
+        for i, item in enumerate(itemList):
+            #   merges, borders, fonts and alignments of the slot are pre-stamped
+            itemBlock.stamp(sheet, i, self._itemStyleList)
 
             #   Cell values
             sheet.cell(row=startRow + (rowStep * i), column=4).value = startNumber + (i + 1)
-            sheet.cell(row=startRow + (rowStep * i), column=4).alignment = centerCenterAlignment
-            sheet.cell(row=startRow + (rowStep * i), column=4).font = textNormalStyle
             sheet.cell(row=(startRow + (rowStep * i)), column=5).value = getParameter(item['parameter'])
-            sheet.cell(row=(startRow + (rowStep * i)), column=5).font = textNormalStyle
             sheet.cell(row=(startRow + (rowStep * i) + 2), column=5).value = getMeasurement(item)
-            sheet.cell(row=(startRow + (rowStep * i) + 2), column=5).font = textNormalStyle
-            sheet.cell(row=(startRow + (rowStep * i)), column=5).alignment = topLeftAlignment
             sheet.cell(row=(startRow + (rowStep * i)), column=9).value = getInterval(item['control_method'])
-            sheet.cell(row=(startRow + (rowStep * i)), column=9).font = textNormalStyle
-            sheet.cell(row=(startRow + (rowStep * i)), column=9).alignment = topCenterAlignment
             sheet.cell(row=(startRow + (rowStep * i) + 2), column=9).value = item['control_method'].get('calibration_interval', '')
-            sheet.cell(row=(startRow + (rowStep * i) + 2), column=9).alignment = centerCenterAlignment
-            sheet.cell(row=(startRow + (rowStep * i) + 2), column=9).font = textNormalStyle
             sheet.cell(row=(startRow + (rowStep * i)), column=10).value = getControlMethod(item)
-            sheet.cell(row=(startRow + (rowStep * i)), column=10).alignment = centerCenterAlignment
-            sheet.cell(row=(startRow + (rowStep * i)), column=10).font = textNormalStyle
             sheet.cell(row=(startRow + (rowStep * i)) + 2, column=10).value = getControlMethodDetail(item['control_method'])
-            sheet.cell(row=(startRow + (rowStep * i)) + 2, column=10).alignment = centerCenterAlignment
-            sheet.cell(row=(startRow + (rowStep * i)) + 2, column=10).font = textNormalStyle
             sheet.cell(row=(startRow + (rowStep * i)), column=11).value = item['control_method']['in_charge']
-            sheet.cell(row=(startRow + (rowStep * i)), column=11).alignment = centerCenterAlignment
-            sheet.cell(row=(startRow + (rowStep * i)), column=11).font = textNormalStyle
             sheet.cell(row=(startRow + (rowStep * i)), column=12).value = getProcessCapability(item['initial_p_capability'])
-            sheet.cell(row=(startRow + (rowStep * i)), column=12).font = textNormalStyle
             sheet.cell(row=(startRow + (rowStep * i)), column=13).value = item['remark']['remark']
-            sheet.cell(row=(startRow + (rowStep * i)), column=13).alignment = topLeftAlignment
-            sheet.cell(row=(startRow + (rowStep * i)), column=13).font = textNormalStyle
             sheet.cell(row=(startRow + (rowStep * i)), column=15).value = item['remark']['ws_no']
-            sheet.cell(row=(startRow + (rowStep * i)), column=15).alignment = centerCenterAlignment
-            sheet.cell(row=(startRow + (rowStep * i)), column=15).font = textNormalStyle
 
             #   Imaging
+            for placement in slotPlacementDict.get(i, ()):
+                sheet.add_image(getTimingImage(placement))
 
-            #   Grouping
-            currentIndexInTotal = i + startNumber
-            if i == 0 and startNumber != 0 and totalItemList[currentIndexInTotal - 1]['check_timing'] == item['check_timing']:
-                groupDashValue = item['check_timing']
-                groupDashStart = 0
-                groupDashLength = 0
-                isInheritGroup = True
-
-            if groupDashValue == item['check_timing']:
-                groupDashLength += 1
-
-            if groupDashValue is None:
-                groupDashValue = item['check_timing']
-                groupDashStart = i
-                groupDashLength = 1
-            
-            if currentIndexInTotal + 1 >= len(totalItemList):
-                if groupDashLength > 1:
-                    if isInheritGroup:
-                        print('in')
-                        vertDashImg = getVerticalDashLine((groupDashLength * 2.99) - 3 + 1.5, startRow + (rowStep * groupDashStart), 1, 8 - 28, 4)
-                    else:
-                        vertDashImg = getVerticalDashLine((groupDashLength * 2.99) - 3, startRow + (rowStep * groupDashStart), 1, 8, 4)
-                    sheet.add_image(vertDashImg)
-                groupDashValue = None
-                groupDashStart = None
-                groupDashLength = None
-                isInheritGroup = False
-
-            elif i + 1 >= len(itemList):
-                if groupDashLength > 1:
-                    if isInheritGroup:
-                        print('in')
-                        vertDashImg = getVerticalDashLine((groupDashLength * 2.99) - 3 + 1.5 + 1.5 if currentIndexInTotal + 1 < len(totalItemList) and groupDashValue == totalItemList[currentIndexInTotal + 1]['check_timing'] else 0, startRow + (rowStep * groupDashStart), 1, 8 - 28, 4)
-                    else:
-                        vertDashImg = getVerticalDashLine((groupDashLength * 2.99) - 3 + 1.5 if currentIndexInTotal + 1 < len(totalItemList) and groupDashValue == totalItemList[currentIndexInTotal + 1]['check_timing'] else 0, startRow + (rowStep * groupDashStart), 1, 8, 4)
-
-                    sheet.add_image(vertDashImg)
-                groupDashValue = None
-                groupDashStart = None
-                groupDashLength = None
-                isInheritGroup = False
-
-            elif i + 1 < len(itemList):
-                if itemList[i + 1]['check_timing'] != groupDashValue:
-                    if groupDashLength > 1:
-                        if isInheritGroup:
-                            print('in')
-                            vertDashImg = getVerticalDashLine((groupDashLength * 2.99) - 3 + 1.5, startRow + (rowStep * groupDashStart), 1, 8 - 28, 4)
-                        else:
-                            vertDashImg = getVerticalDashLine((groupDashLength * 2.99) - 3, startRow + (rowStep * groupDashStart), 1, 8, 4)
-                        sheet.add_image(vertDashImg)
-                    groupDashValue = None
-                    groupDashStart = None
-                    groupDashLength = None
-                    isInheritGroup = False
-
-            scSymbolImgList = getSCSymbolList(item['sc_symbols'], startRow + (rowStep * i), 3)
+            scSymbolImgList = getSCSymbolList(item['sc_symbols'], startRow + (rowStep * i), scSymbolPerItemLimit, self.assetMap.scSymbolPathMap)
             for scSymbol in scSymbolImgList:
                 sheet.add_image(scSymbol)
 
@@ -635,17 +607,30 @@ class PCSForm:
             )
             sheet.add_image(horizontalControlItemImg)
 
-            totalScSymbolList = getTotalSCSymbolList(itemList)
-            for totalScSymbol in totalScSymbolList:
-                sheet.add_image(totalScSymbol)
-
             controlItemSymbolImg = getCheckTimingSymbol(
                 item['control_item_type'],
-                startRow + (rowStep * i), 1, 0, 10)
+                startRow + (rowStep * i), 1, 0, 10, self.assetMap.checkTimingSymbolPathMap)
             sheet.add_image(controlItemSymbolImg)
 
+        #   SC symbol summary covers the whole page, draw it once
+        totalScSymbolList = getTotalSCSymbolList(itemList, self.assetMap)
+        for totalScSymbol in totalScSymbolList:
+            sheet.add_image(totalScSymbol)
+
     def _saveWorkbook(self, fileName: str):
         templateSheet = self.workbook[self.templateSheetName]
         self.workbook.remove(templateSheet)
-        self.workbook.save(getOutputFilePath(fileName))
+        saveWorkbook(self.workbook, getOutputFilePath(fileName))
+
+    def _saveWorkbookToBuffer(self):
+        templateSheet = self.workbook[self.templateSheetName]
+        self.workbook.remove(templateSheet)
+        buffer = SpooledTemporaryFile(max_size=spoolMaxSize)
+        try:
+            saveWorkbook(self.workbook, buffer)
+        except Exception:
+            buffer.close()
+            raise
+        buffer.seek(0)
+        return buffer
         
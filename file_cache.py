@@ -0,0 +1,55 @@
+import os
+import gzip
+import json
+import hashlib
+import threading
+
+#   Encoded copy of a JSON file for endpoints that serve it as is, the file
+#   is parsed and encoded again only when its mtime or size changes
+
+def isGzipAccepted(acceptEncoding: str):
+    if acceptEncoding is None:
+        return False
+    for coding in acceptEncoding.split(','):
+        name, _, params = coding.strip().partition(';')
+        if name.strip().lower() not in ['gzip', '*']:
+            continue
+        quality = params.strip()
+        if quality.startswith('q='):
+            try:
+                return float(quality[2:]) > 0
+            except ValueError:
+                return False
+        return True
+    return False
+
+class EncodedJson:
+    def __init__(self, body: bytes):
+        #   same encoding as fastapi's JSONResponse
+        self.body = body
+        self.gzipBody = gzip.compress(body, mtime=0)
+        self.etag = '"{}"'.format(hashlib.sha1(body).hexdigest())
+
+class JsonFileCache:
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._state = None
+
+    def _load(self, fileKey: tuple):
+        with open(self.path, 'rb') as f:
+            data = json.load(f)
+        body = json.dumps(data, ensure_ascii=False, allow_nan=False, indent=None, separators=(',', ':')).encode('utf-8')
+        self._state = (fileKey, EncodedJson(body))
+
+    def get(self):
+        fileStat = os.stat(self.path)
+        fileKey = (fileStat.st_mtime_ns, fileStat.st_size)
+        state = self._state
+        if state is None or state[0] != fileKey:
+            with self._lock:
+                state = self._state
+                if state is None or state[0] != fileKey:
+                    self._load(fileKey)
+                    state = self._state
+        return state[1]
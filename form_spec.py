@@ -0,0 +1,118 @@
+import json
+import hashlib
+
+#   What a PCS form page can hold, shared by the renderer and the payload
+#   schema. Kept free of openpyxl so validation does not need it
+
+#   every item takes itemRowStep rows starting at itemStartRow and a page
+#   holds itemSlotCount of them
+itemStartRow = 12
+itemRowStep = 3
+itemSlotCount = 17
+#   sc symbols of an item are stacked one per row of its slot
+scSymbolPerItemLimit = itemRowStep
+
+checkTimingList = ['Before', 'During', 'After']
+
+counterPathMap = {
+    1: 'images/counter/1.png',
+    2: 'images/counter/2.png',
+    3: 'images/counter/3.png',
+    4: 'images/counter/4.png',
+    5: 'images/counter/5.png',
+    6: 'images/counter/6.png',
+    7: 'images/counter/7.png',
+    8: 'images/counter/8.png',
+    9: 'images/counter/9.png',
+    10: 'images/counter/10.png',
+    11: 'images/counter/11.png',
+    12: 'images/counter/12.png',
+    13: 'images/counter/13.png',
+    14: 'images/counter/14.png',
+    15: 'images/counter/15.png',
+    16: 'images/counter/16.png',
+}
+
+checkTimingSymbolPathMap = {
+    'None': 'images/timing/check-no-record.png',
+    'Check sheet': 'images/timing/check-record.png',
+    'Record sheet': 'images/timing/check-record.png',
+    'x-R chart': 'images/timing/check-control-chart.png',
+    'xbar-R chart': 'images/timing/check-control-chart.png',
+    'x-Rs chart': 'images/timing/check-control-chart.png',
+}
+
+scSymbolPathMap = {
+    'C-none': 'images/symbols/C-none.png',
+    'S-circle': 'images/symbols/S-circle.png',
+    'S-diamond': 'images/symbols/S-diamond.png',
+    'F-circle': 'images/symbols/F-circle.png',
+    'F-triangle': 'images/symbols/F-triangle.png',
+    'RW-rectangle': 'images/symbols/RW-rectangle.png',
+    'SP-circle': 'images/symbols/SP-circle.png'
+}
+
+defaultLogoPath = 'images/denso-logo.png'
+#   sheet of the template workbook every page is copied from
+defaultTemplateSheetName = 'empty'
+
+class AssetMap:
+    #   Images a form template draws with. The keys are the ones above, the
+    #   payload schema checks symbols against them, a template revision can
+    #   only point them at other images
+    def __init__(self, counterPathMap: dict, checkTimingSymbolPathMap: dict, scSymbolPathMap: dict, logoPath: str):
+        self.counterPathMap = counterPathMap
+        self.checkTimingSymbolPathMap = checkTimingSymbolPathMap
+        self.scSymbolPathMap = scSymbolPathMap
+        self.logoPath = logoPath
+        self.digest = hashlib.sha1(json.dumps(self.toDict(), sort_keys=True).encode()).hexdigest()
+
+    def toDict(self):
+        return {
+            'counter': {str(count): path for count, path in self.counterPathMap.items()},
+            'check_timing_symbol': dict(self.checkTimingSymbolPathMap),
+            'sc_symbol': dict(self.scSymbolPathMap),
+            'logo': self.logoPath
+        }
+
+    def getPathList(self):
+        pathList = [self.logoPath]
+        for pathMap in [self.counterPathMap, self.checkTimingSymbolPathMap, self.scSymbolPathMap]:
+            pathList.extend(pathMap.values())
+        return sorted(set(pathList))
+
+    def override(self, assetDict: dict):
+        #   assetDict is shaped like toDict(), the keys it leaves out keep
+        #   their current image. Raises ValueError on unknown keys
+        unknownList = [name for name in assetDict if name not in ['counter', 'check_timing_symbol', 'sc_symbol', 'logo']]
+        if unknownList:
+            raise ValueError('Unknown asset maps, {}'.format(', '.join(unknownList)))
+
+        def overrideMap(pathMap: dict, name: str, parseKey = str):
+            overrideDict = assetDict.get(name, {})
+            if not isinstance(overrideDict, dict):
+                raise ValueError('Asset map {} must be an object'.format(name))
+            newMap = dict(pathMap)
+            for key, path in overrideDict.items():
+                try:
+                    key = parseKey(key)
+                except ValueError:
+                    raise ValueError('Unknown {} key, {}'.format(name, key))
+                if key not in pathMap:
+                    raise ValueError('Unknown {} key, {}'.format(name, key))
+                if not isinstance(path, str):
+                    raise ValueError('{} {} must be an image path'.format(name, key))
+                newMap[key] = path
+            return newMap
+
+        logoPath = assetDict.get('logo', self.logoPath)
+        if not isinstance(logoPath, str):
+            raise ValueError('logo must be an image path')
+        return AssetMap(
+            overrideMap(self.counterPathMap, 'counter', int),
+            overrideMap(self.checkTimingSymbolPathMap, 'check_timing_symbol'),
+            overrideMap(self.scSymbolPathMap, 'sc_symbol'),
+            logoPath
+        )
+
+defaultAssetMap = AssetMap(counterPathMap, checkTimingSymbolPathMap, scSymbolPathMap, defaultLogoPath)
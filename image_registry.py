@@ -0,0 +1,63 @@
+import os
+import hashlib
+import threading
+from io import BytesIO
+from PIL import Image as PILImage
+from openpyxl.drawing.image import Image
+
+imageRootDir = 'images'
+
+class ImageAsset:
+    def __init__(self, data: bytes):
+        self.data = data
+        self.digest = hashlib.sha1(data).hexdigest()
+        with PILImage.open(BytesIO(data)) as image:
+            self.width, self.height = image.size
+            self.format = image.format.lower() if image.format else 'png'
+
+class AssetImage(Image):
+    #   openpyxl image backed by an in-memory asset, no file or PIL access
+    #   happens per placement
+    def __init__(self, asset: ImageAsset):
+        self.ref = asset
+        self.digest = asset.digest
+        self.width, self.height = asset.width, asset.height
+        self.format = asset.format
+
+    def _data(self):
+        return self.ref.data
+
+class ImageRegistry:
+    def __init__(self, rootDir: str):
+        self.rootDir = rootDir
+        self._lock = threading.Lock()
+        self._assetDict = dict()
+
+    def _loadAsset(self, path: str):
+        with open(path, 'rb') as f:
+            return ImageAsset(f.read())
+
+    def preload(self):
+        for dirPath, _, fileNameList in os.walk(self.rootDir):
+            for fileName in fileNameList:
+                if fileName.lower().endswith('.png'):
+                    self.getAsset(os.path.join(dirPath, fileName))
+
+    def getAsset(self, path: str):
+        key = os.path.normpath(path)
+        asset = self._assetDict.get(key, None)
+        if asset is None:
+            with self._lock:
+                asset = self._assetDict.get(key, None)
+                if asset is None:
+                    asset = self._loadAsset(path)
+                    self._assetDict[key] = asset
+        return asset
+
+    def getImage(self, path: str):
+        return AssetImage(self.getAsset(path))
+
+imageRegistry = ImageRegistry(imageRootDir)
+
+def getImage(path: str):
+    return imageRegistry.getImage(path)
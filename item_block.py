@@ -0,0 +1,154 @@
+import os
+import threading
+from copy import copy
+from openpyxl.cell.cell import MergedCell
+from openpyxl.styles.cell_style import StyleArray
+from openpyxl.worksheet.cell_range import CellRange
+from template_cache import getTemplateCache
+from form_spec import itemStartRow, itemRowStep, itemSlotCount
+from utils import (
+    centerCenterAlignment,
+    topCenterAlignment,
+    topLeftAlignment,
+    textNormalStyle,
+    bottomBorder,
+    bottomRightBorder
+)
+
+#   Layout of the control item slots, see form_spec for the slot rows
+startSeparatorColumn = 3
+endSeparatorColumn = 15
+
+def getItemSlotRow(slotIndex: int):
+    return itemStartRow + (itemRowStep * slotIndex)
+
+def _layoutItemSlot(sheet, slotIndex: int):
+    row = getItemSlotRow(slotIndex)
+
+    #   Cell merging
+    sheet.merge_cells('E{}:H{}'.format(row, row + 1))
+    sheet.merge_cells('E{}:H{}'.format(row + 2, row + 2))
+    sheet.merge_cells('I{}:I{}'.format(row, row + 1))
+    sheet.merge_cells('J{}:J{}'.format(row, row + 1))
+    sheet.merge_cells('K{}:K{}'.format(row, row + 1))
+    sheet.merge_cells('L{}:L{}'.format(row, row + 2))
+    sheet.merge_cells('M{}:N{}'.format(row, row + 2))
+    sheet.merge_cells('O{}:O{}'.format(row, row + 2))
+
+    #   Cell bordering
+    sheet.cell(row=row + 1, column=5).border = bottomBorder
+    sheet.cell(row=row + 1, column=9).border = bottomBorder
+    sheet.cell(row=row + 1, column=10).border = bottomBorder
+    sheet.cell(row=row + 1, column=11).border = bottomBorder
+    for j in range(endSeparatorColumn - startSeparatorColumn):
+        sheet.cell(row=row + 2, column=startSeparatorColumn + j + 1).border = bottomRightBorder
+
+    #   Cell styles
+    for col, alignment in [(4, centerCenterAlignment), (5, topLeftAlignment), (9, topCenterAlignment), (10, centerCenterAlignment),
+                           (11, centerCenterAlignment), (12, None), (13, topLeftAlignment), (15, centerCenterAlignment)]:
+        sheet.cell(row=row, column=col).font = textNormalStyle
+        if alignment is not None:
+            sheet.cell(row=row, column=col).alignment = alignment
+    for col, alignment in [(5, None), (9, centerCenterAlignment), (10, centerCenterAlignment)]:
+        sheet.cell(row=row + 2, column=col).font = textNormalStyle
+        if alignment is not None:
+            sheet.cell(row=row + 2, column=col).alignment = alignment
+
+class ItemBlock:
+    #   The slot layout is stamped once on a scratch copy of the template
+    #   sheet and recorded as the final style of every cell it changes, a
+    #   page copies the recorded styles instead of redoing the merges and
+    #   the border arithmetic for every item
+    def __init__(self, templatePath: str, templateSheetName: str):
+        self.version = getTemplateCache(templatePath).getVersion()
+        workbook = getTemplateCache(templatePath).getWorkbook()
+        templateSheet = workbook[templateSheetName]
+        scratchSheet = workbook.copy_worksheet(templateSheet)
+
+        templateRangeList = list(scratchSheet.merged_cells.ranges)
+        beforeDict = {key: (type(cell), copy(cell._style)) for key, cell in scratchSheet._cells.items()}
+        for slotIndex in range(itemSlotCount):
+            _layoutItemSlot(scratchSheet, slotIndex)
+
+        self.styleSpecList = list()
+        styleSpecIndexDict = dict()
+        self.slotCellList = [list() for _ in range(itemSlotCount)]
+        self.slotRangeList = [list() for _ in range(itemSlotCount)]
+        for (row, col), cell in sorted(scratchSheet._cells.items()):
+            slotIndex = (row - itemStartRow) // itemRowStep
+            if row < itemStartRow or slotIndex >= itemSlotCount:
+                continue
+            isMerged = isinstance(cell, MergedCell)
+            if beforeDict.get((row, col), None) == (type(cell), cell._style):
+                continue
+            styleSpec = self._getStyleSpec(workbook, cell._style)
+            styleSpecIndex = styleSpecIndexDict.get(styleSpec, None)
+            if styleSpecIndex is None:
+                styleSpecIndex = len(self.styleSpecList)
+                styleSpecIndexDict[styleSpec] = styleSpecIndex
+                self.styleSpecList.append(styleSpec)
+            self.slotCellList[slotIndex].append((row, col, isMerged, styleSpecIndex))
+
+        for mergedRange in scratchSheet.merged_cells.ranges[len(templateRangeList):]:
+            for templateRange in templateRangeList:
+                if not mergedRange.isdisjoint(templateRange):
+                    raise ValueError('Template merged cells {} overlap the item slots'.format(templateRange.coord))
+            self.slotRangeList[(mergedRange.min_row - itemStartRow) // itemRowStep].append(mergedRange.coord)
+
+    def _getStyleSpec(self, workbook, styleArray: StyleArray):
+        #   style ids only mean something inside one workbook, keep the objects
+        return (
+            workbook._fonts[styleArray.fontId],
+            workbook._fills[styleArray.fillId],
+            workbook._borders[styleArray.borderId],
+            styleArray.numFmtId,
+            workbook._protections[styleArray.protectionId],
+            workbook._alignments[styleArray.alignmentId],
+            styleArray.pivotButton,
+            styleArray.quotePrefix,
+            styleArray.xfId
+        )
+
+    def bind(self, workbook):
+        #   register the recorded styles in a workbook cloned from the same
+        #   template, returns the style arrays stamp() expects
+        styleList = list()
+        for font, fill, border, numFmtId, protection, alignment, pivotButton, quotePrefix, xfId in self.styleSpecList:
+            styleList.append(StyleArray([
+                workbook._fonts.add(font),
+                workbook._fills.add(fill),
+                workbook._borders.add(border),
+                numFmtId,
+                workbook._protections.add(protection),
+                workbook._alignments.add(alignment),
+                pivotButton,
+                quotePrefix,
+                xfId
+            ]))
+        return styleList
+
+    def stamp(self, sheet, slotIndex: int, styleList: list):
+        for row, col, isMerged, styleSpecIndex in self.slotCellList[slotIndex]:
+            if isMerged:
+                cell = MergedCell(sheet, row, col)
+                sheet._cells[(row, col)] = cell
+            else:
+                cell = sheet.cell(row=row, column=col)
+            cell._style = copy(styleList[styleSpecIndex])
+        #   slot ranges never overlap each other or the template ones, skip
+        #   the containment check of MultiCellRange.add
+        for coord in self.slotRangeList[slotIndex]:
+            sheet.merged_cells.ranges.append(CellRange(coord))
+
+_itemBlockDict = dict()
+_itemBlockLock = threading.Lock()
+
+def getItemBlock(templatePath: str, templateSheetName: str):
+    key = (os.path.abspath(templatePath), templateSheetName)
+    version = getTemplateCache(templatePath).getVersion()
+    with _itemBlockLock:
+        itemBlock = _itemBlockDict.get(key, None)
+        if itemBlock is None or itemBlock.version != version:
+            itemBlock = ItemBlock(templatePath, templateSheetName)
+            _itemBlockDict[key] = itemBlock
+    return itemBlock
@@ -0,0 +1,102 @@
+import os
+import time
+import uuid
+import shutil
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+class JobQueueFullError(Exception):
+    pass
+
+class Job:
+    def __init__(self):
+        self.id = str(uuid.uuid4())
+        self.status = 'queued'
+        self.renderedPage = 0
+        self.totalPage = None
+        self.error = None
+        self.resultPath = None
+        self.createdAt = time.time()
+        self.finishedAt = None
+        self.profileId = None
+
+    def updateProgress(self, renderedPage: int, totalPage: int):
+        self.renderedPage = renderedPage
+        self.totalPage = totalPage
+
+    def toDict(self):
+        return {
+            'job_id': self.id,
+            'status': self.status,
+            'rendered_page': self.renderedPage,
+            'total_page': self.totalPage,
+            'error': self.error,
+            'profile_id': self.profileId
+        }
+
+class JobManager:
+    #   Local job backend, a bounded thread pool fed by the executor's
+    #   in-process queue. Finished results are kept as temp files and
+    #   removed once they are older than resultTTL seconds
+    def __init__(self, maxWorkers: int, maxQueued: int, resultTTL: float):
+        self.maxQueued = maxQueued
+        self.resultTTL = resultTTL
+        self._executor = ThreadPoolExecutor(max_workers=maxWorkers, thread_name_prefix='pcs-job')
+        self._lock = threading.Lock()
+        self._jobDict = dict()
+        self._pendingCount = 0
+
+    def submit(self, renderFunc):
+        #   renderFunc(job) renders the workbook and returns a readable
+        #   file object, it may report progress via job.updateProgress
+        self._purgeExpired()
+        job = Job()
+        with self._lock:
+            if self._pendingCount >= self.maxQueued:
+                raise JobQueueFullError('Job queue is full')
+            self._pendingCount += 1
+            self._jobDict[job.id] = job
+        self._executor.submit(self._run, job, renderFunc)
+        return job
+
+    def get(self, jobId: str):
+        self._purgeExpired()
+        return self._jobDict.get(jobId, None)
+
+    def _run(self, job: Job, renderFunc):
+        job.status = 'running'
+        try:
+            result = renderFunc(job)
+            fd, resultPath = tempfile.mkstemp(prefix='pcs-job-', suffix='.xlsx')
+            with os.fdopen(fd, 'wb') as f, result:
+                shutil.copyfileobj(result, f)
+            job.resultPath = resultPath
+            job.status = 'done'
+        except Exception as e:
+            job.error = '{}: {}'.format(type(e).__name__, e)
+            job.status = 'failed'
+        finally:
+            job.finishedAt = time.time()
+            with self._lock:
+                self._pendingCount -= 1
+
+    def _purgeExpired(self):
+        now = time.time()
+        expiredJobList = list()
+        with self._lock:
+            for jobId, job in list(self._jobDict.items()):
+                if job.finishedAt is not None and now - job.finishedAt > self.resultTTL:
+                    expiredJobList.append(self._jobDict.pop(jobId))
+        for job in expiredJobList:
+            if job.resultPath is not None and os.path.exists(job.resultPath):
+                os.remove(job.resultPath)
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
+        with self._lock:
+            jobList = list(self._jobDict.values())
+            self._jobDict.clear()
+        for job in jobList:
+            if job.resultPath is not None and os.path.exists(job.resultPath):
+                os.remove(job.resultPath)
@@ -1,22 +1,130 @@
-from fastapi import FastAPI, File, HTTPException, Depends
-from fastapi.responses import FileResponse
+from fastapi import FastAPI, File, HTTPException, Depends, Header, Request
+from fastapi.responses import FileResponse, StreamingResponse, Response, JSONResponse
 from fastapi.security import APIKeyHeader
 from fastapi.middleware.cors import CORSMiddleware
-from typing import List, Dict, Union
-from pydantic import BaseModel
+from fastapi.exceptions import RequestValidationError
+from typing import Optional
+from pydantic import BaseModel, ValidationError
 from starlette import status
+from starlette.concurrency import run_in_threadpool
+from starlette.routing import Match
+import os
+import time
 import uuid
 import openpyxl
-import json
 from dotenv import dotenv_values
-from e_pcs_form import PCSForm
+from e_pcs_form import PCSForm, getTotalPage
+from connector_shape import connectorModeList
+from template_registry import TemplateRegistry, FormTemplate
+from utils import iterFileChunks
+from jobs import JobManager, JobQueueFullError
+from render_pool import RenderPool, renderWorkbookBytes
+from batch import iterBatchZip
+from result_cache import ResultCache, getResultKey, isETagMatched
+from concurrent.futures import ThreadPoolExecutor, Future
+from image_registry import imageRegistry
+from profiler import ProfileStore
+from schemas import decodeDocument, decodeDocumentList, InvalidDocumentError
+from file_cache import JsonFileCache, isGzipAccepted
+from render_plan import planRender
+from admission import AdmissionController, AdmissionRejectedError, RenderCost
+from metrics import metricsRegistry, metricsContentType, httpRequestsInFlight, httpRequestsTotal, httpRequestSeconds
 
 # load config from .env to get X-API-KEY list
 config = dotenv_values(".env")
 api_keys = config['X_API_KEY']
 X_API_KEY = APIKeyHeader(name='X-API-Key')
+# "stream" sends the workbook from memory, "file" keeps the old output/ files
+outputMode = config.get('OUTPUT_MODE', 'stream')
+xlsxMediaType = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+jobManager = JobManager(
+    maxWorkers=int(config.get('JOB_WORKERS', 2)),
+    maxQueued=int(config.get('JOB_QUEUE_SIZE', 32)),
+    resultTTL=float(config.get('JOB_RESULT_TTL', 3600))
+)
+# number of warm render processes, 0 renders inside the request thread
+renderWorkers = int(config.get('RENDER_WORKERS', 0))
+renderPool = None
+# batch documents render on these threads when there is no render pool
+batchExecutor = ThreadPoolExecutor(max_workers=int(config.get('BATCH_WORKERS', 4)), thread_name_prefix='pcs-batch')
+batchMaxSize = int(config.get('BATCH_MAX_SIZE', 100))
+# rendered results kept for repeated payloads, in MB, 0 disables the cache
+resultCacheSize = int(config.get('RESULT_CACHE_SIZE', 256))
+resultCache = ResultCache(resultCacheSize * 1024 * 1024) if resultCacheSize > 0 else None
+# pickled sheets of rendered processes, in MB, lets an edited document
+# re-render only the processes that changed, 0 disables the cache
+sheetCacheSize = int(config.get('SHEET_CACHE_SIZE', 128))
+sheetCache = ResultCache(sheetCacheSize * 1024 * 1024) if sheetCacheSize > 0 else None
+
+# documents with at least this many pages render with the xml engine, every
+# page goes into the output zip as soon as it is done instead of keeping the
+# whole workbook until the save, 0 disables streaming
+streamPageThreshold = int(config.get('STREAM_PAGE_THRESHOLD', 100))
+
+# "header" profiles requests sent with X-PCS-Profile: 1, "all" profiles
+# every render, "off" disables profiling
+profileMode = config.get('PROFILE_MODE', 'header')
+# PROFILE_MEMORY=1 adds the allocation sites to every capture, tracemalloc
+# slows down every render of the process while a capture runs
+profileStore = ProfileStore(int(config.get('PROFILE_CAPTURES', 20)), config.get('PROFILE_MEMORY', '0') == '1')
+
+# "image" places the dashed timing lines as rasters, "vector" draws them as
+# DrawingML connectors, fewer pictures and media parts per page
+connectorMode = config.get('CONNECTOR_MODE', 'image')
+if connectorMode not in connectorModeList:
+    raise ValueError('Unknown CONNECTOR_MODE, {}'.format(connectorMode))
+
+# renders are priced from their page and item count and admitted against
+# ADMISSION_MAX_CONCURRENT running renders and ADMISSION_MEMORY_MB of
+# estimated memory, smaller documents first. Requests that cannot start
+# within ADMISSION_MAX_WAIT seconds, or find ADMISSION_QUEUE_SIZE requests
+# already waiting, get 503 with Retry-After. 0 concurrent renders disables it.
+# Both budgets are for the host, serve.py splits them over its workers
+serveWorkers = int(os.environ.get('PCS_SERVE_WORKERS', 1))
+admissionMaxConcurrent = int(config.get('ADMISSION_MAX_CONCURRENT', 4))
+if admissionMaxConcurrent > 0:
+    admissionMaxConcurrent = max(admissionMaxConcurrent // serveWorkers, 1)
+admissionController = AdmissionController(
+    admissionMaxConcurrent,
+    int(config.get('ADMISSION_MEMORY_MB', 512)) * 1024 * 1024 // serveWorkers,
+    int(config.get('ADMISSION_QUEUE_SIZE', 16)),
+    float(config.get('ADMISSION_MAX_WAIT', 10))
+)
+
+# sample payload for front-end development, encoded once per file change
+mockDataCache = JsonFileCache('pcs_controlitem.json')
+
+# every form template under TEMPLATE_DIR is parsed and checked at startup,
+# requests pick one with ?template_id=&template_version= (newest version of
+# DEFAULT_TEMPLATE_ID otherwise) and get an in-memory copy. Changed files are
+# picked up within TEMPLATE_RELOAD_INTERVAL seconds by a background thread,
+# 0 disables reloading
+templateRegistry = TemplateRegistry(
+    config.get('TEMPLATE_DIR', 'templates'),
+    config.get('DEFAULT_TEMPLATE_ID', 'e-pcs-control-item'),
+    float(config.get('TEMPLATE_RELOAD_INTERVAL', 2))
+)
+imageRegistry.preload()
+templateRegistry.preload()
 
 app = FastAPI()
+
+@app.on_event("startup")
+def startup():
+    global renderPool
+    templateRegistry.start()
+    if renderWorkers > 0:
+        renderPool = RenderPool([formTemplate.path for formTemplate in templateRegistry.getTemplateList()], renderWorkers, sheetCacheSize * 1024 * 1024, connectorMode=connectorMode)
+        renderPool.warm()
+
+@app.on_event("shutdown")
+def shutdown():
+    templateRegistry.stop()
+    jobManager.shutdown()
+    batchExecutor.shutdown(wait=False)
+    if renderPool is not None:
+        renderPool.shutdown()
 origins = ["*"]
 
 app.add_middleware(
@@ -27,6 +135,42 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+def getRouteName(request: Request):
+    # label requests by route template, not by path, to keep ids out of
+    # the metric labels
+    for route in request.app.router.routes:
+        match, _ = route.matches(request.scope)
+        if match == Match.FULL:
+            return route.path
+    return 'unmatched'
+
+@app.middleware("http")
+async def collect_request_metrics(request: Request, call_next):
+    handler = getRouteName(request)
+    httpRequestsInFlight.inc(handler=handler)
+    start = time.perf_counter()
+    statusCode = 500
+    try:
+        response = await call_next(request)
+        statusCode = response.status_code
+        return response
+    finally:
+        httpRequestsInFlight.dec(handler=handler)
+        httpRequestSeconds.observe(time.perf_counter() - start, handler=handler, method=request.method)
+        httpRequestsTotal.inc(handler=handler, method=request.method, status=str(statusCode))
+
+@app.exception_handler(AdmissionRejectedError)
+def admission_rejected(request: Request, e: AdmissionRejectedError):
+    return JSONResponse(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        content={'detail': "Server is busy, {}".format(e.reason)},
+        headers={'Retry-After': str(e.retryAfter)}
+    )
+
+@app.get("/metrics")
+def metrics():
+    # Prometheus text format, left without the API key so scrapers can reach it
+    return Response(metricsRegistry.render(), media_type=metricsContentType)
 
 
 def api_key_auth(x_api_key: str = Depends(X_API_KEY)):
@@ -39,16 +183,320 @@ def api_key_auth(x_api_key: str = Depends(X_API_KEY)):
             detail="Forbidden"
         )
 
+async def decodeBody(request: Request, decodeFunc):
+    # the raw body is validated in one pass (see schemas), off the event loop
+    # since large documents take a few milliseconds
+    body = await request.body()
+    try:
+        return await run_in_threadpool(decodeFunc, body)
+    except ValidationError as e:
+        errorList = list()
+        for error in e.errors(include_url=False, include_context=False):
+            error['loc'] = ('body',) + tuple(error['loc'])
+            # a missing field would echo back the whole object around it
+            if isinstance(error.get('input', None), (dict, list)):
+                del error['input']
+            errorList.append(error)
+        raise RequestValidationError(errorList)
+
+async def pcs_document_body(request: Request):
+    return await decodeBody(request, decodeDocument)
+
+async def pcs_document_list_body(request: Request):
+    return await decodeBody(request, decodeDocumentList)
+
+def form_template(template_id: Optional[str] = None, template_version: Optional[str] = None):
+    formTemplate = templateRegistry.get(template_id, template_version)
+    if formTemplate is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Template not found"
+        )
+    return formTemplate
+
 @app.get("/get_mock_data", dependencies=[Depends(api_key_auth)])
-def get_mock_data():
-    with open('pcs_controlitem.json') as f:
-        data = json.load(f)
+def get_mock_data(if_none_match: Optional[str] = Header(None), accept_encoding: Optional[str] = Header(None)):
+    mockData = mockDataCache.get()
+    # the gzip and plain bodies are the same document, so the ETag is weak
+    # and matches either representation
+    headers = {
+        'ETag': 'W/{}'.format(mockData.etag),
+        'Vary': 'Accept-Encoding'
+    }
+    if isETagMatched(if_none_match, mockData.etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    if isGzipAccepted(accept_encoding):
+        headers['Content-Encoding'] = 'gzip'
+        return Response(mockData.gzipBody, media_type='application/json', headers=headers)
+    return Response(mockData.body, media_type='application/json', headers=headers)
+
+@app.get("/get_template_list", dependencies=[Depends(api_key_auth)])
+def get_template_list():
+    # templates that failed to (re)load carry the error, a broken revision
+    # keeps serving its last good state
+    return templateRegistry.list()
+
+def isStreamed(data: dict):
+    processList = data.get('processes', None)
+    if streamPageThreshold <= 0 or not isinstance(processList, list):
+        return False
+    return getTotalPage(processList) >= streamPageThreshold
+
+def getRenderEngine(data: dict):
+    return 'xml' if isStreamed(data) else 'openpyxl'
+
+def newPCSForm(data: dict, formTemplate: FormTemplate, progressCallback = None, sheetCache = None):
+    return PCSForm(
+        formTemplate.path, data, progressCallback, sheetCache, getRenderEngine(data),
+        connectorMode=connectorMode, templateSheetName=formTemplate.sheetName, assetMap=formTemplate.assetMap
+    )
+
+def renderBytes(data: dict, formTemplate: FormTemplate):
+    if renderPool is not None:
+        return renderPool.render(data, formTemplate)
+    return renderWorkbookBytes(formTemplate.path, data, sheetCache, connectorMode, formTemplate.sheetName, formTemplate.assetMap)
+
+def getRenderPlan(data: dict):
+    return planRender(data, getRenderEngine(data), connectorMode)
+
+def getRenderPlanOr422(data: dict):
+    # documents PCSForm cannot draw are turned away before admission and
+    # rendering, with the 422 /plan_json_to_xlsx gives them
+    renderPlan = getRenderPlan(data)
+    if renderPlan.error is not None:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=renderPlan.error
+        )
+    return renderPlan
+
+def admitRender(renderPlan, isWaiting: bool = False):
+    # raises AdmissionRejectedError, jobs and batch documents wait instead
+    return admissionController.admit(RenderCost(renderPlan), isWaiting)
+
+def renderAdmitted(data: dict, renderPlan, formTemplate: FormTemplate):
+    with admitRender(renderPlan, True):
+        return renderBytes(data, formTemplate)
+
+def getFailedFuture(e: Exception):
+    future = Future()
+    future.set_exception(e)
+    return future
+
+def isProfileRequested(x_pcs_profile: str = None):
+    if profileMode == 'all':
+        return True
+    return profileMode == 'header' and x_pcs_profile is not None and x_pcs_profile.lower() in ['1', 'true', 'yes']
+
+def renderProfiled(data: dict, formTemplate: FormTemplate, progressCallback = None):
+    # profiled renders skip the render pool and the sheet cache so the
+    # profile covers every page of the document
+    capture = profileStore.newCapture(data.get('pcs_no', None))
+
+    def render(onProgress):
+        form = newPCSForm(data, formTemplate, onProgress)
+        try:
+            return form.generate()
+        finally:
+            capture.renderSample = form.renderSample
+
+    return capture, profileStore.profile(capture, render, progressCallback)
+
+@app.post("/plan_json_to_xlsx", dependencies=[Depends(api_key_auth)])
+def plan_data(data: dict = Depends(pcs_document_body)):
+    # pages, sheets, anchors, merges and the predicted render time, worked
+    # out from the payload without loading the template (see render_plan)
+    return getRenderPlanOr422(data).toDict()
 
-    return data
+def getResultResponse(resultKey: str, content: bytes = None, if_none_match: str = None):
+    etag = '"{}"'.format(resultKey)
+    headers = {
+        'ETag': etag,
+        'Content-Location': '/download_result/{}'.format(resultKey)
+    }
+    if isETagMatched(if_none_match, etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    headers['Content-Disposition'] = 'attachment; filename="e-pcs.xlsx"'
+    return Response(content, media_type=xlsxMediaType, headers=headers)
 
 @app.post("/convert_json_to_xlsx", dependencies=[Depends(api_key_auth)])
-def create_data(data: Dict[str, Union[str, List]]):
-    templateFilePath = './templates/e-pcs-control-item-form-template.xlsx'
-    random_name = str(uuid.uuid4())
-    PCSForm(templateFilePath, data).generate(random_name)
-    return FileResponse(f"./output/{random_name}.xlsx", media_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',filename='e-pcs.xlsx')
+def create_data(data: dict = Depends(pcs_document_body), formTemplate: FormTemplate = Depends(form_template), if_none_match: Optional[str] = Header(None), x_pcs_profile: Optional[str] = Header(None)):
+    renderPlan = getRenderPlanOr422(data)
+    if isProfileRequested(x_pcs_profile):
+        with admitRender(renderPlan):
+            capture, buffer = renderProfiled(data, formTemplate)
+        size = buffer.seek(0, 2)
+        buffer.seek(0)
+        return StreamingResponse(
+            iterFileChunks(buffer),
+            media_type=xlsxMediaType,
+            headers={
+                'Content-Disposition': 'attachment; filename="e-pcs.xlsx"',
+                'Content-Length': str(size),
+                'X-Profile-Id': capture.id
+            }
+        )
+
+    if outputMode == 'file':
+        random_name = str(uuid.uuid4())
+        with admitRender(renderPlan):
+            newPCSForm(data, formTemplate, sheetCache=sheetCache).generate(random_name)
+        return FileResponse(f"./output/{random_name}.xlsx", media_type=xlsxMediaType,filename='e-pcs.xlsx')
+
+    # large documents skip the result cache and the render pool, both hold
+    # the whole workbook as bytes, and are sent from the spooled output
+    isStreaming = isStreamed(data)
+    if resultCache is not None and not isStreaming:
+        # the connector mode changes the workbook, it is part of the key
+        resultKey = getResultKey(data, '{}:{}'.format(formTemplate.revision, connectorMode))
+        if isETagMatched(if_none_match, '"{}"'.format(resultKey)):
+            return getResultResponse(resultKey, if_none_match=if_none_match)
+        # cached results are sent without going through admission
+        def render():
+            with admitRender(renderPlan):
+                return renderBytes(data, formTemplate)
+
+        content = resultCache.getOrRender(resultKey, render)
+        return getResultResponse(resultKey, content)
+
+    if renderPool is not None and not isStreaming:
+        with admitRender(renderPlan):
+            content = renderPool.render(data, formTemplate)
+        return Response(
+            content,
+            media_type=xlsxMediaType,
+            headers={'Content-Disposition': 'attachment; filename="e-pcs.xlsx"'}
+        )
+
+    with admitRender(renderPlan):
+        buffer = newPCSForm(data, formTemplate, sheetCache=sheetCache).generate()
+    size = buffer.seek(0, 2)
+    buffer.seek(0)
+    return StreamingResponse(
+        iterFileChunks(buffer),
+        media_type=xlsxMediaType,
+        headers={
+            'Content-Disposition': 'attachment; filename="e-pcs.xlsx"',
+            'Content-Length': str(size)
+        }
+    )
+
+@app.get("/download_result/{result_id}", dependencies=[Depends(api_key_auth)])
+def download_result(result_id: str, if_none_match: Optional[str] = Header(None)):
+    content = resultCache.get(result_id) if resultCache is not None else None
+    if content is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Result not found"
+        )
+    return getResultResponse(result_id, content, if_none_match)
+
+@app.post("/convert_json_to_xlsx_job", dependencies=[Depends(api_key_auth)], status_code=status.HTTP_202_ACCEPTED)
+def create_data_job(data: dict = Depends(pcs_document_body), formTemplate: FormTemplate = Depends(form_template), x_pcs_profile: Optional[str] = Header(None)):
+    isProfiled = isProfileRequested(x_pcs_profile)
+    renderPlan = getRenderPlanOr422(data)
+
+    def render(job):
+        with admitRender(renderPlan, True):
+            if isProfiled:
+                capture, buffer = renderProfiled(data, formTemplate, job.updateProgress)
+                job.profileId = capture.id
+                return buffer
+            return newPCSForm(data, formTemplate, job.updateProgress, sheetCache).generate()
+
+    try:
+        job = jobManager.submit(render)
+    except JobQueueFullError:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Job queue is full"
+        )
+    return job.toDict()
+
+def getJobOr404(job_id: str):
+    job = jobManager.get(job_id)
+    if job is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Job not found"
+        )
+    return job
+
+@app.get("/get_job_status/{job_id}", dependencies=[Depends(api_key_auth)])
+def get_job_status(job_id: str):
+    return getJobOr404(job_id).toDict()
+
+@app.get("/download_job_result/{job_id}", dependencies=[Depends(api_key_auth)])
+def download_job_result(job_id: str):
+    job = getJobOr404(job_id)
+    if job.status != 'done':
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Job is {}".format(job.status)
+        )
+    return FileResponse(job.resultPath, media_type=xlsxMediaType,filename='e-pcs.xlsx')
+
+@app.post("/convert_json_to_xlsx_batch", dependencies=[Depends(api_key_auth)])
+def create_data_batch(dataList: list = Depends(pcs_document_list_body), formTemplate: FormTemplate = Depends(form_template)):
+    if len(dataList) > batchMaxSize:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail="Batch is limited to {} documents".format(batchMaxSize)
+        )
+
+    def submit(data):
+        # documents that did not validate fail on their own in manifest.json
+        if isinstance(data, InvalidDocumentError):
+            return getFailedFuture(data)
+        renderPlan = getRenderPlan(data)
+        if renderPlan.error is not None:
+            return getFailedFuture(ValueError(renderPlan.error))
+        # documents wait for admission on the batch threads, the render pool
+        # (if any) renders them once they are admitted
+        return batchExecutor.submit(renderAdmitted, data, renderPlan, formTemplate)
+
+    return StreamingResponse(
+        iterBatchZip(dataList, submit),
+        media_type='application/zip',
+        headers={'Content-Disposition': 'attachment; filename="e-pcs.zip"'}
+    )
+
+def getProfileOr404(profile_id: str):
+    capture = profileStore.get(profile_id)
+    if capture is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Profile not found"
+        )
+    return capture
+
+@app.get("/get_profile_list", dependencies=[Depends(api_key_auth)])
+def get_profile_list():
+    return profileStore.list()
+
+@app.get("/get_profile/{profile_id}", dependencies=[Depends(api_key_auth)])
+def get_profile(profile_id: str):
+    return getProfileOr404(profile_id).toDict()
+
+@app.get("/download_profile/{profile_id}", dependencies=[Depends(api_key_auth)])
+def download_profile(profile_id: str, format: str = 'prof'):
+    # "prof" is a pstats dump (python -m pstats, snakeviz), "text" is the
+    # cumulative and own time report
+    capture = getProfileOr404(profile_id)
+    if capture.status == 'running':
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Profile is running"
+        )
+    if format == 'text':
+        return Response(capture.report, media_type='text/plain; charset=utf-8')
+    if format != 'prof':
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Unknown format {}".format(format)
+        )
+    return Response(
+        capture.statsBytes,
+        media_type='application/octet-stream',
+        headers={'Content-Disposition': 'attachment; filename="{}.prof"'.format(profile_id)}
+    )
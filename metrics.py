@@ -0,0 +1,191 @@
+import threading
+from bisect import bisect_left
+
+#   Minimal Prometheus text exposition (version 0.0.4), no client library.
+#   Every metric keeps its own lock, observing is a dict lookup and a few
+#   additions
+
+metricsContentType = 'text/plain; version=0.0.4; charset=utf-8'
+
+stageBucketList = [0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30]
+durationBucketList = [0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120]
+
+def _escapeLabel(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+def _formatLabels(labelNameList: list, labelValues: tuple, extra: str = None):
+    labelList = ['{}="{}"'.format(name, _escapeLabel(value)) for name, value in zip(labelNameList, labelValues)]
+    if extra is not None:
+        labelList.append(extra)
+    return '{' + ','.join(labelList) + '}' if labelList else ''
+
+def _formatValue(value):
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+class _Metric:
+    metricType = None
+
+    def __init__(self, name: str, helpText: str, labelNameList: list = None):
+        self.name = name
+        self.helpText = helpText
+        self.labelNameList = labelNameList or list()
+        self._lock = threading.Lock()
+        self._valueDict = dict()
+
+    def _getKey(self, labelDict: dict):
+        return tuple(labelDict.get(name, '') for name in self.labelNameList)
+
+    def render(self):
+        lineList = [
+            '# HELP {} {}'.format(self.name, self.helpText),
+            '# TYPE {} {}'.format(self.name, self.metricType)
+        ]
+        with self._lock:
+            itemList = sorted(self._valueDict.items())
+            lineList += self._renderItems(itemList)
+        return lineList
+
+    def _renderItems(self, itemList: list):
+        return ['{}{} {}'.format(self.name, _formatLabels(self.labelNameList, key), _formatValue(value)) for key, value in itemList]
+
+class Counter(_Metric):
+    metricType = 'counter'
+
+    def inc(self, value: float = 1, **labelDict):
+        key = self._getKey(labelDict)
+        with self._lock:
+            self._valueDict[key] = self._valueDict.get(key, 0) + value
+
+class Gauge(_Metric):
+    metricType = 'gauge'
+
+    def inc(self, value: float = 1, **labelDict):
+        key = self._getKey(labelDict)
+        with self._lock:
+            self._valueDict[key] = self._valueDict.get(key, 0) + value
+
+    def dec(self, value: float = 1, **labelDict):
+        self.inc(-value, **labelDict)
+
+    def set(self, value: float, **labelDict):
+        key = self._getKey(labelDict)
+        with self._lock:
+            self._valueDict[key] = value
+
+class Histogram(_Metric):
+    metricType = 'histogram'
+
+    def __init__(self, name: str, helpText: str, labelNameList: list = None, bucketList: list = None):
+        super().__init__(name, helpText, labelNameList)
+        self.bucketList = sorted(bucketList or durationBucketList)
+
+    def observe(self, value: float, **labelDict):
+        key = self._getKey(labelDict)
+        index = bisect_left(self.bucketList, value)
+        with self._lock:
+            state = self._valueDict.get(key, None)
+            if state is None:
+                #   per bucket counts (not cumulative), sum, count
+                state = [[0] * len(self.bucketList), 0.0, 0]
+                self._valueDict[key] = state
+            if index < len(self.bucketList):
+                state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    def _renderItems(self, itemList: list):
+        lineList = list()
+        for key, (bucketCountList, total, count) in itemList:
+            cumulative = 0
+            for bound, bucketCount in zip(self.bucketList, bucketCountList):
+                cumulative += bucketCount
+                lineList.append('{}_bucket{} {}'.format(
+                    self.name, _formatLabels(self.labelNameList, key, 'le="{}"'.format(_formatValue(float(bound)))), cumulative
+                ))
+            lineList.append('{}_bucket{} {}'.format(self.name, _formatLabels(self.labelNameList, key, 'le="+Inf"'), count))
+            lineList.append('{}_sum{} {}'.format(self.name, _formatLabels(self.labelNameList, key), _formatValue(total)))
+            lineList.append('{}_count{} {}'.format(self.name, _formatLabels(self.labelNameList, key), count))
+        return lineList
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metricList = list()
+
+    def register(self, metric: _Metric):
+        self._metricList.append(metric)
+        return metric
+
+    def render(self):
+        lineList = list()
+        for metric in self._metricList:
+            lineList += metric.render()
+        return '\n'.join(lineList) + '\n'
+
+metricsRegistry = MetricsRegistry()
+
+renderStageSeconds = metricsRegistry.register(Histogram(
+    'pcs_render_stage_seconds', 'Time spent in each PCSForm render stage per document.',
+    ['engine', 'stage'], stageBucketList
+))
+renderSeconds = metricsRegistry.register(Histogram(
+    'pcs_render_seconds', 'Time to render one document.', ['engine']
+))
+renderDocumentsTotal = metricsRegistry.register(Counter(
+    'pcs_render_documents_total', 'Rendered documents.', ['engine', 'status']
+))
+renderPagesTotal = metricsRegistry.register(Counter(
+    'pcs_render_pages_total', 'Rendered pages (sheets).', ['engine']
+))
+renderItemsTotal = metricsRegistry.register(Counter(
+    'pcs_render_items_total', 'Rendered control items.', ['engine']
+))
+renderAnchorsTotal = metricsRegistry.register(Counter(
+    'pcs_render_image_anchors_total', 'Image anchors placed on rendered pages.', ['engine']
+))
+renderInFlight = metricsRegistry.register(Gauge(
+    'pcs_render_in_flight', 'Documents currently rendering in this process or its render pool.'
+))
+httpRequestsInFlight = metricsRegistry.register(Gauge(
+    'pcs_http_requests_in_flight', 'HTTP requests being handled.', ['handler']
+))
+httpRequestsTotal = metricsRegistry.register(Counter(
+    'pcs_http_requests_total', 'Handled HTTP requests.', ['handler', 'method', 'status']
+))
+httpRequestSeconds = metricsRegistry.register(Histogram(
+    'pcs_http_request_seconds', 'Time until the response starts, streamed bodies are not included.',
+    ['handler', 'method']
+))
+admissionActive = metricsRegistry.register(Gauge(
+    'pcs_admission_active', 'Renders admitted and running.'
+))
+admissionQueued = metricsRegistry.register(Gauge(
+    'pcs_admission_queued', 'Renders waiting for admission.'
+))
+admissionMemoryBytes = metricsRegistry.register(Gauge(
+    'pcs_admission_memory_bytes', 'Estimated memory of the admitted renders.'
+))
+admissionRejectedTotal = metricsRegistry.register(Counter(
+    'pcs_admission_rejected_total', 'Renders turned away with 503.', ['reason']
+))
+admissionWaitSeconds = metricsRegistry.register(Histogram(
+    'pcs_admission_wait_seconds', 'Time renders waited for admission.'
+))
+
+def recordRender(renderSample: dict):
+    #   renderSample is PCSForm.renderSample, plain data so that render
+    #   workers can send it back to the process serving /metrics
+    engine = renderSample['engine']
+    if renderSample['error'] is not None:
+        renderDocumentsTotal.inc(engine=engine, status='failed')
+        return
+    renderDocumentsTotal.inc(engine=engine, status='done')
+    renderSeconds.observe(renderSample['seconds'], engine=engine)
+    for stage, stageDict in renderSample['stages'].items():
+        renderStageSeconds.observe(stageDict['seconds'], engine=engine, stage=stage)
+    renderPagesTotal.inc(renderSample['pages'], engine=engine)
+    renderItemsTotal.inc(renderSample['items'], engine=engine)
+    renderAnchorsTotal.inc(renderSample['anchors'], engine=engine)
@@ -0,0 +1,57 @@
+from copy import copy
+from openpyxl.cell.cell import Cell
+from openpyxl.worksheet.cell_range import CellRange, MultiCellRange
+
+class PagePrototype:
+    #   Snapshot of a prepared page (template, form header, logo). Pages are
+    #   built from the snapshot directly, copy_worksheet goes through the
+    #   full cell() lookup for every cell and copying MergedCellRange objects
+    #   redoes their border pass against the source sheet. Like copy_worksheet
+    #   the images of the source sheet are not carried over, imageList is
+    #   placed on every page instead
+    def __init__(self, sheet, imageList: list):
+        self.sheet = sheet
+        self.cellList = list()
+        self.extraList = list()
+        for (row, col), cell in sheet._cells.items():
+            styleArray = copy(cell._style) if cell.has_style else None
+            self.cellList.append((row, col, cell._value, cell.data_type, styleArray))
+            if cell.hyperlink or cell.comment:
+                self.extraList.append((row, col, cell.hyperlink, cell.comment))
+        self.rowDimensionList = list(sheet.row_dimensions.items())
+        self.columnDimensionList = list(sheet.column_dimensions.items())
+        self.mergedList = [mergedRange.coord for mergedRange in sheet.merged_cells.ranges]
+        self.imageList = list(imageList)
+
+    def newPage(self, workbook, title: str):
+        page = workbook.create_sheet(title)
+
+        cellDict = page._cells
+        for row, col, value, dataType, styleArray in self.cellList:
+            cell = Cell(page, row=row, column=col, style_array=styleArray)
+            cell._value = value
+            cell.data_type = dataType
+            cellDict[(row, col)] = cell
+        page._current_row = max([row for row, _, _, _, _ in self.cellList], default=0)
+        for row, col, hyperlink, comment in self.extraList:
+            if hyperlink:
+                cellDict[(row, col)]._hyperlink = copy(hyperlink)
+            if comment:
+                cellDict[(row, col)].comment = copy(comment)
+
+        for dimensionHolder, dimensionList in [(page.row_dimensions, self.rowDimensionList), (page.column_dimensions, self.columnDimensionList)]:
+            for key, dimension in dimensionList:
+                dimensionHolder[key] = copy(dimension)
+                dimensionHolder[key].worksheet = page
+
+        page.sheet_format = copy(self.sheet.sheet_format)
+        page.sheet_properties = copy(self.sheet.sheet_properties)
+        page.merged_cells = MultiCellRange([CellRange(coord) for coord in self.mergedList])
+        page.page_margins = copy(self.sheet.page_margins)
+        page.page_setup = copy(self.sheet.page_setup)
+        page.print_options = copy(self.sheet.print_options)
+
+        #   the anchors are never changed once placed, images only need their
+        #   own object for the per-workbook media id
+        page._images = [copy(img) for img in self.imageList]
+        return page
@@ -0,0 +1,179 @@
+import io
+import time
+import uuid
+import pstats
+import marshal
+import cProfile
+import threading
+import tracemalloc
+from contextlib import nullcontext
+from collections import OrderedDict
+
+#   Opt-in profiling of single renders. The render runs under cProfile, the
+#   capture keeps the pstats dump (open it with pstats or snakeviz) and a
+#   text report. cProfile only slows down the thread it runs on. With
+#   isMemoryTraced the capture also holds the allocation sites of the
+#   finished workbook, tracemalloc then slows down every render of the
+#   process while a capture runs, so it is left to the deployment to turn
+#   on. Captures are meant for finding hotspots, not for timing
+
+profileFunctionCount = 40
+profileAllocationCount = 25
+tracemallocFrameCount = 1
+
+class ProfileCapture:
+    def __init__(self, label: str = None):
+        self.id = str(uuid.uuid4())
+        self.label = label
+        self.status = 'running'
+        self.error = None
+        self.createdAt = time.time()
+        self.seconds = None
+        self.renderSample = None
+        self.functionList = list()
+        self.memoryDict = None
+        self.statsBytes = None
+        self.report = None
+
+    def toSummaryDict(self):
+        return {
+            'profile_id': self.id,
+            'label': self.label,
+            'status': self.status,
+            'error': self.error,
+            'created_at': self.createdAt,
+            'seconds': self.seconds
+        }
+
+    def toDict(self):
+        summaryDict = self.toSummaryDict()
+        summaryDict['render'] = self.renderSample
+        summaryDict['functions'] = self.functionList
+        summaryDict['memory'] = self.memoryDict
+        return summaryDict
+
+def _getFunctionName(functionKey: tuple):
+    fileName, lineNo, functionName = functionKey
+    if fileName == '~':
+        return functionName
+    return '{}:{}({})'.format(fileName, lineNo, functionName)
+
+def _getFunctionList(profile: cProfile.Profile):
+    stats = pstats.Stats(profile)
+    functionList = list()
+    for functionKey, (_, callCount, totalTime, cumulativeTime, _) in stats.stats.items():
+        functionList.append({
+            'function': _getFunctionName(functionKey),
+            'calls': callCount,
+            'tottime': totalTime,
+            'cumtime': cumulativeTime
+        })
+    functionList.sort(key=lambda functionDict: functionDict['cumtime'], reverse=True)
+    return functionList[:profileFunctionCount]
+
+def _getReport(profile: cProfile.Profile):
+    stream = io.StringIO()
+    stats = pstats.Stats(profile, stream=stream)
+    stats.sort_stats('cumulative').print_stats(profileFunctionCount)
+    stats.sort_stats('tottime').print_stats(profileFunctionCount)
+    return stream.getvalue()
+
+def _getMemoryDict(snapshot, peakBytes: int):
+    snapshot = snapshot.filter_traces([
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+        tracemalloc.Filter(False, '<frozen importlib._bootstrap_external>')
+    ])
+    statisticList = snapshot.statistics('lineno')
+    return {
+        'peak_bytes': peakBytes,
+        'snapshot_bytes': sum(statistic.size for statistic in statisticList),
+        'allocations': [
+            {
+                'location': '{}:{}'.format(statistic.traceback[0].filename, statistic.traceback[0].lineno),
+                'bytes': statistic.size,
+                'count': statistic.count
+            }
+            for statistic in statisticList[:profileAllocationCount]
+        ]
+    }
+
+class ProfileStore:
+    #   Keeps the last maxCount captures in memory. With isMemoryTraced the
+    #   profiled renders run one at a time, tracemalloc is process wide
+    def __init__(self, maxCount: int, isMemoryTraced: bool = False):
+        self.maxCount = maxCount
+        self.isMemoryTraced = isMemoryTraced
+        self._lock = threading.Lock()
+        self._renderLock = threading.Lock()
+        self._captureDict = OrderedDict()
+
+    def list(self):
+        with self._lock:
+            return [capture.toSummaryDict() for capture in reversed(self._captureDict.values())]
+
+    def get(self, profileId: str):
+        with self._lock:
+            return self._captureDict.get(profileId, None)
+
+    def newCapture(self, label: str = None):
+        capture = ProfileCapture(label)
+        with self._lock:
+            self._captureDict[capture.id] = capture
+            while len(self._captureDict) > self.maxCount:
+                self._captureDict.popitem(last=False)
+        return capture
+
+    def profile(self, capture: ProfileCapture, renderFunc, progressCallback = None):
+        #   renderFunc(progressCallback) renders one document. The memory
+        #   snapshot is taken when the last page is done, before the
+        #   workbook is saved, or after the render if pages are not reported
+        snapshotList = list()
+        profile = cProfile.Profile()
+
+        def onProgress(renderedPage: int, totalPage: int):
+            if renderedPage == totalPage and self.isMemoryTraced:
+                #   the snapshot itself is kept out of the profile
+                profile.disable()
+                snapshotList.append(tracemalloc.take_snapshot())
+                profile.enable()
+            if progressCallback is not None:
+                progressCallback(renderedPage, totalPage)
+
+        #   every capture has its own cProfile.Profile, only the tracing
+        #   needs the renders kept apart
+        with self._renderLock if self.isMemoryTraced else nullcontext():
+            isTracing = tracemalloc.is_tracing()
+            if self.isMemoryTraced:
+                if isTracing:
+                    if hasattr(tracemalloc, 'reset_peak'):
+                        tracemalloc.reset_peak()
+                else:
+                    tracemalloc.start(tracemallocFrameCount)
+            start = time.perf_counter()
+            status = 'failed'
+            try:
+                profile.enable()
+                try:
+                    result = renderFunc(onProgress)
+                finally:
+                    profile.disable()
+                status = 'done'
+                return result
+            except Exception as e:
+                capture.error = '{}: {}'.format(type(e).__name__, e)
+                raise
+            finally:
+                capture.seconds = time.perf_counter() - start
+                if self.isMemoryTraced:
+                    if len(snapshotList) == 0:
+                        snapshotList.append(tracemalloc.take_snapshot())
+                    _, peakBytes = tracemalloc.get_traced_memory()
+                    if not isTracing:
+                        tracemalloc.stop()
+                    capture.memoryDict = _getMemoryDict(snapshotList[-1], peakBytes)
+                profile.create_stats()
+                capture.statsBytes = marshal.dumps(profile.stats)
+                capture.functionList = _getFunctionList(profile)
+                capture.report = _getReport(profile)
+                capture.status = status
@@ -0,0 +1,157 @@
+from form_spec import itemSlotCount
+from timing_plan import planTimingFlow
+
+#   Dry run of PCSForm.generate, the pages every process is split into and
+#   what each of them draws, worked out from the payload alone. Nothing is
+#   rendered, the template is not loaded and openpyxl is not imported, the
+#   plan of a page takes tens of microseconds. Used by /plan_json_to_xlsx and
+#   by admission to price a render before it starts
+
+#   merges _writeProcessItem adds to the template's own, the page wide ones
+#   on pages holding items and the ones of every item slot (see
+#   item_block._layoutItemSlot)
+pageMergeCount = 2
+itemSlotMergeCount = 8
+
+#   seconds per engine: (fixed, per page, per item, per image anchor, per
+#   connector anchor), least squares over 30 documents of 2 to 90 pages
+#   from benchmarks.costfit, within 10% from 10 pages up. Refit with
+#   python -m benchmarks.costfit after changing the renderer
+renderSecondsModel = {
+    'openpyxl': (0.0155, 0.00988, 0.000276, 0.000135, 2.29e-05),
+    'xml': (0.00904, 0.00229, 0.000255, 1.38e-05, 1.42e-05)
+}
+
+class PagePlan:
+    def __init__(self, sheetName: str, itemCount: int, imageCount: int, connectorCount: int, mergeCount: int):
+        self.sheetName = sheetName
+        self.itemCount = itemCount
+        #   picture anchors, the logo included, and connector shapes
+        #   (connector mode vector only)
+        self.imageCount = imageCount
+        self.connectorCount = connectorCount
+        self.mergeCount = mergeCount
+
+class RenderPlan:
+    def __init__(self, engine: str, connectorMode: str, processCount: int):
+        self.engine = engine
+        self.connectorMode = connectorMode
+        self.processCount = processCount
+        self.pageList = list()
+        #   process index -> sheet names
+        self.sheetNameList = [list() for _ in range(processCount)]
+        #   the first process PCSForm would fail on, None when it renders
+        self.error = None
+
+    @property
+    def pageCount(self):
+        return len(self.pageList)
+
+    @property
+    def itemCount(self):
+        return sum(pagePlan.itemCount for pagePlan in self.pageList)
+
+    @property
+    def imageCount(self):
+        return sum(pagePlan.imageCount for pagePlan in self.pageList)
+
+    @property
+    def connectorCount(self):
+        return sum(pagePlan.connectorCount for pagePlan in self.pageList)
+
+    @property
+    def mergeCount(self):
+        return sum(pagePlan.mergeCount for pagePlan in self.pageList)
+
+    @property
+    def seconds(self):
+        secondsModel = renderSecondsModel[self.engine]
+        return (
+            secondsModel[0] + secondsModel[1] * self.pageCount + secondsModel[2] * self.itemCount
+            + secondsModel[3] * self.imageCount + secondsModel[4] * self.connectorCount
+        )
+
+    def toDict(self):
+        return {
+            'engine': self.engine,
+            'connector_mode': self.connectorMode,
+            'pages': self.pageCount,
+            'items': self.itemCount,
+            'image_anchors': self.imageCount,
+            'connector_anchors': self.connectorCount,
+            'merges': self.mergeCount,
+            'predicted_seconds': round(self.seconds, 3),
+            'processes': [
+                {'index': i, 'sheets': sheetNameList}
+                for i, sheetNameList in enumerate(self.sheetNameList)
+            ]
+        }
+
+def _getDashLinePixels(height):
+    #   raster height of getVerticalDashLine, EMU_to_pixels(cm_to_EMU(height) * 0.45)
+    return round(int(height * 360000) * 0.45 / 9525)
+
+def _isDrawable(placement):
+    if placement.row is None:
+        return False
+    return placement.kind != 'vertical_dash' or _getDashLinePixels(placement.height) > 0
+
+def _getTimingPageList(itemList: list, pageCount: int):
+    #   placements of every page, None for a flow PCSForm cannot draw (the
+    #   planner, drawImage or the dash raster fail on it the same way)
+    try:
+        timingPlan = planTimingFlow(itemList)
+    except TypeError:
+        return None
+    placementPageList = [timingPlan.getPage(j) for j in range(pageCount)]
+    for placementList in placementPageList:
+        if not all(_isDrawable(placement) for placement in placementList):
+            return None
+    return placementPageList
+
+def _planPage(sheetName: str, itemList: list, placementList: list, connectorMode: str):
+    isVector = connectorMode == 'vector'
+    #   logo, check process markers and the raster dashes of the flow
+    imageCount = 1
+    connectorCount = 0
+    for placement in placementList:
+        if placement.kind == 'check_process' or not isVector:
+            imageCount += 1
+        else:
+            connectorCount += 1
+
+    scSymbolKeySet = set()
+    for itemDict in itemList:
+        #   sc symbols, check timing symbol and the dash to the flow
+        imageCount += len(itemDict['sc_symbols']) + 1
+        if isVector:
+            connectorCount += 1
+        else:
+            imageCount += 1
+        for scSymbol in itemDict['sc_symbols']:
+            scSymbolKeySet.add('{}-{}'.format(scSymbol['character'], scSymbol['shape']))
+    #   summary, a symbol and its counter per distinct sc symbol
+    imageCount += 2 * len(scSymbolKeySet)
+
+    mergeCount = pageMergeCount + itemSlotMergeCount * len(itemList) if itemList else 0
+    return PagePlan(sheetName, len(itemList), imageCount, connectorCount, mergeCount)
+
+def planRender(dataDict: dict, engine: str = 'openpyxl', connectorMode: str = 'image'):
+    #   dataDict is a validated payload (see schemas)
+    processList = dataDict['processes']
+    renderPlan = RenderPlan(engine, connectorMode, len(processList))
+    for i, processDict in enumerate(processList):
+        itemList = processDict['items']
+        #   same pages as chunk(processDict['items'], itemChunkSize)
+        itemChunkList = [itemList[start:start + itemSlotCount] for start in range(0, len(itemList), itemSlotCount)]
+        placementPageList = _getTimingPageList(itemList, len(itemChunkList))
+        if placementPageList is None:
+            placementPageList = [[] for _ in itemChunkList]
+            if renderPlan.error is None:
+                renderPlan.error = 'Check timing flow of process {} cannot be drawn'.format(i + 1)
+
+        for j, itemChunk in enumerate(itemChunkList):
+            sheetName = 'process-{}-{}'.format(i + 1, j + 1)
+            renderPlan.sheetNameList[i].append(sheetName)
+            renderPlan.pageList.append(_planPage(sheetName, itemChunk, placementPageList[j], connectorMode))
+    return renderPlan
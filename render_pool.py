@@ -0,0 +1,105 @@
+import multiprocessing
+from concurrent.futures import Future, ProcessPoolExecutor
+from template_cache import getTemplateCache
+from image_registry import imageRegistry
+from e_pcs_form import PCSForm
+from result_cache import ResultCache
+from metrics import recordRender, renderInFlight
+from form_spec import defaultTemplateSheetName
+
+_workerSheetCache = None
+
+def _initializeWorker(templatePathList: list, sheetCacheBytes: int):
+    #   runs once in every worker, everything a render needs is parsed here
+    #   so requests only pay for the cell writes and the save. Templates
+    #   added later are parsed by the first render that uses them
+    global _workerSheetCache
+    for templatePath in templatePathList:
+        getTemplateCache(templatePath).preload()
+    imageRegistry.preload()
+    if sheetCacheBytes > 0:
+        _workerSheetCache = ResultCache(sheetCacheBytes)
+
+def _ping():
+    return True
+
+def renderWorkbookBytes(templatePath: str, dataDict: dict, sheetCache = None, connectorMode: str = 'image', templateSheetName: str = defaultTemplateSheetName, assetMap = None):
+    form = PCSForm(
+        templatePath, dataDict, sheetCache=sheetCache, connectorMode=connectorMode,
+        templateSheetName=templateSheetName, assetMap=assetMap
+    )
+    with form.generate() as buffer:
+        return buffer.read()
+
+def _renderInWorker(templatePath: str, dataDict: dict, engine: str, connectorMode: str, templateSheetName: str, assetMap):
+    #   the render sample goes back with the result, metrics are served by
+    #   the parent process
+    form = PCSForm(
+        templatePath, dataDict, sheetCache=_workerSheetCache, engine=engine, connectorMode=connectorMode,
+        templateSheetName=templateSheetName, assetMap=assetMap
+    )
+    try:
+        with form.generate() as buffer:
+            return buffer.read(), form.renderSample
+    except Exception as e:
+        e.renderSample = form.renderSample
+        raise
+
+class RenderPool:
+    #   openpyxl rendering is pure python and holds the GIL, a pool of warm
+    #   worker processes lets concurrent requests use every core
+    def __init__(self, templatePathList: list, workerCount: int, sheetCacheBytes: int = 0, engine: str = 'openpyxl', connectorMode: str = 'image'):
+        self.workerCount = workerCount
+        self.engine = engine
+        self.connectorMode = connectorMode
+        self._executor = ProcessPoolExecutor(
+            max_workers=workerCount,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=_initializeWorker,
+            initargs=(templatePathList, sheetCacheBytes)
+        )
+
+    def warm(self):
+        for future in [self._executor.submit(_ping) for _ in range(self.workerCount)]:
+            future.result()
+
+    def submit(self, dataDict: dict, formTemplate):
+        #   resolves to the xlsx bytes, cancelling it cancels the worker task
+        #   if it has not started yet. formTemplate comes from the
+        #   template_registry
+        resultFuture = Future()
+        renderInFlight.inc()
+        workerFuture = self._executor.submit(
+            _renderInWorker, formTemplate.path, dataDict, self.engine, self.connectorMode,
+            formTemplate.sheetName, formTemplate.assetMap
+        )
+
+        def onResultDone(future):
+            if future.cancelled():
+                workerFuture.cancel()
+
+        def onWorkerDone(future):
+            renderInFlight.dec()
+            if future.cancelled():
+                resultFuture.cancel()
+                return
+            error = future.exception()
+            if error is not None:
+                recordRender(getattr(error, 'renderSample', None) or {'engine': self.engine, 'error': repr(error)})
+                if resultFuture.set_running_or_notify_cancel():
+                    resultFuture.set_exception(error)
+                return
+            content, renderSample = future.result()
+            recordRender(renderSample)
+            if resultFuture.set_running_or_notify_cancel():
+                resultFuture.set_result(content)
+
+        resultFuture.add_done_callback(onResultDone)
+        workerFuture.add_done_callback(onWorkerDone)
+        return resultFuture
+
+    def render(self, dataDict: dict, formTemplate):
+        return self.submit(dataDict, formTemplate).result()
+
+    def shutdown(self):
+        self._executor.shutdown(wait=True)
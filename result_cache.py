@@ -0,0 +1,87 @@
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+
+def getResultKey(dataDict: dict, templateVersion: str):
+    canonicalData = json.dumps(dataDict, sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+    digest = hashlib.sha256()
+    digest.update(templateVersion.encode())
+    digest.update(b'\0')
+    digest.update(canonicalData.encode())
+    return digest.hexdigest()
+
+def isETagMatched(ifNoneMatch: str, etag: str):
+    if ifNoneMatch is None:
+        return False
+    for candidate in ifNoneMatch.split(','):
+        candidate = candidate.strip()
+        if candidate.startswith('W/'):
+            candidate = candidate[2:]
+        if candidate == '*' or candidate == etag:
+            return True
+    return False
+
+class ResultCache:
+    #   In-memory LRU of rendered workbooks bounded by total bytes, keyed by
+    #   a hash of the canonical payload and the template version. Identical
+    #   requests arriving together share a single render
+    def __init__(self, maxBytes: int):
+        self.maxBytes = maxBytes
+        self._lock = threading.Lock()
+        self._resultDict = OrderedDict()
+        self._inflightDict = dict()
+        self._totalBytes = 0
+
+    def get(self, key: str):
+        with self._lock:
+            content = self._resultDict.get(key, None)
+            if content is not None:
+                self._resultDict.move_to_end(key)
+            return content
+
+    def put(self, key: str, content: bytes):
+        with self._lock:
+            self._put(key, content)
+
+    def _put(self, key: str, content: bytes):
+        if len(content) > self.maxBytes:
+            return
+        previous = self._resultDict.pop(key, None)
+        if previous is not None:
+            self._totalBytes -= len(previous)
+        self._resultDict[key] = content
+        self._totalBytes += len(content)
+        while self._totalBytes > self.maxBytes:
+            _, evicted = self._resultDict.popitem(last=False)
+            self._totalBytes -= len(evicted)
+
+    def getOrRender(self, key: str, renderFunc):
+        with self._lock:
+            content = self._resultDict.get(key, None)
+            if content is not None:
+                self._resultDict.move_to_end(key)
+                return content
+            future = self._inflightDict.get(key, None)
+            isOwner = future is None
+            if isOwner:
+                future = Future()
+                self._inflightDict[key] = future
+
+        if not isOwner:
+            return future.result()
+
+        try:
+            content = renderFunc()
+        except Exception as e:
+            with self._lock:
+                self._inflightDict.pop(key, None)
+            future.set_exception(e)
+            raise
+
+        with self._lock:
+            self._inflightDict.pop(key, None)
+            self._put(key, content)
+        future.set_result(content)
+        return content
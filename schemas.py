@@ -0,0 +1,150 @@
+from typing import Any, List, Union
+from typing_extensions import Annotated, NotRequired, TypedDict
+from pydantic import AfterValidator, ConfigDict, Field, TypeAdapter, ValidationError, with_config
+from form_spec import itemSlotCount, scSymbolPerItemLimit, checkTimingList, counterPathMap, checkTimingSymbolPathMap, scSymbolPathMap
+
+#   Request payload of the convert endpoints, shaped like
+#   pcs_controlitem.json. The schemas are TypedDicts, pydantic validates
+#   the raw JSON in one pass and hands back the plain dicts PCSForm reads,
+#   a bad item is rejected with a 422 before any page is rendered. Fields
+#   the renderer reads with a default are NotRequired, unknown fields are
+#   passed through
+
+#   numbers sent for text fields are taken as text, the form writes them
+#   into cells either way
+payloadConfig = ConfigDict(extra='allow', coerce_numbers_to_str=True)
+
+def _isOneOf(nameList, label: str):
+    def checkValue(value: str):
+        if value not in nameList:
+            raise ValueError('Unknown {}, expected one of {}'.format(label, ', '.join(nameList)))
+        return value
+    return AfterValidator(checkValue)
+
+def _getSymbolHash(scSymbol: dict):
+    return '{}-{}'.format(scSymbol['character'], scSymbol['shape'])
+
+def _checkSCSymbol(scSymbol: dict):
+    if _getSymbolHash(scSymbol) not in scSymbolPathMap:
+        raise ValueError('Unregistered sc symbol, {}'.format(_getSymbolHash(scSymbol)))
+    return scSymbol
+
+def _checkPageSymbolCount(itemList: list):
+    #   the sc symbol summary of a page has one counter image per symbol,
+    #   counting up to len(counterPathMap)
+    for pageStart in range(0, len(itemList), itemSlotCount):
+        countDict = dict()
+        for item in itemList[pageStart:pageStart + itemSlotCount]:
+            for scSymbol in item['sc_symbols']:
+                symbolHash = _getSymbolHash(scSymbol)
+                countDict[symbolHash] = countDict.get(symbolHash, 0) + 1
+        for symbolHash, count in countDict.items():
+            if count > len(counterPathMap):
+                raise ValueError('sc symbol {} is used {} times on page {} of the process, at most {} fit'.format(
+                    symbolHash, count, pageStart // itemSlotCount + 1, len(counterPathMap)
+                ))
+    return itemList
+
+def _checkHasItems(processList: list):
+    #   processes without items get no page, the workbook needs at least one
+    if all(len(processDict['items']) == 0 for processDict in processList):
+        raise ValueError('Document has no items to render')
+    return processList
+
+@with_config(payloadConfig)
+class SCSymbol(TypedDict):
+    character: str
+    shape: str
+
+@with_config(payloadConfig)
+class Parameter(TypedDict):
+    parameter: str
+    master_value: NotRequired[Union[int, float, str, None]]
+    limit_type: str
+    prefix: NotRequired[str]
+    main: NotRequired[str]
+    suffix: NotRequired[str]
+    tolerance_up: NotRequired[str]
+    tolerance_down: NotRequired[str]
+    upper_limit: NotRequired[str]
+    lower_limit: NotRequired[str]
+    unit: str
+
+#   "100_method" is not an identifier, hence the functional syntax
+ControlMethod = with_config(payloadConfig)(TypedDict('ControlMethod', {
+    'sample_no': int,
+    'interval': str,
+    '100_method': str,
+    'in_charge': str,
+    'calibration_interval': NotRequired[str]
+}))
+
+@with_config(payloadConfig)
+class InitialPCapability(TypedDict):
+    x_bar: str
+    cpk: str
+
+@with_config(payloadConfig)
+class Remark(TypedDict):
+    remark: str
+    ws_no: str
+    related_std: NotRequired[str]
+
+@with_config(payloadConfig)
+class ControlItem(TypedDict):
+    control_item_no: NotRequired[Union[int, str, None]]
+    control_item_type: Annotated[str, _isOneOf(list(checkTimingSymbolPathMap), 'control item type')]
+    parameter: Parameter
+    sc_symbols: Annotated[List[Annotated[SCSymbol, AfterValidator(_checkSCSymbol)]], Field(max_length=scSymbolPerItemLimit)]
+    check_timing: Annotated[str, _isOneOf(checkTimingList, 'check timing')]
+    control_method: ControlMethod
+    initial_p_capability: InitialPCapability
+    remark: Remark
+    measurement: str
+    readability: str
+    start_effective: NotRequired[str]
+
+@with_config(payloadConfig)
+class Process(TypedDict):
+    name: str
+    items: Annotated[List[ControlItem], AfterValidator(_checkPageSymbolCount)]
+
+@with_config(payloadConfig)
+class PCSDocument(TypedDict):
+    pcs_no: NotRequired[str]
+    date: NotRequired[str]
+    status: NotRequired[str]
+    line: str
+    assy_name: str
+    part_name: str
+    customer: str
+    processes: Annotated[List[Process], Field(min_length=1), AfterValidator(_checkHasItems)]
+
+documentAdapter = TypeAdapter(PCSDocument)
+#   a batch is checked to be a list as a whole, its documents one by one
+documentListAdapter = TypeAdapter(List[Any])
+
+class InvalidDocumentError(ValueError):
+    #   batch document that did not validate, reported in its manifest entry
+    pass
+
+def getValidationMessage(e: ValidationError):
+    return '; '.join(
+        '{}: {}'.format('.'.join(str(part) for part in error['loc']) or 'document', error['msg'])
+        for error in e.errors(include_url=False)
+    )
+
+def decodeDocument(body: Union[str, bytes]):
+    #   raises pydantic.ValidationError
+    return documentAdapter.validate_json(body)
+
+def decodeDocumentList(body: Union[str, bytes]):
+    #   raises pydantic.ValidationError when the body is not a list, a
+    #   document that does not validate comes back as InvalidDocumentError
+    documentList = list()
+    for entry in documentListAdapter.validate_json(body):
+        try:
+            documentList.append(documentAdapter.validate_python(entry))
+        except ValidationError as e:
+            documentList.append(InvalidDocumentError(getValidationMessage(e)))
+    return documentList
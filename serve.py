@@ -0,0 +1,118 @@
+import os
+import gc
+import time
+import signal
+import socket
+import argparse
+import traceback
+import uvicorn
+from dotenv import dotenv_values
+
+#   Production entrypoint, python serve.py. main is imported once in this
+#   process, which parses every form template, checks and warms their item
+#   blocks, styles and xml fragments and reads every image (see
+#   template_registry, image_registry). The heap is then frozen out of the
+#   garbage collector and SERVE_WORKERS uvicorn workers are forked on one
+#   listening socket, they share the preloaded objects copy-on-write
+#   instead of loading their own. A worker that dies is forked again.
+#
+#   One worker by default. More are opt-in, SERVE_WORKERS or --workers (0,
+#   one per cpu): jobs, cached results, profiles and metrics are kept per
+#   worker, so clients polling a job, a result or a profile need sticky
+#   routing. The admission budgets are split evenly over the workers, and
+#   with RENDER_WORKERS every worker starts a pool of that size
+
+config = dotenv_values(".env")
+respawnDelay = 1.0
+
+def bindSocket(host: str, port: int):
+    family = socket.AF_INET6 if ':' in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+    return sock
+
+def preload(workerCount: int):
+    #   objects created before the freeze are never scanned by the collector
+    #   in the workers, so its passes do not touch (and copy) their pages
+    gc.disable()
+    #   read by main to split the admission budgets
+    os.environ['PCS_SERVE_WORKERS'] = str(workerCount)
+    import main
+    gc.freeze()
+    return main.app
+
+def runWorker(app, sock: socket.socket):
+    for signalNumber in [signal.SIGINT, signal.SIGTERM]:
+        signal.signal(signalNumber, signal.SIG_DFL)
+    gc.enable()
+    server = uvicorn.Server(uvicorn.Config(app, lifespan='on'))
+    server.run(sockets=[sock])
+
+def forkWorker(app, sock: socket.socket):
+    pid = os.fork()
+    if pid == 0:
+        #   never return into the parent's loop
+        code = 0
+        try:
+            runWorker(app, sock)
+        except SystemExit as e:
+            code = e.code if isinstance(e.code, int) else 1
+        except BaseException:
+            traceback.print_exc()
+            code = 1
+        os._exit(code)
+    return pid
+
+def main():
+    parser = argparse.ArgumentParser(description='Run the API with preforked workers')
+    parser.add_argument('--host', default=config.get('SERVE_HOST', '0.0.0.0'))
+    parser.add_argument('--port', type=int, default=int(config.get('SERVE_PORT', 8888)))
+    parser.add_argument('--workers', type=int, default=int(config.get('SERVE_WORKERS', 1)), help='0 runs one worker per cpu')
+    args = parser.parse_args()
+    workerCount = args.workers if args.workers > 0 else (os.cpu_count() or 1)
+
+    start = time.perf_counter()
+    app = preload(workerCount)
+    sock = bindSocket(args.host, args.port)
+    print('serve: preloaded in {:.2f}s, {} workers on {}:{}'.format(
+        time.perf_counter() - start, workerCount, args.host, args.port
+    ), flush=True)
+
+    isStopping = False
+    workerSet = set()
+
+    def stop(signalNumber, frame):
+        nonlocal isStopping
+        isStopping = True
+        for pid in workerSet:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+
+    for _ in range(workerCount):
+        workerSet.add(forkWorker(app, sock))
+
+    while workerSet:
+        try:
+            pid, waitStatus = os.wait()
+        except ChildProcessError:
+            break
+        workerSet.discard(pid)
+        if isStopping:
+            continue
+        print('serve: worker {} exited with status {}, forking a new one'.format(pid, waitStatus), flush=True)
+        time.sleep(respawnDelay)
+        if not isStopping:
+            workerSet.add(forkWorker(app, sock))
+
+    sock.close()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,40 @@
+import time
+from contextlib import contextmanager
+
+#   Render stages of PCSForm.generate, in the order they first run
+renderStageList = [
+    'template_load',
+    'copy_sheet',
+    'plan_timing',
+    'write_process',
+    'write_item',
+    'sheet_cache',
+    'save'
+]
+
+class StageTimer:
+    #   wall time spent in every render stage of one document
+    def __init__(self):
+        self.durationDict = dict()
+        self.countDict = dict()
+
+    @contextmanager
+    def measure(self, stage: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(stage, time.perf_counter() - start)
+
+    def add(self, stage: str, duration: float):
+        self.durationDict[stage] = self.durationDict.get(stage, 0.0) + duration
+        self.countDict[stage] = self.countDict.get(stage, 0) + 1
+
+    def toDict(self):
+        return {
+            stage: {
+                'seconds': self.durationDict[stage],
+                'count': self.countDict[stage]
+            }
+            for stage in renderStageList if stage in self.durationDict
+        }
@@ -0,0 +1,88 @@
+import os
+import pickle
+import copyreg
+import threading
+from openpyxl import load_workbook
+from openpyxl.worksheet.dimensions import DimensionHolder
+from utils import registerFormStyles
+
+#   DimensionHolder is a defaultdict bound to its worksheet and does not
+#   survive the default pickle protocol, the factory gets lost on load
+def _rebuildDimensionHolder(worksheet, reference, factoryName, maxOutline, dimensionDict):
+    defaultFactory = getattr(worksheet, factoryName) if factoryName is not None else None
+    holder = DimensionHolder(worksheet, reference, defaultFactory)
+    holder.max_outline = maxOutline
+    holder.update(dimensionDict)
+    return holder
+
+def _reduceDimensionHolder(holder: DimensionHolder):
+    factoryName = getattr(holder.default_factory, '__name__', None)
+    return (
+        _rebuildDimensionHolder,
+        (holder.worksheet, holder.reference, factoryName, holder.max_outline, dict(holder))
+    )
+
+copyreg.pickle(DimensionHolder, _reduceDimensionHolder)
+
+class TemplateCache:
+    #   Parse the template once and keep it as a pickled object graph,
+    #   unpickling is several times cheaper than load_workbook and every
+    #   caller gets a fully independent workbook
+    def __init__(self, templatePath: str):
+        self.templatePath = templatePath
+        self._lock = threading.Lock()
+        self._state = None
+        #   mtime of a file that failed to load, see _refresh
+        self._failedMtime = None
+
+    def _load(self, mtime: int):
+        workbook = load_workbook(filename = self.templatePath)
+        registerFormStyles(workbook)
+        payload = pickle.dumps(workbook, protocol=pickle.HIGHEST_PROTOCOL)
+        self._state = (mtime, payload)
+
+    def _refresh(self, isStrict: bool = False):
+        #   a file that does not load (half copied, broken revision) leaves
+        #   the last good workbook in place until it changes again, unless
+        #   isStrict
+        mtime = os.stat(self.templatePath).st_mtime_ns
+        state = self._state
+        if state is None or state[0] != mtime:
+            with self._lock:
+                state = self._state
+                if state is None or state[0] != mtime:
+                    if not isStrict and state is not None and self._failedMtime == mtime:
+                        return state
+                    try:
+                        self._load(mtime)
+                    except Exception:
+                        if isStrict or state is None:
+                            raise
+                        self._failedMtime = mtime
+                        return state
+                    state = self._state
+        return state
+
+    def preload(self):
+        #   raises when the file on disk does not load
+        self._refresh(True)
+
+    def getVersion(self):
+        mtime, _ = self._refresh()
+        return '{}@{}'.format(os.path.basename(self.templatePath), mtime)
+
+    def getWorkbook(self):
+        _, payload = self._refresh()
+        return pickle.loads(payload)
+
+_templateCacheDict = dict()
+_templateCacheLock = threading.Lock()
+
+def getTemplateCache(templatePath: str):
+    key = os.path.abspath(templatePath)
+    with _templateCacheLock:
+        templateCache = _templateCacheDict.get(key, None)
+        if templateCache is None:
+            templateCache = TemplateCache(templatePath)
+            _templateCacheDict[key] = templateCache
+    return templateCache
@@ -0,0 +1,214 @@
+import os
+import re
+import json
+import threading
+from zipfile import BadZipFile
+from openpyxl.utils.exceptions import InvalidFileException
+from form_spec import defaultAssetMap, defaultTemplateSheetName, AssetMap
+from template_cache import getTemplateCache
+from image_registry import imageRegistry
+from item_block import getItemBlock
+from xml_engine import getXmlTemplate
+
+#   Form templates under templateDir, every .xlsx with an optional sidecar
+#   .json of the same name:
+#
+#       {
+#           "id": "e-pcs-control-item",
+#           "version": "2",
+#           "sheet": "empty",
+#           "assets": {"sc_symbol": {"S-circle": "images/symbols/S-circle-v2.png"}}
+#       }
+#
+#   id defaults to the file name, version to "1", sheet to "empty" and the
+#   assets to form_spec's maps (see AssetMap.override). Templates are parsed
+#   and checked when they are found and kept warm (template cache, item
+#   block, xml fragments). Once start() is called a background thread looks
+#   at the directory again every reloadInterval seconds and reloads changed
+#   files, requests only read the last finished scan. A template that no
+#   longer loads keeps serving its last good state
+
+templateFileExtension = '.xlsx'
+sidecarFileExtension = '.json'
+
+class FormTemplate:
+    def __init__(self, templateId: str, version: str, path: str, sheetName: str, assetMap: AssetMap):
+        self.id = templateId
+        self.version = version
+        self.path = path
+        self.sheetName = sheetName
+        self.assetMap = assetMap
+
+    @property
+    def revision(self):
+        #   changes with the workbook file and the asset maps, for cache keys
+        return '{}:{}:{}'.format(getTemplateCache(self.path).getVersion(), self.sheetName, self.assetMap.digest)
+
+    def toDict(self):
+        return {
+            'template_id': self.id,
+            'version': self.version,
+            'file': os.path.basename(self.path),
+            'sheet': self.sheetName,
+            'revision': self.revision,
+            'assets': self.assetMap.toDict()
+        }
+
+def getVersionKey(version: str):
+    #   "10" sorts after "9", "1.10" after "1.9"
+    return [(0, int(part), '') if part.isdigit() else (1, 0, part) for part in re.split(r'(\d+)', version) if part != '']
+
+def _getFileKey(path: str):
+    try:
+        fileStat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (fileStat.st_mtime_ns, fileStat.st_size)
+
+def loadFormTemplate(path: str):
+    #   raises ValueError (or OSError) when the template cannot be used
+    sidecarPath = os.path.splitext(path)[0] + sidecarFileExtension
+    specDict = dict()
+    if os.path.exists(sidecarPath):
+        with open(sidecarPath, 'r', encoding='utf-8') as f:
+            specDict = json.load(f)
+        if not isinstance(specDict, dict):
+            raise ValueError('{} must hold an object'.format(os.path.basename(sidecarPath)))
+
+    templateId = str(specDict.get('id', os.path.splitext(os.path.basename(path))[0]))
+    version = str(specDict.get('version', '1'))
+    sheetName = specDict.get('sheet', defaultTemplateSheetName)
+    assetMap = defaultAssetMap.override(specDict.get('assets', {}))
+
+    for assetPath in assetMap.getPathList():
+        if not os.path.isfile(assetPath):
+            raise ValueError('Missing image {}'.format(assetPath))
+        imageRegistry.getAsset(assetPath)
+
+    templateCache = getTemplateCache(path)
+    try:
+        templateCache.preload()
+    except (BadZipFile, InvalidFileException, KeyError) as e:
+        raise ValueError('Unreadable workbook, {}'.format(e))
+    if sheetName not in templateCache.getWorkbook().sheetnames:
+        raise ValueError('Missing sheet {}'.format(sheetName))
+    #   both engines, the xml one also checks the workbook only has that sheet
+    getItemBlock(path, sheetName)
+    getXmlTemplate(path, sheetName)
+    return FormTemplate(templateId, version, path, sheetName, assetMap)
+
+class TemplateRegistry:
+    def __init__(self, templateDir: str, defaultTemplateId: str, reloadInterval: float = 2.0):
+        self.templateDir = templateDir
+        self.defaultTemplateId = defaultTemplateId
+        self.reloadInterval = reloadInterval
+        self._lock = threading.Lock()
+        self._stopEvent = threading.Event()
+        self._thread = None
+        #   template path -> (file keys, FormTemplate or None, error or None),
+        #   (id, version) -> FormTemplate and id -> versions newest first,
+        #   replaced as a whole by every scan
+        self._state = (dict(), dict(), dict())
+
+    def _getPathList(self):
+        return sorted(
+            os.path.join(self.templateDir, fileName)
+            for fileName in os.listdir(self.templateDir)
+            if fileName.lower().endswith(templateFileExtension) and not fileName.startswith('~$')
+        )
+
+    def _scan(self, isStrict: bool):
+        entryDict = dict()
+        for path in self._getPathList():
+            fileKey = (_getFileKey(path), _getFileKey(os.path.splitext(path)[0] + sidecarFileExtension))
+            entry = self._state[0].get(path, None)
+            if entry is not None and entry[0] == fileKey:
+                entryDict[path] = entry
+                continue
+            try:
+                entryDict[path] = (fileKey, loadFormTemplate(path), None)
+            except (OSError, ValueError) as e:
+                if isStrict:
+                    raise ValueError('Template {} is not usable, {}'.format(os.path.basename(path), e))
+                #   keep serving the last good state of a broken revision
+                previous = entry[1] if entry is not None else None
+                entryDict[path] = (fileKey, previous, '{}: {}'.format(type(e).__name__, e))
+
+        templateDict = dict()
+        for path, (fileKey, formTemplate, error) in entryDict.items():
+            if formTemplate is None:
+                continue
+            key = (formTemplate.id, formTemplate.version)
+            if key in templateDict:
+                message = 'Duplicate template {} version {}, also in {}'.format(
+                    formTemplate.id, formTemplate.version, os.path.basename(templateDict[key].path)
+                )
+                if isStrict:
+                    raise ValueError(message)
+                entryDict[path] = (fileKey, None, message)
+                continue
+            templateDict[key] = formTemplate
+        if isStrict and self.defaultTemplateId not in set(templateId for templateId, _ in templateDict):
+            raise ValueError('Default template {} not found in {}'.format(self.defaultTemplateId, self.templateDir))
+
+        versionDict = dict()
+        for templateId, version in templateDict:
+            versionDict.setdefault(templateId, []).append(version)
+        for versionList in versionDict.values():
+            versionList.sort(key=getVersionKey, reverse=True)
+
+        self._state = (entryDict, templateDict, versionDict)
+
+    def preload(self):
+        #   startup, every template has to load
+        with self._lock:
+            self._scan(True)
+
+    def refresh(self):
+        with self._lock:
+            self._scan(False)
+
+    def _run(self):
+        while not self._stopEvent.wait(self.reloadInterval):
+            try:
+                self.refresh()
+            except Exception:
+                #   the directory itself went away, try again next time
+                continue
+
+    def start(self):
+        #   in the serving process, threads do not survive a fork
+        if self._thread is None and self.reloadInterval > 0:
+            self._stopEvent.clear()
+            self._thread = threading.Thread(target=self._run, name='pcs-template-reload', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stopEvent.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def get(self, templateId: str = None, version: str = None):
+        #   newest version when version is None, None when there is no match
+        _, templateDict, versionDict = self._state
+        templateId = templateId if templateId is not None else self.defaultTemplateId
+        versionList = versionDict.get(templateId, None)
+        if not versionList:
+            return None
+        return templateDict.get((templateId, version if version is not None else versionList[0]), None)
+
+    def getTemplateList(self):
+        return list(self._state[1].values())
+
+    def list(self):
+        entryDict, _, versionDict = self._state
+        templateList = list()
+        for path, (_, formTemplate, error) in sorted(entryDict.items()):
+            templateDict = formTemplate.toDict() if formTemplate is not None else {'file': os.path.basename(path)}
+            if formTemplate is not None:
+                templateDict['default'] = formTemplate.id == self.defaultTemplateId and \
+                    versionDict[formTemplate.id][0] == formTemplate.version
+            templateDict['error'] = error
+            templateList.append(templateDict)
+        return templateList
@@ -0,0 +1,8 @@
+import os
+import sys
+
+#   the modules load templates and images by paths relative to the
+#   repository root, tests run from there
+rootDir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, rootDir)
+os.chdir(rootDir)
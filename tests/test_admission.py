@@ -0,0 +1,102 @@
+import json
+import time
+import threading
+import pytest
+from admission import AdmissionController, AdmissionRejectedError, RenderCost
+from render_plan import RenderPlan, PagePlan
+
+apiKey = 'akljnv13bvi2vfo0b0bw'
+
+def getCost(pageCount: int):
+    renderPlan = RenderPlan('openpyxl', 'image', 1)
+    for j in range(pageCount):
+        renderPlan.pageList.append(PagePlan('process-1-{}'.format(j + 1), 17, 40, 0, 138))
+    return RenderCost(renderPlan)
+
+def waitQueued(controller: AdmissionController, count: int):
+    deadline = time.monotonic() + 5
+    while len(controller._waitHeap) < count:
+        assert time.monotonic() < deadline
+        time.sleep(0.005)
+
+def startRender(controller: AdmissionController, cost: RenderCost, orderList: list, tag: str):
+    def render():
+        with controller.admit(cost, True):
+            orderList.append(tag)
+    thread = threading.Thread(target=render)
+    thread.start()
+    return thread
+
+def test_small_documents_overtake_large_ones():
+    controller = AdmissionController(1, 1024 ** 3, 8, 60)
+    orderList = list()
+    with controller.admit(getCost(1)):
+        threadList = [startRender(controller, getCost(40), orderList, 'large')]
+        waitQueued(controller, 1)
+        threadList.append(startRender(controller, getCost(1), orderList, 'small'))
+        waitQueued(controller, 2)
+    for thread in threadList:
+        thread.join(5)
+    assert orderList == ['small', 'large']
+
+def test_memory_budget_holds_back_a_second_render():
+    cost = getCost(10)
+    controller = AdmissionController(4, cost.bytes + cost.bytes // 2, 8, 60)
+    orderList = list()
+    with controller.admit(cost):
+        thread = startRender(controller, cost, orderList, 'second')
+        waitQueued(controller, 1)
+        assert orderList == []
+    thread.join(5)
+    assert orderList == ['second']
+
+def test_full_queue_is_rejected():
+    controller = AdmissionController(1, 1024 ** 3, 1, 60)
+    orderList = list()
+    with controller.admit(getCost(1)):
+        thread = startRender(controller, getCost(1), orderList, 'queued')
+        waitQueued(controller, 1)
+        with pytest.raises(AdmissionRejectedError) as e:
+            with controller.admit(getCost(1)):
+                pass
+    thread.join(5)
+    assert e.value.reason == 'queue_full'
+    assert e.value.retryAfter >= 1
+    assert orderList == ['queued']
+
+def test_wait_times_out():
+    controller = AdmissionController(1, 1024 ** 3, 8, 0.05)
+    with controller.admit(getCost(1)):
+        start = time.monotonic()
+        with pytest.raises(AdmissionRejectedError) as e:
+            with controller.admit(getCost(1)):
+                pass
+        assert time.monotonic() - start < 1
+    assert e.value.reason == 'timeout'
+    #   the rejected render left the queue
+    assert controller._waitHeap == []
+
+def test_failed_render_releases_its_slot():
+    controller = AdmissionController(1, 1024 ** 3, 0, 0)
+    with pytest.raises(ValueError):
+        with controller.admit(getCost(1)):
+            raise ValueError('render failed')
+    assert controller._activeDict == dict()
+    assert controller._memoryInUse == 0
+    #   no queue and no wait, only a free slot lets this one in
+    with controller.admit(getCost(1)):
+        pass
+
+def test_rejection_is_503_with_retry_after(monkeypatch):
+    import main
+    from fastapi.testclient import TestClient
+    controller = AdmissionController(1, 1024 ** 3, 0, 0)
+    monkeypatch.setattr(main, 'admissionController', controller)
+    with open('pcs_controlitem.json', 'r', encoding='utf-8') as f:
+        dataDict = json.load(f)
+    #   a document the result cache has not seen yet
+    dataDict['pcs_no'] = 'admission-test'
+    with controller.admit(getCost(1)):
+        response = TestClient(main.app).post('/convert_json_to_xlsx', json=dataDict, headers={'X-API-Key': apiKey})
+    assert response.status_code == 503
+    assert int(response.headers['Retry-After']) >= 1
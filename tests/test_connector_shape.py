@@ -0,0 +1,44 @@
+import json
+import pytest
+from zipfile import ZipFile
+from xml.etree import ElementTree
+from e_pcs_form import PCSForm
+from connector_shape import (
+    DashConnector,
+    insertConnectorAnchors,
+    spreadsheetDrawingNamespace,
+    drawingNamespace
+)
+
+templatePath = './templates/e-pcs-control-item-form-template.xlsx'
+
+def getConnectorList(drawingXml: str):
+    root = ElementTree.fromstring(drawingXml)
+    return root.findall('{{{}}}oneCellAnchor/{{{}}}cxnSp'.format(spreadsheetDrawingNamespace, spreadsheetDrawingNamespace))
+
+def assertDrawingConnector(connector):
+    line = connector.find('{{{}}}spPr/{{{}}}ln'.format(spreadsheetDrawingNamespace, drawingNamespace))
+    assert line is not None
+    assert line.find('{{{}}}custDash/{{{}}}ds'.format(drawingNamespace, drawingNamespace)) is not None
+
+@pytest.mark.parametrize('engine', ['openpyxl', 'xml'])
+def test_vector_drawing_connectors_resolve(engine):
+    with open('pcs_controlitem.json', 'r', encoding='utf-8') as f:
+        dataDict = json.load(f)
+    form = PCSForm(templatePath, dataDict, engine=engine, connectorMode='vector')
+    with form.generate() as buffer, ZipFile(buffer) as archive:
+        connectorList = list()
+        for name in archive.namelist():
+            if name.startswith('xl/drawings/drawing') and name.endswith('.xml'):
+                connectorList.extend(getConnectorList(archive.read(name).decode('utf-8')))
+    assert len(connectorList) > 0
+    for connector in connectorList:
+        assertDrawingConnector(connector)
+
+def test_connectors_resolve_under_a_prefixed_root():
+    #   lxml declares the namespaces where they are first used, the root
+    #   carries a prefix and no a: declaration
+    drawingXml = '<xdr:wsDr xmlns:xdr="{}"></xdr:wsDr>'.format(spreadsheetDrawingNamespace)
+    connector = DashConnector(1, 2, 0, 0, 0, 9525 * 10, 2, 2)
+    [connectorElement] = getConnectorList(insertConnectorAnchors(drawingXml, [connector], 2))
+    assertDrawingConnector(connectorElement)
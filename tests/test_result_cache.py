@@ -0,0 +1,124 @@
+import json
+import time
+import threading
+import pytest
+from result_cache import ResultCache, getResultKey, isETagMatched
+
+apiKey = 'akljnv13bvi2vfo0b0bw'
+waiterCount = 4
+
+class BlockedRender:
+    #   renders once released, counting its calls
+    def __init__(self, content: bytes = None, error: Exception = None):
+        self.content = content
+        self.error = error
+        self.callCount = 0
+        self.startedEvent = threading.Event()
+        self.releaseEvent = threading.Event()
+
+    def __call__(self):
+        self.callCount += 1
+        self.startedEvent.set()
+        assert self.releaseEvent.wait(5)
+        if self.error is not None:
+            raise self.error
+        return self.content
+
+def runTogether(cache: ResultCache, key: str, renderFunc: BlockedRender):
+    #   the owner starts rendering, the waiters then ask for the same key
+    #   at once and the render is released once they are waiting
+    resultList = [None] * (waiterCount + 1)
+    barrier = threading.Barrier(waiterCount + 1)
+
+    def call(index: int):
+        if index > 0:
+            barrier.wait()
+        try:
+            resultList[index] = cache.getOrRender(key, renderFunc)
+        except Exception as e:
+            resultList[index] = e
+
+    threadList = [threading.Thread(target=call, args=(0,))]
+    threadList[0].start()
+    assert renderFunc.startedEvent.wait(5)
+    for index in range(1, waiterCount + 1):
+        threadList.append(threading.Thread(target=call, args=(index,)))
+        threadList[-1].start()
+    barrier.wait()
+    time.sleep(0.1)
+    renderFunc.releaseEvent.set()
+    for thread in threadList:
+        thread.join(5)
+    return resultList
+
+def test_identical_requests_share_one_render():
+    cache = ResultCache(1024)
+    renderFunc = BlockedRender(content=b'workbook')
+    resultList = runTogether(cache, 'key', renderFunc)
+    assert renderFunc.callCount == 1
+    assert resultList == [b'workbook'] * (waiterCount + 1)
+    assert cache.get('key') == b'workbook'
+
+def test_failed_render_reaches_every_waiter_and_is_not_cached():
+    cache = ResultCache(1024)
+    error = ValueError('render failed')
+    renderFunc = BlockedRender(error=error)
+    resultList = runTogether(cache, 'key', renderFunc)
+    assert renderFunc.callCount == 1
+    assert all(result is error for result in resultList)
+    assert cache.get('key') is None
+    #   the next request renders again
+    assert cache.getOrRender('key', lambda: b'workbook') == b'workbook'
+
+def test_least_recently_used_results_are_evicted_by_bytes():
+    cache = ResultCache(10)
+    cache.put('a', b'aaaa')
+    cache.put('b', b'bbbb')
+    assert cache.get('a') == b'aaaa'
+    cache.getOrRender('c', lambda: b'cccc')
+    assert cache.get('b') is None
+    assert cache.get('a') == b'aaaa'
+    assert cache.get('c') == b'cccc'
+    #   a result over the whole budget is never kept
+    cache.put('d', b'd' * 11)
+    assert cache.get('d') is None
+    assert cache.get('a') == b'aaaa'
+
+def test_result_key_ignores_key_order_and_follows_the_template():
+    assert getResultKey({'a': 1, 'b': 2}, 'v1') == getResultKey({'b': 2, 'a': 1}, 'v1')
+    assert getResultKey({'a': 1}, 'v1') != getResultKey({'a': 1}, 'v2')
+
+@pytest.mark.parametrize('ifNoneMatch, isMatched', [
+    (None, False),
+    ('"abc"', True),
+    ('W/"abc"', True),
+    ('"other", "abc"', True),
+    ('*', True),
+    ('"other"', False),
+    ('abc', False)
+])
+def test_etag_matching(ifNoneMatch, isMatched):
+    assert isETagMatched(ifNoneMatch, '"abc"') == isMatched
+
+def test_matching_etag_is_304():
+    import main
+    from fastapi.testclient import TestClient
+    if main.resultCache is None:
+        pytest.skip('RESULT_CACHE_SIZE is 0')
+    client = TestClient(main.app)
+    with open('pcs_controlitem.json', 'r', encoding='utf-8') as f:
+        dataDict = json.load(f)
+    headers = {'X-API-Key': apiKey}
+    response = client.post('/convert_json_to_xlsx', json=dataDict, headers=headers)
+    assert response.status_code == 200
+    etag = response.headers['ETag']
+
+    response = client.post('/convert_json_to_xlsx', json=dataDict, headers=dict(headers, **{'If-None-Match': etag}))
+    assert response.status_code == 304
+    assert response.content == b''
+    assert response.headers['ETag'] == etag
+
+    dataDict['pcs_no'] = 'etag-test'
+    response = client.post('/convert_json_to_xlsx', json=dataDict, headers=dict(headers, **{'If-None-Match': etag}))
+    assert response.status_code == 200
+    assert response.headers['ETag'] != etag
@@ -0,0 +1,52 @@
+import json
+import copy
+from openpyxl.drawing.spreadsheet_drawing import AbsoluteAnchor
+from e_pcs_form import PCSForm
+from timing_plan import planTimingFlow
+
+templatePath = './templates/e-pcs-control-item-form-template.xlsx'
+
+def getDocument(itemCount: int, symbolEvery: int = 1):
+    with open('pcs_controlitem.json', 'r', encoding='utf-8') as f:
+        dataDict = json.load(f)
+    itemList = list()
+    for i in range(itemCount):
+        itemDict = copy.deepcopy(dataDict['processes'][0]['items'][0])
+        itemDict['check_timing'] = 'During'
+        itemDict['sc_symbols'] = [{'character': 'S', 'shape': 'circle'}] if i % symbolEvery == 0 else []
+        itemList.append(itemDict)
+    dataDict['processes'] = [dict(dataDict['processes'][0], items=itemList)]
+    return dataDict
+
+def renderSheets(dataDict: dict):
+    form = PCSForm(templatePath, dataDict)
+    form.generate().close()
+    timingPlan = planTimingFlow(dataDict['processes'][0]['items'])
+    return [(form.workbook[name], timingPlan.getPage(j)) for j, name in enumerate(form.workbook.sheetnames)]
+
+def getSummaryCount(sheet):
+    return len([img for img in sheet._images if isinstance(img.anchor, AbsoluteAnchor)])
+
+def test_anchors_per_sheet_grow_linearly_with_items():
+    #   an all During flow is only drawn from three items up (see
+    #   render_plan), the smallest document has a few
+    smallCount = 4
+    itemCount = 8
+    anchorCountList = list()
+    for count in [smallCount, itemCount, 2 * itemCount]:
+        [(sheet, placementList)] = renderSheets(getDocument(count))
+        #   the summary is one symbol and its counter, whatever the item count
+        assert getSummaryCount(sheet) == 2
+        #   the timing flow is laid out by timing_plan, leave it out
+        anchorCountList.append(len(sheet._images) - len(placementList))
+
+    perItem = (anchorCountList[2] - anchorCountList[1]) / itemCount
+    #   sc symbol, check timing symbol and the dash to the flow
+    assert perItem == 3
+    assert anchorCountList[1] == anchorCountList[0] + perItem * (itemCount - smallCount)
+
+def test_summary_is_drawn_once_per_page():
+    sheetList = renderSheets(getDocument(30, symbolEvery=2))
+    assert len(sheetList) == 2
+    for sheet, _ in sheetList:
+        assert getSummaryCount(sheet) == 2
@@ -0,0 +1,129 @@
+import io
+import json
+import copy
+import zipfile
+import pytest
+from pydantic import ValidationError
+from schemas import decodeDocument, decodeDocumentList, InvalidDocumentError
+from form_spec import itemSlotCount, counterPathMap, scSymbolPerItemLimit
+
+apiKey = 'akljnv13bvi2vfo0b0bw'
+symbol = {'character': 'S', 'shape': 'circle'}
+
+def getDocument():
+    with open('pcs_controlitem.json', 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def getDocumentWithItems(itemCount: int, symbolCount: int):
+    #   one process, the first symbolCount items carry a symbol each
+    dataDict = getDocument()
+    itemList = list()
+    for i in range(itemCount):
+        itemDict = copy.deepcopy(dataDict['processes'][0]['items'][0])
+        itemDict['sc_symbols'] = [symbol] if i < symbolCount else []
+        itemList.append(itemDict)
+    dataDict['processes'] = [dict(dataDict['processes'][0], items=itemList)]
+    return dataDict
+
+def decode(dataDict: dict):
+    return decodeDocument(json.dumps(dataDict))
+
+def getErrorMessage(dataDict: dict):
+    with pytest.raises(ValidationError) as e:
+        decode(dataDict)
+    return str(e.value)
+
+def test_sample_document_is_accepted():
+    dataDict = getDocument()
+    assert decode(dataDict) == dataDict
+
+def test_document_without_processes_is_rejected():
+    dataDict = getDocument()
+    dataDict['processes'] = []
+    assert 'at least 1 item' in getErrorMessage(dataDict)
+
+def test_document_without_items_is_rejected():
+    dataDict = getDocument()
+    for processDict in dataDict['processes']:
+        processDict['items'] = []
+    assert 'Document has no items to render' in getErrorMessage(dataDict)
+
+def test_empty_process_next_to_others_is_accepted():
+    #   it gets no page, the other processes still render
+    dataDict = getDocument()
+    dataDict['processes'].append(dict(dataDict['processes'][0], items=[]))
+    assert decode(dataDict)['processes'][-1]['items'] == []
+
+def test_page_symbol_count_is_limited():
+    symbolLimit = len(counterPathMap)
+    assert itemSlotCount > symbolLimit
+    decode(getDocumentWithItems(itemSlotCount, symbolLimit))
+    assert 'sc symbol S-circle is used {} times on page 1'.format(symbolLimit + 1) in getErrorMessage(
+        getDocumentWithItems(itemSlotCount, symbolLimit + 1)
+    )
+
+def test_page_symbol_count_is_per_page():
+    #   the same symbols spread over two pages fit
+    dataDict = getDocumentWithItems(2 * itemSlotCount, 0)
+    itemList = dataDict['processes'][0]['items']
+    for itemDict in itemList[itemSlotCount - 10:itemSlotCount + 10]:
+        itemDict['sc_symbols'] = [symbol]
+    decode(dataDict)
+
+def test_item_symbol_count_is_limited():
+    dataDict = getDocument()
+    dataDict['processes'][0]['items'][0]['sc_symbols'] = [symbol] * (scSymbolPerItemLimit + 1)
+    assert 'sc_symbols' in getErrorMessage(dataDict)
+
+def test_unregistered_symbol_is_rejected():
+    dataDict = getDocument()
+    dataDict['processes'][0]['items'][0]['sc_symbols'] = [{'character': 'X', 'shape': 'star'}]
+    assert 'Unregistered sc symbol, X-star' in getErrorMessage(dataDict)
+
+def test_numbers_for_text_fields_become_text():
+    dataDict = getDocument()
+    itemDict = dataDict['processes'][0]['items'][0]
+    itemDict['measurement'] = 5
+    itemDict['parameter']['unit'] = 0.5
+    itemDict['control_method']['sample_no'] = 3
+    itemDict = decode(dataDict)['processes'][0]['items'][0]
+    assert itemDict['measurement'] == '5'
+    assert itemDict['parameter']['unit'] == '0.5'
+    #   int fields stay numbers
+    assert itemDict['control_method']['sample_no'] == 3
+
+def test_batch_documents_are_validated_one_by_one():
+    dataDict = getDocument()
+    emptyDict = dict(dataDict, processes=[])
+    documentList = decodeDocumentList(json.dumps([dataDict, emptyDict, 5]))
+    assert documentList[0] == dataDict
+    assert isinstance(documentList[1], InvalidDocumentError)
+    assert 'processes' in str(documentList[1])
+    assert isinstance(documentList[2], InvalidDocumentError)
+    with pytest.raises(ValidationError):
+        decodeDocumentList(json.dumps(dataDict))
+
+def test_api_rejects_empty_documents_with_422():
+    import main
+    from fastapi.testclient import TestClient
+    dataDict = getDocument()
+    dataDict['processes'] = []
+    response = TestClient(main.app).post('/plan_json_to_xlsx', json=dataDict, headers={'X-API-Key': apiKey})
+    assert response.status_code == 422
+    assert response.json()['detail'][0]['loc'] == ['body', 'processes']
+
+def test_batch_manifest_reports_invalid_documents():
+    import main
+    from fastapi.testclient import TestClient
+    dataDict = getDocument()
+    badDict = getDocumentWithItems(itemSlotCount, len(counterPathMap) + 1)
+    response = TestClient(main.app).post('/convert_json_to_xlsx_batch', json=[dataDict, badDict], headers={'X-API-Key': apiKey})
+    assert response.status_code == 200
+    with zipfile.ZipFile(io.BytesIO(response.content)) as archive:
+        manifestList = json.loads(archive.read('manifest.json'))
+        assert manifestList[0]['status'] == 'done'
+        assert manifestList[0]['file'] in archive.namelist()
+    assert manifestList[1]['status'] == 'failed'
+    assert manifestList[1]['file'] is None
+    assert 'InvalidDocumentError' in manifestList[1]['error']
+    assert 'sc symbol S-circle is used' in manifestList[1]['error']
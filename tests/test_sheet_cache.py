@@ -0,0 +1,41 @@
+import json
+import shutil
+from copy import copy
+from openpyxl import load_workbook
+from openpyxl.styles import Font
+import item_block
+from e_pcs_form import PCSForm
+from result_cache import ResultCache
+from form_spec import itemStartRow
+
+templatePath = './templates/e-pcs-control-item-form-template.xlsx'
+
+def getItemStyleList(buffer):
+    sheet = load_workbook(buffer)['process-1-1']
+    #   copies, the style proxies of two workbooks never compare equal
+    return [
+        (copy(cell.font), copy(cell.border), copy(cell.alignment))
+        for row in sheet.iter_rows(min_row=itemStartRow, max_row=itemStartRow + 2)
+        for cell in row
+    ]
+
+def test_cached_sheets_keep_item_block_styles(tmp_path, monkeypatch):
+    #   item rows with a font registerFormStyles does not add, the item
+    #   block registers it in every workbook
+    itemFont = Font(name='CordiaUPC', size=11, italic=True)
+    monkeypatch.setattr(item_block, 'textNormalStyle', itemFont)
+    copyPath = str(tmp_path / 'template.xlsx')
+    shutil.copy(templatePath, copyPath)
+    with open('pcs_controlitem.json', 'r', encoding='utf-8') as f:
+        dataDict = json.load(f)
+
+    sheetCache = ResultCache(64 * 1024 * 1024)
+    styleListList = list()
+    for _ in range(2):
+        form = PCSForm(copyPath, dataDict, sheetCache=sheetCache)
+        with form.generate() as buffer:
+            styleListList.append(getItemStyleList(buffer))
+    #   the second render took every process from the cache
+    assert form.stageTimer.toDict().get('write_item', None) is None
+    assert itemFont in [font for font, _, _ in styleListList[0]]
+    assert styleListList[1] == styleListList[0]
@@ -0,0 +1,16 @@
+from template_cache import getTemplateCache
+
+templatePath = './templates/e-pcs-control-item-form-template.xlsx'
+
+def test_cached_workbook_keeps_dimension_factories():
+    sheet = getTemplateCache(templatePath).getWorkbook()['empty']
+    #   missing keys are created by the holder's factory, not a KeyError
+    assert sheet.column_dimensions['ZZ'].index == 'ZZ'
+    assert sheet.row_dimensions[500].index == 500
+
+def test_cached_workbooks_are_independent():
+    templateCache = getTemplateCache(templatePath)
+    first = templateCache.getWorkbook()
+    second = templateCache.getWorkbook()
+    first['empty'].cell(row=1, column=1).value = 'changed'
+    assert second['empty'].cell(row=1, column=1).value != 'changed'
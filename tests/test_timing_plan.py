@@ -0,0 +1,49 @@
+import pytest
+from timing_plan import planTimingFlow
+from form_spec import itemSlotCount
+
+def getItemList(timingPattern: list, itemCount: int):
+    return [{'check_timing': timingPattern[i % len(timingPattern)]} for i in range(itemCount)]
+
+@pytest.mark.parametrize('timingPattern', [
+    ['Before', 'After'],
+    ['Before', 'Before', 'After', 'After']
+])
+def test_placements_grow_linearly_with_items(timingPattern):
+    #   item counts on one page, then on two, stepping by whole patterns
+    for countList in [[4, 8, 12, 16], [20, 24, 28, 32]]:
+        placementCountList = [len(planTimingFlow(getItemList(timingPattern, count)).placementList) for count in countList]
+        stepList = [b - a for a, b in zip(placementCountList, placementCountList[1:])]
+        assert len(set(stepList)) == 1
+        assert stepList[0] > 0
+
+@pytest.mark.parametrize('timingPattern, itemCount', [
+    (['Before', 'After'], 30),
+    (['Before', 'During', 'After'], 20),
+    (['Before', 'Before', 'During', 'During', 'After', 'After'], 30),
+    (['During'], 30)
+])
+def test_pages_hold_their_own_placements(timingPattern, itemCount):
+    timingPlan = planTimingFlow(getItemList(timingPattern, itemCount))
+    assert timingPlan.pageCount == (itemCount + itemSlotCount - 1) // itemSlotCount
+    placementList = list()
+    for pageIndex in range(timingPlan.pageCount):
+        pagePlacementList = timingPlan.getPage(pageIndex)
+        assert all(placement.page == pageIndex for placement in pagePlacementList)
+        #   one landing marker per page, drawn where the flow lands
+        assert [placement.kind for placement in pagePlacementList].count('check_process') == 1
+        placementList.extend(pagePlacementList)
+    assert placementList == timingPlan.placementList
+
+def test_runs_are_joined_next_to_their_last_item():
+    timingPlan = planTimingFlow(getItemList(['Before', 'Before', 'After', 'After'], 8))
+    slotPlacementList = [placement for placement in timingPlan.placementList if placement.slot is not None]
+    assert [placement.slot for placement in slotPlacementList] == [1, 3, 5, 7]
+    assert all(placement.kind == 'vertical_dash' for placement in slotPlacementList)
+
+def test_flows_pcsform_cannot_draw_raise():
+    #   a lone item and a flow of Before items only have nowhere to land
+    #   (see render_plan)
+    for itemList in [getItemList(['During'], 1), getItemList(['Before'], 4)]:
+        with pytest.raises(TypeError):
+            planTimingFlow(itemList)
@@ -0,0 +1,201 @@
+from form_spec import itemStartRow, itemRowStep, itemSlotCount
+
+#   Layout of the check timing flow of one process, the dashed lines, their
+#   connectors and the check process marker of every page. The timing lists,
+#   their groups and the land process of each page are worked out once per
+#   process instead of once per page, pages then only take their own slice
+#   of placements. Rows, offsets and lengths are the ones PCSForm always
+#   drew, including the lines it runs past the page they start on
+
+class TimingPlacement:
+    __slots__ = ('page', 'kind', 'row', 'col', 'rowOff', 'colOff', 'height', 'slot')
+
+    def __init__(self, page: int, kind: str, row, col: int, rowOff, colOff, height = None, slot: int = None):
+        self.page = page
+        #   vertical_dash and horizontal_dash are the dashed flow lines,
+        #   check_process is the marker where the flow lands on the process
+        self.kind = kind
+        #   anchor cell and pixel offsets, as drawImage takes them
+        self.row = row
+        self.col = col
+        self.rowOff = rowOff
+        self.colOff = colOff
+        #   vertical_dash only, in the units getVerticalDashLine takes
+        self.height = height
+        #   item slot the placement is drawn with, None for the page flow
+        #   which goes before the items
+        self.slot = slot
+
+def _groupConsecutive(indexList: list):
+    groupList = list()
+    for index in indexList:
+        if groupList and groupList[-1][-1] == index - 1:
+            groupList[-1].append(index)
+        else:
+            groupList.append([index])
+    return groupList
+
+def _getCenter(group: list):
+    return group[0] if len(group) == 1 else group[int(len(group) / 2)]
+
+class TimingPlan:
+    def __init__(self, timingList: list):
+        #   timingList holds the check timing of every item of the process
+        self.timingList = timingList
+        self.itemCount = len(timingList)
+        self.duringList = [i for i, timing in enumerate(timingList) if timing == 'During']
+        self.beforeList = [i for i, timing in enumerate(timingList) if timing == 'Before']
+        self.afterList = [i for i, timing in enumerate(timingList) if timing == 'After']
+        self.duringSingleList = [group[0] for group in _groupConsecutive(self.duringList) if len(group) == 1]
+        self.beforeGroupList = _groupConsecutive(self.beforeList)
+        self.afterGroupList = _groupConsecutive(self.afterList)
+        self.lastIndex = max(
+            [indexList[-1] for indexList in [self.duringList, self.beforeList, self.afterList] if indexList],
+            default=None
+        )
+
+        self.placementList = list()
+        #   placementList[pageStartList[page]:pageStartList[page + 1]]
+        self.pageStartList = [0]
+        for pageIndex in range((self.itemCount + itemSlotCount - 1) // itemSlotCount):
+            self._planPage(pageIndex)
+            self.pageStartList.append(len(self.placementList))
+
+    @property
+    def pageCount(self):
+        return len(self.pageStartList) - 1
+
+    def getPage(self, pageIndex: int):
+        return self.placementList[self.pageStartList[pageIndex]:self.pageStartList[pageIndex + 1]]
+
+    def _add(self, pageIndex: int, kind: str, row, col: int, rowOff, colOff, height = None, slot: int = None):
+        self.placementList.append(TimingPlacement(pageIndex, kind, row, col, rowOff, colOff, height, slot))
+
+    def _addLine(self, pageIndex: int, height, row, rowOff):
+        self._add(pageIndex, 'vertical_dash', row, 0, rowOff, 8, height)
+
+    def _addConnector(self, pageIndex: int, row):
+        self._add(pageIndex, 'horizontal_dash', row, 0, 7, 10)
+
+    def _getLandProcess(self, pageIndex: int, startNumber: int, pageItemCount: int):
+        #   (index, row) of the item the flow lands on, or (None, None) when
+        #   the page has none, the horizontal connector of a during land is
+        #   placed on the way
+        lastPageIndex = pageItemCount + startNumber - 1
+        if len(self.duringList) > 0:
+            if len(self.beforeList) == 0 and len(self.afterList) == 0:
+                landIndex = self.itemCount / 2
+            elif len(self.beforeList) == 0:
+                if startNumber == 0:
+                    self._addConnector(pageIndex, itemStartRow)
+                    return 0, itemStartRow
+                return None, None
+            else:
+                landIndex = self.duringList[int(len(self.duringList) / 2)]
+            if landIndex < lastPageIndex:
+                landRow = itemStartRow + (itemRowStep * (landIndex - startNumber))
+                self._addConnector(pageIndex, landRow)
+                return int(landIndex), landRow
+            return None, None
+
+        if len(self.beforeList) == 0:
+            if startNumber == 0:
+                return 0, itemStartRow
+        elif len(self.afterList) == 0:
+            if startNumber > 0:
+                return pageItemCount - 1, itemStartRow + (itemRowStep * (pageItemCount - 1) + 1)
+        else:
+            landIndex = (self.beforeList[-1] + self.afterList[0]) / 2
+            if landIndex < lastPageIndex:
+                return int(landIndex), itemStartRow + (itemRowStep * (landIndex - startNumber))
+        return None, None
+
+    def _planPage(self, pageIndex: int):
+        startNumber = pageIndex * itemSlotCount
+        pageItemCount = min(itemSlotCount, self.itemCount - startNumber)
+
+        landProcessIndex, landProcessRow = self._getLandProcess(pageIndex, startNumber, pageItemCount)
+
+        #   the process continues on the next page
+        if self.lastIndex is not None and self.lastIndex > (startNumber + 1) * itemSlotCount:
+            self._addLine(pageIndex, (itemSlotCount - landProcessIndex) * 2.88, itemStartRow + (landProcessIndex * itemRowStep), 8)
+
+        for duringIndex in self.duringSingleList:
+            if landProcessIndex < startNumber and duringIndex >= startNumber:
+                adjustedValue = duringIndex - startNumber + 1
+                self._addLine(pageIndex, ((adjustedValue - 1) * 2.99 if adjustedValue > 0 else 0) + 1.5, itemStartRow - 1, 0)
+            if duringIndex < pageItemCount + startNumber:
+                self._addConnector(pageIndex, itemStartRow + (itemRowStep * (duringIndex - startNumber)))
+
+        for afterGroup in self.afterGroupList:
+            afterCenterValue = _getCenter(afterGroup)
+            if landProcessIndex >= startNumber:
+                self._addLine(pageIndex, (afterCenterValue - landProcessIndex) * 2.99, itemStartRow + (itemRowStep * landProcessIndex), 8)
+                self._addConnector(pageIndex, itemStartRow + (itemRowStep * afterCenterValue))
+            elif afterGroup[-1] >= startNumber:
+                adjustedCenterValue = ((afterCenterValue if afterCenterValue >= startNumber else startNumber) - startNumber)
+                self._addLine(pageIndex, ((adjustedCenterValue - 1) * 2.99 if adjustedCenterValue > 0 else 0) + 1.5, itemStartRow - 1, 0)
+                self._addConnector(pageIndex, itemStartRow + (itemRowStep * adjustedCenterValue))
+
+        for beforeGroup in self.beforeGroupList:
+            beforeCenterValue = _getCenter(beforeGroup)
+            if landProcessIndex >= startNumber:
+                self._addLine(pageIndex, abs(beforeCenterValue - landProcessIndex) * 2.99, itemStartRow + (itemRowStep * beforeCenterValue), 8)
+                self._addConnector(pageIndex, itemStartRow + (itemRowStep * beforeCenterValue))
+            elif beforeGroup[-1] >= startNumber:
+                adjustedCenterValue = ((beforeCenterValue if beforeCenterValue >= startNumber else startNumber) - startNumber)
+                self._addLine(pageIndex, ((adjustedCenterValue - 1) * 2.99 if adjustedCenterValue > 0 else 0) + 1.5, itemStartRow, 8)
+                self._addConnector(pageIndex, itemStartRow + (itemRowStep * beforeCenterValue))
+
+        self._add(pageIndex, 'check_process', landProcessRow, 0, 0, 0)
+        self._planItemGroups(pageIndex, startNumber, pageItemCount)
+
+    def _planItemGroups(self, pageIndex: int, startNumber: int, pageItemCount: int):
+        #   runs of items with the same check timing are joined next to the
+        #   item symbols, a run carried over from the previous page starts
+        #   above the first slot
+        groupValue = None
+        groupStart = None
+        groupLength = None
+        isInheritGroup = False
+
+        for i in range(pageItemCount):
+            currentIndex = i + startNumber
+            timing = self.timingList[currentIndex]
+            if i == 0 and startNumber != 0 and self.timingList[currentIndex - 1] == timing:
+                groupValue = timing
+                groupStart = 0
+                groupLength = 0
+                isInheritGroup = True
+
+            if groupValue == timing:
+                groupLength += 1
+
+            if groupValue is None:
+                groupValue = timing
+                groupStart = i
+                groupLength = 1
+
+            isProcessEnd = currentIndex + 1 >= self.itemCount
+            isPageEnd = i + 1 >= pageItemCount
+            if isProcessEnd or isPageEnd or self.timingList[currentIndex + 1] != groupValue:
+                if groupLength > 1:
+                    if isProcessEnd or not isPageEnd:
+                        height = (groupLength * 2.99) - 3 + 1.5 if isInheritGroup else (groupLength * 2.99) - 3
+                    elif groupValue == self.timingList[currentIndex + 1]:
+                        height = (groupLength * 2.99) - 3 + 1.5 + 1.5 if isInheritGroup else (groupLength * 2.99) - 3 + 1.5
+                    else:
+                        height = 0
+                    self._add(
+                        pageIndex, 'vertical_dash',
+                        itemStartRow + (itemRowStep * groupStart), 1,
+                        8 - 28 if isInheritGroup else 8, 4,
+                        height, i
+                    )
+                groupValue = None
+                groupStart = None
+                groupLength = None
+                isInheritGroup = False
+
+def planTimingFlow(itemList: list):
+    return TimingPlan([itemDict['check_timing'] for itemDict in itemList])
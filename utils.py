@@ -1,11 +1,14 @@
+from io import BytesIO
 from PIL import Image, ImageDraw
-from datetime import datetime
 from openpyxl.styles.borders import Border, Side
 from openpyxl.styles.alignment import Alignment
 from openpyxl.styles.fonts import Font
 from openpyxl.drawing.text import TextField
 
 outputDir = 'output'
+# generated workbooks larger than this spill from memory to a temp file
+spoolMaxSize = 16 * 1024 * 1024
+streamChunkSize = 64 * 1024
 bottomRightBorder = Border(
     bottom = Side(style='thin'),
     right = Side(style='thin'),
@@ -40,12 +43,34 @@ topLeftAlignment = Alignment(
 headerNormalStyle = Font(name='CordiaUPC', size=12, color='000000')
 textNormalStyle = Font(name='CordiaUPC', size=10, color='000000')
 
+def registerFormStyles(workbook):
+    # register every style the form writes up front, style ids are then
+    # identical in every workbook cloned from the same template
+    for font in (headerNormalStyle, textNormalStyle):
+        workbook._fonts.add(font)
+    for alignment in (leftCenterAlignment, topCenterAlignment, centerCenterAlignment, topLeftAlignment):
+        workbook._alignments.add(alignment)
+    for border in (bottomRightBorder, rightBorder, bottomBorder):
+        workbook._borders.add(border)
+
 def getOutputFilePath(fileName):
     return '{outputDir}/{fileName}.xlsx'.format(
         outputDir = outputDir,
         fileName = fileName
     )
 
+def iterFileChunks(fileObj, chunkSize: int = streamChunkSize):
+    # yield the file content and always close it, also when the client
+    # disconnects half way and the generator is discarded
+    try:
+        while True:
+            data = fileObj.read(chunkSize)
+            if not data:
+                break
+            yield data
+    finally:
+        fileObj.close()
+
 def chunk(iterable, chunk_size):
     # Initialize an empty list to store the chunks
     chunks = []
@@ -69,8 +94,6 @@ def drawVerticalDashedLine(height: int):
     for y in range(cur_y, height, length + space):
         d.line([0, y, 0, y + length], fill=(0, 0, 0), width=1)
     # img.show()
-    filename = "temp/" + datetime.now().strftime("%Y%m%d%H%M%S%f") + ".png"
-    # print(filename)
-    img.save(filename)
-    return filename
-    
+    buffer = BytesIO()
+    img.save(buffer, format='png')
+    return buffer.getvalue()
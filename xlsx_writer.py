@@ -0,0 +1,54 @@
+import hashlib
+from zipfile import ZipFile, ZIP_DEFLATED
+from openpyxl.writer.excel import ExcelWriter
+from openpyxl.packaging.relationship import get_rels_path
+from openpyxl.xml.functions import tostring
+from connector_shape import insertConnectorAnchors
+
+def _getImageDigest(img):
+    digest = getattr(img, 'digest', None)
+    if digest is None:
+        digest = hashlib.sha1(img._data()).hexdigest()
+    return digest
+
+class DedupeExcelWriter(ExcelWriter):
+    #   Every distinct image is stored once under xl/media and all drawings
+    #   reference that single part, openpyxl would write one part per placement
+    def __init__(self, workbook, archive):
+        super().__init__(workbook, archive)
+        self._imageIdDict = dict()
+
+    def write_worksheet(self, ws):
+        super().write_worksheet(ws)
+        #   dashed lines drawn as shapes (see connector_shape), every page
+        #   carries the logo so the drawing part is always written
+        ws._drawing.connectors = getattr(ws, '_connectors', [])
+
+    def _write_drawing(self, drawing):
+        self._drawings.append(drawing)
+        drawing._id = len(self._drawings)
+        for chart in drawing.charts:
+            self._charts.append(chart)
+            chart._id = len(self._charts)
+        for img in drawing.images:
+            digest = _getImageDigest(img)
+            imageId = self._imageIdDict.get(digest, None)
+            if imageId is None:
+                self._images.append(img)
+                imageId = len(self._images)
+                self._imageIdDict[digest] = imageId
+            img._id = imageId
+        rels_path = get_rels_path(drawing.path)[1:]
+        drawingXml = tostring(drawing._write()).decode('utf-8')
+        drawingXml = insertConnectorAnchors(drawingXml, getattr(drawing, 'connectors', []), len(drawing.images) + 1)
+        self._archive.writestr(drawing.path[1:], drawingXml)
+        self._archive.writestr(rels_path, tostring(drawing._write_rels()))
+        self.manifest.append(drawing)
+
+def saveWorkbook(workbook, filename):
+    #   the archive is closed on a failed save too, a ZipFile left open
+    #   writes into the caller's buffer from __del__ after it was closed
+    with ZipFile(filename, 'w', ZIP_DEFLATED, allowZip64=True) as archive:
+        writer = DedupeExcelWriter(workbook, archive)
+        writer.save()
+    return True
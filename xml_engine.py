@@ -0,0 +1,423 @@
+import os
+import re
+import threading
+from copy import copy
+from xml.sax.saxutils import escape
+from zipfile import ZipFile, ZIP_DEFLATED
+from openpyxl.cell.cell import Cell, MergedCell
+from openpyxl.compat import safe_string
+from openpyxl.drawing.spreadsheet_drawing import SpreadsheetDrawing, OneCellAnchor, AbsoluteAnchor
+from openpyxl.utils import get_column_letter
+from openpyxl.worksheet._writer import WorksheetWriter
+from openpyxl.worksheet.cell_range import CellRange, MultiCellRange
+from openpyxl.worksheet.merge import MergedCellRange
+from openpyxl.worksheet.worksheet import Worksheet
+from openpyxl.writer.excel import ExcelWriter
+from template_cache import getTemplateCache
+from image_registry import imageRegistry
+from connector_shape import insertConnectorAnchors
+
+#   Direct SpreadsheetML writer. The template sheet is written once through
+#   openpyxl and split into fixed XML fragments, its cells are pre-rendered
+#   as <c> strings. Pages only hold the cells the form touches and every
+#   finished page goes straight into the zip as sheet and drawing XML and
+#   is released, only its title and drawing number are kept for the
+#   workbook part and the manifest.
+
+SHEET_NS = 'http://schemas.openxmlformats.org/spreadsheetml/2006/main'
+REL_NS = 'http://schemas.openxmlformats.org/package/2006/relationships'
+DRAWING_REL = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships/drawing'
+IMAGE_REL = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships/image'
+
+_dimensionPattern = re.compile(r'<dimension ref="[^"]*"\s*/>')
+_mergeCellsPattern = re.compile(r'<mergeCells\b.*?</mergeCells>', re.S)
+_drawingPattern = re.compile(r'<drawing\b[^>]*/>')
+_relIdPattern = re.compile(r'r:id="([^"]+)"')
+
+def _escapeAttr(value: str):
+    return escape(value, {'"': '&quot;', '\n': '&#10;', '\r': '&#13;', '\t': '&#09;'})
+
+def renderCellXml(coordinate: str, styleId, value, dataType: str):
+    #   mirrors openpyxl.cell._writer.etree_write_cell
+    attrs = ' r="{}"'.format(coordinate)
+    if styleId is not None:
+        attrs += ' s="{}"'.format(styleId)
+    if dataType == 's':
+        attrs += ' t="inlineStr"'
+    elif dataType != 'f':
+        attrs += ' t="{}"'.format(dataType)
+
+    if value is None or value == '':
+        return '<c{} />'.format(attrs)
+    if dataType == 'f':
+        return '<c{}><f>{}</f><v /></c>'.format(attrs, escape(value[1:]))
+    if dataType == 's':
+        space = ' xml:space="preserve"' if value != value.strip() else ''
+        return '<c{}><is><t{}>{}</t></is></c>'.format(attrs, space, escape(value))
+    return '<c{}><v>{}</v></c>'.format(attrs, escape(safe_string(value)))
+
+class XmlTemplate:
+    def __init__(self, templatePath: str, templateSheetName: str):
+        self.templatePath = templatePath
+        self.templateSheetName = templateSheetName
+        self.version = getTemplateCache(templatePath).getVersion()
+        self._prepare(getTemplateCache(templatePath).getWorkbook())
+
+    def _prepare(self, workbook):
+        if workbook.sheetnames != [self.templateSheetName]:
+            raise ValueError('xml engine expects a template with the single sheet {}'.format(self.templateSheetName))
+        templateSheet = workbook[self.templateSheetName]
+
+        #   a page starts as copy_worksheet(templateSheet) would leave it
+        pageSheet = workbook.copy_worksheet(templateSheet)
+        self.styleList = list()
+        styleIdDict = dict()
+        self.cellDict = dict()
+        for (row, col), cell in pageSheet._cells.items():
+            styleId = None
+            if cell.has_style:
+                styleId = workbook._cell_styles.add(cell._style)
+                if styleId not in styleIdDict:
+                    styleIdDict[styleId] = copy(cell._style)
+                    self.styleList.append((styleId, styleIdDict[styleId]))
+            self.cellDict[(row, col)] = (
+                cell._value,
+                cell.data_type,
+                copy(cell._style),
+                renderCellXml(cell.coordinate, styleId, cell._value, cell.data_type)
+                    if cell._value is not None or styleId is not None else ''
+            )
+
+        self.rowAttrDict = dict()
+        for row, dimension in pageSheet.row_dimensions.items():
+            self.rowAttrDict[row] = ''.join(
+                ' {}="{}"'.format(k, _escapeAttr(v)) for k, v in dict(dimension).items()
+            )
+        self.mergedList = [str(mergedRange) for mergedRange in pageSheet.merged_cells.ranges]
+
+        #   write the page once with a placeholder merge and image so that the
+        #   <mergeCells> and <drawing> positions show up in the fragments
+        pageSheet.merged_cells = MultiCellRange([CellRange('A1:A1')])
+        pageSheet._images = [imageRegistry.getImage('images/denso-logo.png')]
+        pageSheet._drawing = SpreadsheetDrawing()
+        writer = WorksheetWriter(pageSheet)
+        writer.write()
+        with open(writer.out, 'r', encoding='utf-8') as f:
+            sheetXml = f.read()
+        writer.cleanup()
+
+        head, rest = sheetXml.split('<sheetData', 1)
+        rest = rest.split('</sheetData>', 1)[1] if '</sheetData>' in rest else rest.split('/>', 1)[1]
+        dimension = _dimensionPattern.search(head)
+        self.headBeforeDimension = head[:dimension.start()]
+        self.headAfterDimension = head[dimension.end():] + '<sheetData>'
+
+        merge = _mergeCellsPattern.search(rest)
+        drawing = _drawingPattern.search(rest)
+        self.tailBeforeMerge = rest[:merge.start()]
+        self.tailBeforeDrawing = rest[merge.end():drawing.start()]
+        self.drawingElement = drawing.group(0)
+        self.drawingRelId = _relIdPattern.search(self.drawingElement).group(1)
+        self.tailAfterDrawing = rest[drawing.end():]
+
+_xmlTemplateDict = dict()
+_xmlTemplateLock = threading.Lock()
+
+def getXmlTemplate(templatePath: str, templateSheetName: str):
+    key = (os.path.abspath(templatePath), templateSheetName)
+    version = getTemplateCache(templatePath).getVersion()
+    with _xmlTemplateLock:
+        xmlTemplate = _xmlTemplateDict.get(key, None)
+        if xmlTemplate is None or xmlTemplate.version != version:
+            xmlTemplate = XmlTemplate(templatePath, templateSheetName)
+            _xmlTemplateDict[key] = xmlTemplate
+    return xmlTemplate
+
+class _PageCellDict(dict):
+    #   cells of a page, a cell is copied out of the base only when touched
+    def __init__(self, sheet, baseDict: dict):
+        super().__init__()
+        self.sheet = sheet
+        self.baseDict = baseDict
+
+    def get(self, key, default=None):
+        cell = dict.get(self, key, None)
+        if cell is None:
+            base = self.baseDict.get(key, None)
+            if base is None:
+                return default
+            value, dataType, styleArray, _ = base
+            cell = Cell(self.sheet, row=key[0], column=key[1], style_array=styleArray)
+            cell._value = value
+            cell.data_type = dataType
+            dict.__setitem__(self, key, cell)
+        return cell
+
+    def __getitem__(self, key):
+        cell = self.get(key)
+        if cell is None:
+            raise KeyError(key)
+        return cell
+
+    def __contains__(self, key):
+        return dict.__contains__(self, key) or key in self.baseDict
+
+class PageSheet:
+    #   the part of the Worksheet interface PCSForm writes through, cell,
+    #   merge and border semantics are openpyxl's own
+    def __init__(self, workbook, baseDict: dict, mergedList: list):
+        self.parent = workbook
+        self.title = None
+        self._cells = _PageCellDict(self, baseDict)
+        self._images = list()
+        #   dashed lines drawn as shapes, see connector_shape
+        self._connectors = list()
+        self.merged_cells = MultiCellRange([CellRange(mergedRange) for mergedRange in mergedList])
+
+    def cell(self, row: int, column: int, value=None):
+        cell = self._cells.get((row, column))
+        if cell is None:
+            cell = Cell(self, row=row, column=column)
+            self._cells[(row, column)] = cell
+        if value is not None:
+            cell.value = value
+        return cell
+
+    def merge_cells(self, range_string: str):
+        mergedRange = MergedCellRange(self, range_string)
+        self.merged_cells.add(mergedRange)
+        cells = mergedRange.cells
+        next(cells)
+        for row, col in cells:
+            self._cells[row, col] = MergedCell(self, row, col)
+        mergedRange.format()
+
+    def add_image(self, img):
+        self._images.append(img)
+
+def _getDrawingPath(drawingId: int):
+    return '/xl/drawings/drawing{}.xml'.format(drawingId)
+
+class _WrittenSheet:
+    #   what the workbook and manifest writers read from a sheet, a full
+    #   Worksheet per page would cost ~12KB each until the save
+    _rel_type = Worksheet._rel_type
+    mime_type = Worksheet.mime_type
+    sheet_state = 'visible'
+
+    def __init__(self, title: str, sheetId: int):
+        self.title = title
+        self._id = sheetId
+
+    @property
+    def path(self):
+        return '/xl/worksheets/sheet{}.xml'.format(self._id)
+
+class _WrittenDrawing:
+    mime_type = SpreadsheetDrawing.mime_type
+
+    def __init__(self, drawingId: int):
+        self.path = _getDrawingPath(drawingId)
+
+class XmlWorkbookWriter:
+    def __init__(self, templatePath: str, templateSheetName: str, workbook, target):
+        self.template = getXmlTemplate(templatePath, templateSheetName)
+        self.workbook = workbook
+        self.archive = ZipFile(target, 'w', ZIP_DEFLATED, allowZip64=True)
+        self.baseDict = self.template.cellDict
+        self.prototypeImageList = list()
+        self.titleList = list()
+        #   drawing number (or None) of every written page, in sheet order
+        self.pageDrawingList = list()
+        self._drawingCount = 0
+        self._mediaPathDict = dict()
+
+        for styleId, styleArray in self.template.styleList:
+            if workbook._cell_styles.add(styleArray) != styleId:
+                raise RuntimeError('Template styles changed since the xml template was prepared')
+
+    def newPrototype(self):
+        return PageSheet(self.workbook, self.baseDict, self.template.mergedList)
+
+    def setPrototype(self, prototype: PageSheet, imageList: list):
+        #   cells written on the prototype (the form header) become part of
+        #   the base every page is copied from, imageList goes on every page
+        baseDict = dict(self.baseDict)
+        for key, cell in dict.items(prototype._cells):
+            baseDict[key] = (
+                cell._value,
+                cell.data_type,
+                copy(cell._style),
+                self._renderCell(cell)
+            )
+        self.baseDict = baseDict
+        self.prototypeImageList = list(imageList)
+
+    def newPage(self, title: str):
+        page = PageSheet(self.workbook, self.baseDict, self.template.mergedList)
+        page.title = title
+        page._images = list(self.prototypeImageList)
+        return page
+
+    def _getStyleId(self, cell):
+        return self.workbook._cell_styles.add(cell._style) if cell.has_style else None
+
+    def _renderCell(self, cell):
+        if cell._value is None and not cell.has_style:
+            return ''
+        return renderCellXml(cell.coordinate, self._getStyleId(cell), cell._value, cell.data_type)
+
+    def _renderSheetData(self, page: PageSheet):
+        touchedDict = dict(dict.items(page._cells))
+        keyList = sorted(set(self.baseDict) | set(touchedDict))
+
+        rowDict = dict()
+        for row, col in keyList:
+            rowDict.setdefault(row, list()).append(col)
+        for row in self.template.rowAttrDict:
+            rowDict.setdefault(row, list())
+
+        parts = list()
+        for row in sorted(rowDict):
+            parts.append('<row r="{}"{}>'.format(row, self.template.rowAttrDict.get(row, '')))
+            for col in rowDict[row]:
+                cell = touchedDict.get((row, col), None)
+                if cell is None:
+                    parts.append(self.baseDict[(row, col)][3])
+                else:
+                    parts.append(self._renderCell(cell))
+            parts.append('</row>')
+
+        if keyList:
+            rowList = [key[0] for key in keyList]
+            colList = [key[1] for key in keyList]
+            dimension = '{}{}:{}{}'.format(
+                get_column_letter(min(colList)), min(rowList),
+                get_column_letter(max(colList)), max(rowList)
+            )
+        else:
+            dimension = 'A1:A1'
+        return dimension, parts
+
+    def _getMediaPath(self, img):
+        digest = img.digest
+        mediaPath = self._mediaPathDict.get(digest, None)
+        if mediaPath is None:
+            mediaPath = '/xl/media/image{}.{}'.format(len(self._mediaPathDict) + 1, img.format)
+            self._mediaPathDict[digest] = mediaPath
+            self.archive.writestr(mediaPath[1:], img._data())
+        return mediaPath
+
+    def _renderAnchor(self, img, idx: int):
+        #   mirrors SpreadsheetDrawing._write / _picture_frame
+        anchor = img.anchor
+        pic = (
+            '<pic><nvPicPr><cNvPr id="{0}" name="Image {0}" descr="Picture" /><cNvPicPr /></nvPicPr>'
+            '<blipFill><a:blip cstate="print" r:embed="rId{0}" /><a:stretch><a:fillRect /></a:stretch></blipFill>'
+            '<spPr><a:prstGeom prst="rect" /></spPr></pic><clientData />'
+        ).format(idx)
+        ext = '<ext cx="{}" cy="{}" />'.format(anchor.ext.width, anchor.ext.height)
+        if isinstance(anchor, OneCellAnchor):
+            marker = anchor._from
+            return '<oneCellAnchor><from><col>{}</col><colOff>{}</colOff><row>{}</row><rowOff>{}</rowOff></from>{}{}</oneCellAnchor>'.format(
+                marker.col, marker.colOff, marker.row, marker.rowOff, ext, pic
+            )
+        if isinstance(anchor, AbsoluteAnchor):
+            return '<absoluteAnchor><pos x="{}" y="{}" />{}{}</absoluteAnchor>'.format(
+                anchor.pos.x, anchor.pos.y, ext, pic
+            )
+        raise TypeError('Unsupported image anchor, {}'.format(type(anchor).__name__))
+
+    def _writeDrawing(self, page: PageSheet):
+        self._drawingCount += 1
+        drawingId = self._drawingCount
+
+        oneCellList = list()
+        absoluteList = list()
+        relList = list()
+        for idx, img in enumerate(page._images, 1):
+            anchorXml = self._renderAnchor(img, idx)
+            if isinstance(img.anchor, OneCellAnchor):
+                oneCellList.append(anchorXml)
+            else:
+                absoluteList.append(anchorXml)
+            relList.append('<Relationship Type="{}" Target="{}" Id="rId{}" />'.format(
+                IMAGE_REL, self._getMediaPath(img), idx
+            ))
+
+        drawingXml = (
+            '<wsDr xmlns:a="http://schemas.openxmlformats.org/drawingml/2006/main" '
+            'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships" '
+            'xmlns="http://schemas.openxmlformats.org/drawingml/2006/spreadsheetDrawing">'
+            '{}</wsDr>'
+        ).format(''.join(oneCellList + absoluteList))
+        drawingXml = insertConnectorAnchors(drawingXml, page._connectors, len(page._images) + 1)
+        self.archive.writestr(_getDrawingPath(drawingId)[1:], drawingXml)
+        self.archive.writestr(
+            'xl/drawings/_rels/drawing{}.xml.rels'.format(drawingId),
+            '<Relationships xmlns="{}">{}</Relationships>'.format(REL_NS, ''.join(relList))
+        )
+        return drawingId
+
+    def writePage(self, page: PageSheet):
+        self.titleList.append(page.title)
+        sheetId = len(self.titleList)
+
+        dimension, rowParts = self._renderSheetData(page)
+        mergeXml = ''
+        if page.merged_cells:
+            mergeXml = '<mergeCells count="{}">{}</mergeCells>'.format(
+                len(page.merged_cells.ranges),
+                ''.join('<mergeCell ref="{}" />'.format(mergedRange.coord) for mergedRange in page.merged_cells.ranges)
+            )
+
+        drawingId = None
+        drawingXml = ''
+        if page._images or page._connectors:
+            drawingId = self._writeDrawing(page)
+            drawingXml = self.template.drawingElement
+            self.archive.writestr(
+                'xl/worksheets/_rels/sheet{}.xml.rels'.format(sheetId),
+                '<Relationships xmlns="{}"><Relationship Type="{}" Target="{}" Id="{}" /></Relationships>'.format(
+                    REL_NS, DRAWING_REL, _getDrawingPath(drawingId), self.template.drawingRelId
+                )
+            )
+
+        sheetXml = ''.join([
+            self.template.headBeforeDimension,
+            '<dimension ref="{}" />'.format(dimension),
+            self.template.headAfterDimension,
+            ''.join(rowParts),
+            '</sheetData>',
+            self.template.tailBeforeMerge,
+            mergeXml,
+            self.template.tailBeforeDrawing,
+            drawingXml,
+            self.template.tailAfterDrawing
+        ])
+        self.archive.writestr('xl/worksheets/sheet{}.xml'.format(sheetId), sheetXml)
+        self.pageDrawingList.append(drawingId)
+
+    def close(self):
+        #   workbook level parts (styles, workbook, content types, ...) are
+        #   small, they go through openpyxl on placeholder sheets
+        self.workbook.remove(self.workbook[self.template.templateSheetName])
+        for sheetId, title in enumerate(self.titleList, 1):
+            self.workbook._sheets.append(_WrittenSheet(title, sheetId))
+        _XmlPackageWriter(self.workbook, self.archive, self.pageDrawingList).save()
+
+    def abort(self):
+        self.archive.close()
+
+class _XmlPackageWriter(ExcelWriter):
+    def __init__(self, workbook, archive, pageDrawingList: list):
+        super().__init__(workbook, archive)
+        self.pageDrawingList = pageDrawingList
+
+    def _write_worksheets(self):
+        #   sheet and drawing parts are already in the archive, only the
+        #   manifest entries are left
+        for ws, drawingId in zip(self.workbook._sheets, self.pageDrawingList):
+            self.manifest.append(ws)
+            if drawingId is not None:
+                self.manifest.append(_WrittenDrawing(drawingId))